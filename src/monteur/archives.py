@@ -1,24 +1,304 @@
 
+import collections
+import inspect
+import multiprocessing
 import os
+import shutil
+import stat
+import struct
 import tarfile
+import tempfile
+import time
 import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
 
 from monteur.recipe.utils import Paths
 
+# Size of the blocks compressed in parallel in a gzip stream.
+GZIP_BLOCK_SIZE = 128 * 1024
+# Modification time of the entries of reproducible archives.
+REPRODUCIBLE_MTIME = 315532800     # 1980-01-01, the minimum for zip.
+# Size of the chunks read and compressed from files added in a zip.
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Compressed zip entries bigger than this are kept on disk until written.
+ZIP_SPOOL_SIZE = 1024 * 1024
+
+
+def get_workers(workers):
+    """Return the number of threads to use to compress, 0 meaning one
+    per processor.
+    """
+    if not workers:
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+    return workers
+
+
+def deflate(data, level, last=True):
+    """Compress data as a raw deflate stream. If this is not the last
+    block of the stream, the output is flushed on a byte boundary so
+    that blocks can be concatenated.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if last:
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipFile(object):
+    """Write a gzip stream to fileobj. Data is cut in independent
+    blocks compressed by a pool of threads, and concatenated in order
+    in one deflate stream.
+    """
+
+    def __init__(self, fileobj, workers=1, level=9, mtime=None):
+        self.fileobj = fileobj
+        self.level = level
+        self._workers = get_workers(workers)
+        self._pool = None
+        if self._workers > 1:
+            self._pool = ThreadPool(self._workers)
+        self._pending = collections.deque()
+        self._buffer = []
+        self._buffered = 0
+        self._size = 0
+        self._crc = zlib.crc32('')
+        if mtime is None:
+            mtime = time.time()
+        # No filename, compression flags for level 9 and unknown OS.
+        self.fileobj.write(
+            '\037\213\010\000' + struct.pack('<I', long(mtime)) + '\002\377')
+
+    def _compress(self, data, last=False):
+        if self._pool is None:
+            self.fileobj.write(deflate(data, self.level, last))
+            return
+        self._pending.append(
+            self._pool.apply_async(deflate, (data, self.level, last)))
+        while len(self._pending) > self._workers * 2:
+            self.fileobj.write(self._pending.popleft().get())
+
+    def write(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= GZIP_BLOCK_SIZE:
+            data = ''.join(self._buffer)
+            offset = 0
+            while len(data) - offset >= GZIP_BLOCK_SIZE:
+                self._compress(data[offset:offset + GZIP_BLOCK_SIZE])
+                offset += GZIP_BLOCK_SIZE
+            data = data[offset:]
+            self._buffer = [data]
+            self._buffered = len(data)
+
+    def tell(self):
+        return self._size
+
+    def close(self):
+        if self.fileobj is None:
+            return
+        try:
+            self._compress(''.join(self._buffer), last=True)
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().get())
+            self.fileobj.write(struct.pack(
+                    '<II', self._crc & 0xffffffffL, self._size & 0xffffffffL))
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+            self.fileobj = None
+
+
+def have_precompressed_zip():
+    """Tell if zipfile lets write entries that are already
+    compressed. There is no public API for it, so it relies on
+    internals of zipfile, as found in Python 2.7.4 and later.
+    """
+    header = getattr(zipfile.ZipInfo, 'FileHeader', None)
+    if header is None or not hasattr(zipfile.ZipFile, '_writecheck'):
+        return False
+    try:
+        return 'zip64' in inspect.getargspec(header).args
+    except TypeError:
+        return False
+
+
+ZIP_PRECOMPRESSED = have_precompressed_zip()
+
+
+def deflate_file(filename):
+    """Compress the content of filename as a raw deflate stream, by
+    chunks. Return its size, CRC and a file containing the compressed
+    data.
+    """
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    output = tempfile.SpooledTemporaryFile(ZIP_SPOOL_SIZE)
+    size = 0
+    crc = zlib.crc32('')
+    stream = open(filename, 'rb')
+    try:
+        while True:
+            data = stream.read(ZIP_CHUNK_SIZE)
+            if not data:
+                break
+            size += len(data)
+            crc = zlib.crc32(data, crc)
+            output.write(compressor.compress(data))
+        output.write(compressor.flush(zlib.Z_FINISH))
+    except:
+        output.close()
+        raise
+    finally:
+        stream.close()
+    return size, crc & 0xffffffffL, output
+
+
+def write_deflated(archive, info, compressed):
+    """Write an entry already compressed with deflate, whose data is
+    in the file compressed, in a zip archive like ZipFile.write would
+    have done.
+    """
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.compress_size = compressed.tell()
+    info.header_offset = archive.fp.tell()
+    archive._writecheck(info)
+    archive._didModify = True
+    zip64 = (info.file_size > zipfile.ZIP64_LIMIT or
+             info.compress_size > zipfile.ZIP64_LIMIT)
+    archive.fp.write(info.FileHeader(zip64))
+    compressed.seek(0)
+    shutil.copyfileobj(compressed, archive.fp, ZIP_CHUNK_SIZE)
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+
 
 class ZipArchive(object):
     """Manage an zip archive.
     """
 
-    def __init__(self, filename, mode):
+    def __init__(self, filename, mode, workers=1, reproducible=False):
         self.filename = filename
         self.format = os.path.splitext(self.filename)[-1]
-        self._zip = zipfile.ZipFile(filename, mode)
+        self.workers = get_workers(workers)
+        if not ZIP_PRECOMPRESSED:
+            # Entries can only be compressed while they are written.
+            self.workers = 1
+        self.reproducible = reproducible
+        self._entries = []
+        self._zip = zipfile.ZipFile(filename, mode, zipfile.ZIP_DEFLATED)
 
     def add(self, filename, dest_filename):
-        self._zip.write(filename, dest_filename)
+        self._entries.append((dest_filename, filename))
+
+    def _prepare(self, (dest_filename, filename)):
+        """Return the information, filename and compressed data of an
+        entry. The compressed data is None for directories, or if it
+        is compressed while written.
+        """
+        status = os.stat(filename)
+        name = os.path.normpath(dest_filename).replace(os.path.sep, '/')
+        name = name.lstrip('/')
+        is_dir = stat.S_ISDIR(status.st_mode)
+        if is_dir:
+            name += '/'
+        date_time = time.localtime(status.st_mtime)[:6]
+        mode = stat.S_IMODE(status.st_mode)
+        if self.reproducible:
+            date_time = time.gmtime(REPRODUCIBLE_MTIME)[:6]
+            if is_dir or mode & stat.S_IXUSR:
+                mode = 0755
+            else:
+                mode = 0644
+        info = zipfile.ZipInfo(name, date_time)
+        info.external_attr = (stat.S_IFMT(status.st_mode) | mode) << 16L
+        if is_dir:
+            info.external_attr |= 0x10
+            return info, filename, None
+        if not ZIP_PRECOMPRESSED:
+            return info, filename, None
+        info.file_size, info.CRC, compressed = deflate_file(filename)
+        return info, filename, compressed
+
+    def _write(self):
+        entries = self._entries
+        self._entries = []
+        if self.reproducible:
+            entries.sort()
+        if self.workers > 1 and len(entries) > 1:
+            pool = ThreadPool(self.workers)
+            pending = collections.deque()
+            try:
+                # Only a few entries are compressed ahead of the one
+                # being written.
+                for entry in entries:
+                    pending.append(pool.apply_async(self._prepare, (entry,)))
+                    while len(pending) > self.workers * 2:
+                        self._write_entry(*pending.popleft().get())
+                while pending:
+                    self._write_entry(*pending.popleft().get())
+            finally:
+                pool.close()
+                pool.join()
+                for result in pending:
+                    if result.successful():
+                        compressed = result.get()[2]
+                        if compressed is not None:
+                            compressed.close()
+        else:
+            for entry in entries:
+                self._write_entry(*self._prepare(entry))
 
-    def extract(self, destination):
+    def _write_entry(self, info, filename, compressed):
+        if info.filename[-1] == '/':
+            self._zip.writestr(info, '', zipfile.ZIP_STORED)
+        elif compressed is None:
+            stream = open(filename, 'rb')
+            try:
+                self._zip.writestr(info, stream.read(), zipfile.ZIP_DEFLATED)
+            finally:
+                stream.close()
+        else:
+            try:
+                write_deflated(self._zip, info, compressed)
+            finally:
+                compressed.close()
+
+    def names(self):
+        """Return the names of the members of the archive.
+        """
+        return self._zip.namelist()
+
+    def read(self, name):
+        """Return the content of a member of the archive.
+        """
+        return self._zip.read(name)
+
+    def list(self):
+        """Return the members of the archive, with their size and
+        CRC, without extracting them.
+        """
+        filenames = Paths(verify=False)
+        for info in self._zip.infolist():
+            filename = info.filename
+            if filename[-1] == '/' or info.external_attr & 0x10 == 0x10:
+                filenames.add(filename.rstrip('/'), directory=True)
+            else:
+                filenames.add(
+                    filename, directory=False,
+                    size=info.file_size, crc=info.CRC)
+        return filenames
+
+    def extract(self, destination, members=None):
+        """Extract the archive in destination. If members is given,
+        only extract the members with those names.
+        """
         filenames = Paths(verify=False)
         if self.format == '.egg':
             # Eggs are not in a directory for themselves...
@@ -28,6 +308,9 @@ class ZipArchive(object):
                 os.path.splitext(os.path.basename(self.filename))[0])
 
         for filename in self._zip.namelist():
+            if (members is not None and
+                os.path.normpath(filename) not in members):
+                continue
             target_filename = os.path.join(destination, filename)
             target_info = self._zip.getinfo(filename)
 
@@ -52,6 +335,8 @@ class ZipArchive(object):
         return filenames
 
     def close(self):
+        if self._entries:
+            self._write()
         self._zip.close()
 
 
@@ -60,22 +345,92 @@ class TarArchive(object):
     """
     _format = ''
 
-    def __init__(self, filename, mode):
+    def __init__(self, filename, mode, workers=1, reproducible=False):
         self.filename = filename
-        self._tar = tarfile.open(filename, mode + self._format)
+        self.reproducible = reproducible
+        self._entries = []
+        self._file = None
+        self._stream = None
+        self._tar = self._open(mode, workers)
+
+    def _open(self, mode, workers):
+        return tarfile.open(self.filename, mode + self._format)
 
     def add(self, filename, dest_filename):
-        self._tar.add(filename, dest_filename, False)
+        if self.reproducible:
+            # Entries are written sorted when the archive is closed.
+            self._entries.append((dest_filename, filename))
+        else:
+            self._add(filename, dest_filename)
+
+    def _add(self, filename, dest_filename):
+        info = self._tar.gettarinfo(filename, dest_filename)
+        if self.reproducible:
+            info.mtime = REPRODUCIBLE_MTIME
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+        if info.isreg():
+            stream = open(filename, 'rb')
+            try:
+                self._tar.addfile(info, stream)
+            finally:
+                stream.close()
+        else:
+            self._tar.addfile(info)
 
-    def extract(self, destination):
+    def names(self):
+        """Return the names of the members of the archive.
+        """
+        return self._tar.getnames()
+
+    def read(self, name):
+        """Return the content of a member of the archive.
+        """
+        member = self._tar.extractfile(name)
+        if member is None:
+            raise KeyError(name)
+        try:
+            return member.read()
+        finally:
+            member.close()
+
+    def list(self):
+        """Return the members of the archive, with their size and
+        modification time, without extracting them.
+        """
         filenames = Paths(verify=False, separator='/')
         for entry in self._tar:
+            if entry.isdir():
+                filenames.add(entry.name, directory=True)
+            else:
+                filenames.add(
+                    entry.name, directory=False,
+                    size=entry.size, mtime=entry.mtime)
+        return filenames
+
+    def extract(self, destination, members=None):
+        """Extract the archive in destination. If members is given,
+        only extract the members with those names.
+        """
+        filenames = Paths(verify=False, separator='/')
+        for entry in self._tar:
+            if (members is not None and
+                os.path.normpath(entry.name) not in members):
+                continue
             self._tar.extract(entry, destination)
             filenames.add(entry.name, directory=entry.isdir())
         return filenames
 
     def close(self):
+        for dest_filename, filename in sorted(self._entries):
+            self._add(filename, dest_filename)
+        self._entries = []
         self._tar.close()
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            finally:
+                self._file.close()
 
 
 class TarGzArchive(TarArchive):
@@ -83,6 +438,17 @@ class TarGzArchive(TarArchive):
     """
     _format = ':gz'
 
+    def _open(self, mode, workers):
+        if mode != 'w':
+            return super(TarGzArchive, self)._open(mode, workers)
+        mtime = None
+        if self.reproducible:
+            mtime = REPRODUCIBLE_MTIME
+        self._file = open(self.filename, 'wb')
+        self._stream = ParallelGzipFile(
+            self._file, workers=workers, mtime=mtime)
+        return tarfile.open(mode='w', fileobj=self._stream)
+
 
 class TarBz2Archive(TarArchive):
     """Manage a tar.bz2 archive.
@@ -0,0 +1,202 @@
+
+import cPickle
+import hashlib
+import logging
+import os
+import threading
+import urllib2
+
+from monteur.configuration.section import Section
+from monteur.configuration.option import Option
+from monteur.utils import absolute_uri, is_remote_uri, create_directory
+
+logger = logging.getLogger('monteur')
+
+CACHE_DIRECTORY = 'configurations'
+CACHE_VERSION = 1
+
+# Files read by the current thread, while a configuration is cached.
+recording = threading.local()
+
+
+def compute_file_checksum(filename):
+    """Return the MD5 checksum of filename.
+    """
+    checksum = hashlib.md5()
+    stream = open(filename, 'rb')
+    try:
+        checksum.update(stream.read())
+    finally:
+        stream.close()
+    return checksum.hexdigest()
+
+
+def record_file(uri, stream):
+    """Record that the file at uri, opened as stream, is read to
+    build the configuration being cached.
+    """
+    files = getattr(recording, 'files', None)
+    if files is None:
+        return
+    if is_remote_uri(uri):
+        headers = stream.info()
+        files.append((uri, {'etag': headers.getheader('ETag'),
+                            'modified': headers.getheader('Last-Modified')}))
+    else:
+        stat = os.stat(uri)
+        files.append((uri, {'mtime': stat.st_mtime,
+                            'size': stat.st_size,
+                            'md5': compute_file_checksum(uri)}))
+
+
+def is_file_unchanged(uri, fingerprint):
+    """Tell if the file at uri still has the given fingerprint.
+    """
+    if is_remote_uri(uri):
+        if not (fingerprint['etag'] or fingerprint['modified']):
+            return False
+        request = urllib2.Request(uri)
+        if fingerprint['etag']:
+            request.add_header('If-None-Match', fingerprint['etag'])
+        if fingerprint['modified']:
+            request.add_header('If-Modified-Since', fingerprint['modified'])
+        try:
+            urllib2.urlopen(request).close()
+        except urllib2.HTTPError, error:
+            return error.code == 304
+        except (urllib2.URLError, IOError):
+            pass
+        return False
+    try:
+        stat = os.stat(uri)
+    except OSError:
+        return False
+    if stat.st_size != fingerprint['size']:
+        return False
+    if stat.st_mtime == fingerprint['mtime']:
+        return True
+    # Touched, but maybe not modified.
+    if compute_file_checksum(uri) == fingerprint['md5']:
+        fingerprint['mtime'] = stat.st_mtime
+        return True
+    return False
+
+
+def export_configuration(configuration):
+    """Export a configuration as plain data.
+    """
+    sections = []
+    for section in configuration.values():
+        options = []
+        for option in section.values():
+            options.append((option.name, option._value, option._location,
+                            option._add_value, option._remove_value))
+        sections.append((section.name, section._location, options))
+    return configuration._location, sections
+
+
+def import_configuration(cls, data):
+    """Create a configuration of the given class out of exported data.
+    """
+    location, sections = data
+    configuration = cls(location)
+    for section_name, section_location, options in sections:
+        section = Section(
+            section_name,
+            location=section_location,
+            configuration=configuration)
+        for name, value, option_location, add_value, remove_value in options:
+            option = Option(
+                name, value, location=option_location, section=section)
+            option._add_value = add_value
+            option._remove_value = remove_value
+            section.options[name] = option
+        configuration.sections[section_name] = section
+    return configuration
+
+
+class ConfigurationCache(object):
+    """Keep parsed configurations from one run to the other. A cached
+    configuration is used as long as none of the files it has been
+    read from (following extends) changed.
+    """
+
+    def __init__(self):
+        self._directory = None
+
+    def open(self, directory):
+        """Store cached configurations in the given directory.
+        """
+        self._directory = create_directory(directory)
+
+    def _get_filename(self, uri):
+        return os.path.join(
+            self._directory, hashlib.md5(uri).hexdigest() + '.cache')
+
+    def _load(self, cls, uri):
+        filename = self._get_filename(uri)
+        if not os.path.isfile(filename):
+            return None
+        try:
+            stream = open(filename, 'rb')
+            try:
+                version, files, data = cPickle.load(stream)
+            finally:
+                stream.close()
+        except Exception:
+            logger.info(u"Ignoring unreadable configuration cache %s.",
+                        filename)
+            return None
+        if version != CACHE_VERSION:
+            return None
+        refreshed = False
+        for file_uri, fingerprint in files:
+            previous = fingerprint.copy()
+            if not is_file_unchanged(file_uri, fingerprint):
+                return None
+            refreshed = refreshed or fingerprint != previous
+        if refreshed:
+            # Files have been touched without being modified, keep
+            # their new modification times not to check them again.
+            self._save(uri, files, data)
+        logger.info(u"Using cached configuration for %s.", uri)
+        return import_configuration(cls, data)
+
+    def _save(self, uri, files, data):
+        filename = self._get_filename(uri)
+        temporary = filename + '.%d.tmp' % os.getpid()
+        try:
+            stream = open(temporary, 'wb')
+            try:
+                cPickle.dump(
+                    (CACHE_VERSION, files, data),
+                    stream, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            os.rename(temporary, filename)
+        except (IOError, OSError):
+            logger.info(u"Cannot save configuration cache %s.", filename)
+
+    def read(self, cls, uri):
+        """Read the configuration at uri as an instance of cls, from
+        the cache if possible.
+        """
+        if self._directory is None:
+            return cls.read(uri)
+        uri = absolute_uri(uri)
+        configuration = self._load(cls, uri)
+        if configuration is not None:
+            return configuration
+        previous = getattr(recording, 'files', None)
+        recording.files = files = []
+        try:
+            configuration = cls.read(uri)
+        finally:
+            recording.files = previous
+        if previous is not None:
+            previous.extend(files)
+        self._save(uri, files, export_configuration(configuration))
+        return configuration
+
+
+configurations = ConfigurationCache()
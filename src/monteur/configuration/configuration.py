@@ -2,6 +2,7 @@
 import os
 import logging
 
+from monteur.configuration.cache import record_file
 from monteur.configuration.section import SectionParser, Section
 from monteur.configuration.utilities import Utilities
 from monteur.error import ConfigurationError
@@ -35,6 +36,7 @@ class Configuration(object):
         abs_uri = absolute_uri(uri)
         input = open_uri(abs_uri)
         try:
+            record_file(abs_uri, input)
             return cls.read_lines(input.readlines, abs_uri)
         finally:
             input.close()
@@ -98,8 +100,10 @@ class Configuration(object):
 
     def __copy__(self):
         new_conf = self.__class__(self._location)
-        for section_name in self.sections.keys():
-            new_conf[section_name] = self.sections[section_name]
+        for section_name, section in self.sections.items():
+            new_conf.sections[section_name] = Section(
+                section_name, location=section._location,
+                configuration=new_conf, layers=[section])
         return new_conf
 
     def __add__(self, other):
@@ -109,12 +113,15 @@ class Configuration(object):
         # Create a copy of this configuration
         new_conf = self.__copy__()
 
-        # Add of update sections with ones comimng from other.
-        for section_name in other.sections.keys():
-            if section_name not in new_conf:
-                new_conf[section_name] = other.sections[section_name]
-            else:
-                new_conf[section_name] += other.sections[section_name]
+        # Add of update sections with ones comimng from other. Their
+        # options are only copied when they are used.
+        for section_name, section in other.sections.items():
+            layers = [section]
+            if section_name in new_conf.sections:
+                layers.insert(0, new_conf.sections[section_name])
+            new_conf.sections[section_name] = Section(
+                section_name, location=layers[0]._location,
+                configuration=new_conf, layers=layers)
         return new_conf
 
     def __getitem__(self, key, default=marker):
@@ -135,10 +142,12 @@ class Configuration(object):
         if value.configuration is not self:
             value = value.__copy__()
             value.configuration = self
+        if key in self.sections:
+            self.sections[key].invalidate()
         self.sections[key] = value
 
     def __delitem__(self, key):
-        del self.sections[key]
+        self.sections.pop(key).invalidate()
 
     def __contains__(self, key):
         return self.sections.__contains__(key)
@@ -2,6 +2,8 @@
 import os
 import shlex
 import re
+import threading
+import weakref
 
 from monteur.error import ConfigurationError
 from monteur.utils import format_line, relative_uri, create_directory
@@ -12,6 +14,30 @@ OPTION_REPLACE = re.compile(
     r'\$\{(?P<section>[^:]*):(?P<option>[^\}]+)\}')
 
 
+# Options being evaluated by the current thread, to detect cycles.
+evaluating = threading.local()
+# Protect references between options, and count invalidations to
+# detect values computed while an option they use changed.
+references_lock = threading.RLock()
+invalidations = [0]
+
+
+def compile_value(value):
+    """Split a value into a list of text and references to other
+    options (as tuples section name, option name).
+    """
+    tokens = []
+    position = 0
+    for reference in OPTION_REPLACE.finditer(value):
+        if reference.start() > position:
+            tokens.append(value[position:reference.start()])
+        tokens.append((reference.group('section'), reference.group('option')))
+        position = reference.end()
+    if position < len(value):
+        tokens.append(value[position:])
+    return tokens
+
+
 def as_list(value):
     """Return the given value as a list.
     """
@@ -27,6 +53,8 @@ class Option(object):
     def __init__(self, name, value, location=None, section=None, operator='='):
         self.name = name
         self.section = section
+        self._dependents = {}
+        self._references = []
         self.set_value(value)
         self._location = location
         self._add_value = ''
@@ -87,24 +115,76 @@ class Option(object):
         """
         if self._computed_value is not None:
             return self._computed_value
-        value = self._value
-        replace = OPTION_REPLACE.search(value)
-        while replace:
-            section_name = replace.group('section')
-            if section_name:
-                section = self.section.configuration[section_name]
-            else:
-                section = self.section
-            option_value = section[replace.group('option')].as_text()
-            value = ''.join((value[0:replace.start()],
-                             option_value,
-                             value[replace.end():]))
-            replace = OPTION_REPLACE.search(value)
+        if self._tokens is None:
+            self._tokens = compile_value(self._value)
+        stack = getattr(evaluating, 'options', None)
+        if stack is None:
+            stack = evaluating.options = set()
+        if id(self) in stack:
+            raise ConfigurationError(
+                self.location,
+                u'circular reference for option %s in section %s' % (
+                    self.name, self.section and self.section.name))
+        stack.add(id(self))
+        generation = invalidations[0]
+        try:
+            parts = []
+            references = []
+            for token in self._tokens:
+                if isinstance(token, tuple):
+                    section_name, option_name = token
+                    if section_name:
+                        section = self.section.configuration[section_name]
+                    else:
+                        section = self.section
+                    option = section[option_name]
+                    parts.append(option.as_text())
+                    references.append(option)
+                else:
+                    parts.append(token)
+        finally:
+            stack.discard(id(self))
+        value = ''.join(parts)
         for callback in self._callbacks:
             callback(value)
-        self._computed_value = value
+        references_lock.acquire()
+        try:
+            # If an option changed meanwhile, the value might already
+            # be outdated, and must be computed again next time.
+            if invalidations[0] == generation:
+                for option in references:
+                    option._dependents[id(self)] = weakref.ref(self)
+                self._references = references
+                self._computed_value = value
+        finally:
+            references_lock.release()
         return value
 
+    def invalidate(self):
+        """Forget the computed value of this option, and of all the
+        options that refer to it.
+        """
+        references_lock.acquire()
+        try:
+            invalidations[0] += 1
+            options = [self]
+            while options:
+                option = options.pop()
+                option._computed_value = None
+                if option.section is not None:
+                    option.section.changed()
+                for reference in option._references:
+                    reference._dependents.pop(id(option), None)
+                option._references = []
+                dependents = option._dependents.values()
+                option._dependents = {}
+                for dependent in dependents:
+                    dependent = dependent()
+                    if dependent is not None:
+                        options.append(dependent)
+        finally:
+            references_lock.release()
+
     def set_value(self, value):
         """Set the value of the option.
         """
@@ -119,8 +199,11 @@ class Option(object):
             value = str(value)
         if not isinstance(value, basestring):
             raise ValueError(u"Can only set strings as value.")
+        if self.section is not None:
+            self.section.changing(self.name)
         self._value = value
-        self._computed_value = None
+        self._tokens = None
+        self.invalidate()
 
     def register(self, func):
         self._callbacks.append(func)
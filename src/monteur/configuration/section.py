@@ -1,6 +1,9 @@
 
+import hashlib
 import re
 import os
+import threading
+import weakref
 
 from monteur.configuration.option import Option, OptionParser
 from monteur.error import ConfigurationError
@@ -8,17 +11,106 @@ from monteur.utils import format_line
 
 SECTION_HEADER = re.compile(r'\[(?P<header>[^]]+)\]')
 marker = object()
+materialize_lock = threading.RLock()
+
+
+def encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
 
 
 class Section(object):
-    """Section of a configuration file.
+    """Section of a configuration file. A section can be layered
+    over other sections: their options are used as if they were
+    copied in this section, but they are only copied when they are
+    accessed, or before they are changed in the layers.
     """
 
-    def __init__(self, name, location=None, configuration=None):
+    def __init__(self, name, location=None, configuration=None, layers=()):
         self.name = name
         self.configuration = configuration
         self._location = location
-        self.options = {}
+        self._fingerprint = None
+        self._options = {}
+        self._layers = []
+        self._pending = set()
+        self._modified = False
+        self._derived = []
+        for layer in layers:
+            if not (layer._options or layer._modified):
+                # Use directly the layers of a section that was never used.
+                self._layers.extend(layer._layers)
+            else:
+                self._layers.append(layer)
+            self._pending.update(layer._names())
+        for layer in self._layers:
+            layer._derived.append(weakref.ref(self))
+
+    @property
+    def options(self):
+        """Dictionary of all the options of the section.
+        """
+        if self._pending:
+            for key in list(self._pending):
+                self._materialize(key)
+        return self._options
+
+    def _names(self):
+        # Return the names of the options, without copying them.
+        return self._pending.union(self._options)
+
+    def _fold(self, key):
+        # Merge the option called key from all the layers.
+        result = None
+        for layer in self._layers:
+            option = layer._raw(key)
+            if option is None:
+                continue
+            if result is None:
+                result = option.__copy__()
+            else:
+                result = result + option
+        return result
+
+    def _raw(self, key):
+        # Return the option called key, without copying it here.
+        option = self._options.get(key)
+        if option is None and key in self._pending:
+            return self._fold(key)
+        return option
+
+    def _materialize(self, key):
+        # Copy the option called key from the layers into this section.
+        materialize_lock.acquire()
+        try:
+            if key in self._pending:
+                option = self._fold(key)
+                option.section = self
+                self._options[key] = option
+                self._pending.discard(key)
+            return self._options[key]
+        finally:
+            materialize_lock.release()
+
+    def changing(self, key):
+        """Copy the option called key in the sections layered over
+        this one, before it is changed here.
+        """
+        if not self._derived:
+            return
+        materialize_lock.acquire()
+        try:
+            derived = []
+            for reference in self._derived:
+                section = reference()
+                if section is not None:
+                    if key in section._pending:
+                        section._materialize(key)
+                    derived.append(reference)
+            self._derived = derived
+        finally:
+            materialize_lock.release()
 
     @property
     def utilities(self):
@@ -39,30 +131,22 @@ class Section(object):
         return None
 
     def __copy__(self):
-        new_section = self.__class__(self.name, location=self._location)
-        for option_name in self.options.keys():
-            new_section[option_name] = self.options[option_name]
-        return new_section
+        return self.__class__(self.name, location=self._location, layers=[self])
 
     def __add__(self, other):
         if not isinstance(other, Section):
             raise TypeError(u'Can only add two sections together.')
 
-        # Create a copy of this section
-        new_section = self.__copy__()
-
-        # Update with other options if empty
-        for option_name in other.options.keys():
-            if option_name not in new_section:
-                new_section[option_name] = other.options[option_name]
-            else:
-                new_section[option_name] += other.options[option_name]
-        return new_section
+        # Options of this section are updated with the other ones.
+        return self.__class__(
+            self.name, location=self._location, layers=[self, other])
 
     def __getitem__(self, key, default=marker):
         try:
-            return self.options[key]
+            return self._options[key]
         except KeyError:
+            if key in self._pending:
+                return self._materialize(key)
             if default is not marker:
                 if isinstance(default, str):
                     return Option('default', default, section=self)
@@ -74,38 +158,73 @@ class Section(object):
     get = __getitem__
 
     def get_with_default(self, key, default_section, default=marker):
-        if key in self.options:
-            return self.options[key]
+        if key in self:
+            return self[key]
         return self.configuration[default_section].get(key, default=default)
 
     def __setitem__(self, key, value):
+        self._modified = True
+        self.changing(key)
         if isinstance(value, Option):
             if value.section is not self:
                 value = value.__copy__()
                 value.section = self
-            self.options[key] = value
-        elif key in self.options:
-            self.options[key].set_value(value)
+            if key in self._options:
+                self._options[key].invalidate()
+            self._pending.discard(key)
+            self._options[key] = value
+        elif key in self:
+            self[key].set_value(value)
         else:
-            self.options[key] = Option(key, value, section=self)
+            self._options[key] = Option(key, value, section=self)
+        self.changed()
 
     def __delitem__(self, key):
-        del self.options[key]
+        self._modified = True
+        self.changing(key)
+        if key in self._pending:
+            self._pending.discard(key)
+            self._options.pop(key, None)
+        else:
+            self._options.pop(key).invalidate()
+        self.changed()
+
+    def changed(self):
+        """Forget the fingerprint of the section after a change.
+        """
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """Return a digest of the content of the section. Two
+        sections with equal options have the same fingerprint.
+        """
+        fingerprint = self._fingerprint
+        if fingerprint is None:
+            options = self.options
+            digest = hashlib.md5()
+            for name in sorted(options.keys()):
+                digest.update(encode(name) + '\0')
+                for value in sorted(set(options[name].as_list())):
+                    digest.update(encode(value) + '\0')
+                digest.update('\1')
+            fingerprint = self._fingerprint = digest.hexdigest()
+        return fingerprint
+
+    def invalidate(self):
+        """Forget the computed values of all options, and of the
+        options that refer to them.
+        """
+        # Options that have not been copied yet have not been used.
+        for option in self._options.values():
+            option.invalidate()
 
     def __contains__(self, key):
-        return self.options.__contains__(key)
+        return key in self._options or key in self._pending
 
     def __eq__(self, other):
         if not isinstance(other, Section):
             return NotImplemented
-        local_options = set(self.options.keys())
-        other_options = set(other.options.keys())
-        if local_options != other_options:
-            return False
-        for name in local_options:
-            if self.options[name] != other.options[name]:
-                return False
-        return True
+        return self.fingerprint() == other.fingerprint()
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -121,7 +240,7 @@ class Section(object):
     def keys(self):
         """All options keys.
         """
-        return self.options.keys()
+        return list(self._names())
 
     def values(self):
         """Return all options.
@@ -130,16 +249,15 @@ class Section(object):
 
     def _write(self, stream):
         stream.write('[' + self.name + ']\n')
-        option_names = self.options.keys()
-        option_names.sort()
-        for name in option_names:
-            self.options[name]._write(stream)
+        options = self.options
+        for name in sorted(options.keys()):
+            options[name]._write(stream)
 
     def as_dict(self):
         """Return the content of the section as a dictionnary.
         """
-        return dict([(key, self.options[key].as_text())
-                     for key in self.options.keys()])
+        return dict([(key, option.as_text())
+                     for key, option in self.options.items()])
 
 
 class SectionParser(object):
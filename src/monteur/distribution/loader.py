@@ -4,18 +4,16 @@ import os
 import shutil
 
 from monteur.configuration import Configuration
-from monteur.distribution.manifest import parse_manifest
+from monteur.distribution.manifest import compile_manifest
 from monteur.egginfo.write import write_egg_info
 from monteur.error import PackageError
 from monteur.python import PythonInterpreter
-from monteur.recipe.utils import Paths
-from monteur.setuptools.autotools import AutomakeBuilder
+from monteur.setuptools.autotools import builder
+from monteur.utils import stat_cache
 from monteur.version import Version, Requirements
 
 logger = logging.getLogger('monteur')
 
-builder = AutomakeBuilder()
-
 
 def install_file(source_file, destination_file):
     destination_directory = os.path.dirname(destination_file)
@@ -76,14 +74,14 @@ class SetupLoader(object):
     def install(self, path):
         egg_info = self.configuration['egginfo']
         manifest_url = egg_info['manifest'].as_file()
-        files = Paths(verify=False)
-        files.listdir(self.distribution.package_path)
+        manifest = compile_manifest(manifest_url)
         prefixes = []
         if 'source' in egg_info:
             prefixes = [egg_info['source'].as_text()]
-        for filename, info in files.as_manifest(*parse_manifest(manifest_url),
-                                                 prefixes=prefixes):
-            install_file(info['full'], os.path.join(path, filename))
+        for filename, info in manifest.walk(
+            self.distribution.package_path, prefixes=prefixes):
+            if not info['directory']:
+                install_file(info['full'], os.path.join(path, filename))
 
         # XXX This needs review
         # if self.distribution.extensions:
@@ -91,6 +89,7 @@ class SetupLoader(object):
         #         self.distribution, install_path, self.interpretor)
 
         write_egg_info(self.distribution, package_path=path)
+        stat_cache.invalidate(path)
 
 
 class SetupLoaderFactory(object):
@@ -1,8 +1,10 @@
 
+import fnmatch
 import os
+import re
 
 from monteur.error import ConfigurationError
-from monteur.utils import open_uri
+from monteur.utils import open_uri, stat_cache
 
 
 def parse_manifest(manifest_name):
@@ -53,3 +55,132 @@ def parse_manifest(manifest_name):
     manifest.close()
     return (regular_rules, recursive_rules,)
 
+
+
+def translate(rule):
+    """Translate a shell pattern into a regular expression, without
+    the flags fnmatch adds to it.
+    """
+    pattern = fnmatch.translate(rule)
+    if pattern.endswith('(?ms)'):
+        pattern = pattern[:-5]
+    return pattern
+
+
+class Manifest(object):
+    """Match paths against manifest rules. The rules applying to a
+    directory are compiled in one regular expression, and directories
+    that no rule can reach are not walked.
+    """
+
+    def __init__(self, local_rules, recursive_rules):
+        self.local_rules = local_rules
+        self.recursive_rules = recursive_rules
+        self._matchers = {}
+
+    def get_matcher(self, rules):
+        """Return a function to match a filename against rules.
+        """
+        rules = tuple(rule for rule in rules if rule)
+        matcher = self._matchers.get(rules)
+        if matcher is None:
+            if rules:
+                matcher = re.compile('(?ms)(?:%s)' % '|'.join(
+                        '(?:%s)' % translate(rule) for rule in rules)).match
+            else:
+                matcher = lambda filename: None
+            self._matchers[rules] = matcher
+        return matcher
+
+    def reaches(self, search_prefix, recurse_rules):
+        """Tell if some rules apply in search_prefix or below.
+        """
+        if recurse_rules:
+            return True
+        for rules in (self.local_rules, self.recursive_rules):
+            for rule_prefix in rules:
+                if rule_prefix.startswith(search_prefix):
+                    return True
+        return False
+
+    def select(self, search_prefix, path, original, entries, recurse_rules):
+        """Iterate over the (path, original, value) selected by the
+        rules in a directory. entries is a sorted list of (name,
+        value, children): value is None if the entry cannot be
+        selected, children is None if the entry is not a directory, or
+        a function returning its entries.
+        """
+        if search_prefix in self.recursive_rules:
+            recurse_rules = recurse_rules + self.recursive_rules[search_prefix]
+        match = self.get_matcher(
+            self.local_rules.get(search_prefix, []) + recurse_rules)
+        for name, value, children in entries:
+            if path:
+                local_path = path + '/' + name
+            else:
+                local_path = name
+            local_original = original + [name]
+            if value is not None and match(name) is not None:
+                yield local_path, local_original, value
+            if children is not None:
+                if not name:
+                    local_search = search_prefix
+                elif search_prefix == './':
+                    local_search = name + '/'
+                else:
+                    local_search = search_prefix + name + '/'
+                if self.reaches(local_search, recurse_rules):
+                    for result in self.select(
+                        local_search, local_path, local_original,
+                        children(), recurse_rules):
+                        yield result
+
+    def walk(self, directory, prefixes=[]):
+        """Walk the filesystem in directory, and iterate over the
+        files selected by the rules.
+        """
+
+        def listdir(path, parents=()):
+            # parents are the real paths of the directories walked to
+            # reach path, to detect loops made with links.
+            parents += (os.path.realpath(path),)
+            entries = []
+            for name in sorted(os.listdir(path)):
+                item_path = os.path.join(path, name)
+                children = None
+                is_directory = stat_cache.isdir(item_path)
+                if is_directory:
+                    if (os.path.islink(item_path) and
+                        os.path.realpath(item_path) in parents):
+                        continue
+                    children = lambda item_path=item_path: listdir(
+                        item_path, parents)
+                entries.append((name, is_directory, children))
+            return entries
+
+        def result(path, original, is_directory):
+            original = os.path.normpath(os.path.sep.join(original))
+            return path, {'directory': is_directory,
+                          'original': original,
+                          'full': os.path.join(directory, original)}
+
+        if prefixes:
+            for prefix in prefixes:
+                prefix_path = os.path.join(directory, prefix)
+                if not stat_cache.isdir(prefix_path):
+                    continue
+                for selected in self.select(
+                    prefix + '/', '', prefix.split(os.path.sep),
+                    listdir(prefix_path), []):
+                    yield result(*selected)
+        else:
+            for selected in self.select(
+                './', '', [], listdir(directory), []):
+                yield result(*selected)
+
+
+def compile_manifest(manifest_name):
+    """Read the given manifest file and return a Manifest matching
+    its rules.
+    """
+    return Manifest(*parse_manifest(manifest_name))
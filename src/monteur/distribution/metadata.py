@@ -0,0 +1,215 @@
+
+import cPickle
+import logging
+import os
+import threading
+
+from monteur.download import compute_checksum
+from monteur.version import Version, Requirements
+
+logger = logging.getLogger('monteur')
+
+METADATA_FILE = 'metadata.cache'
+METADATA_VERSION = 2
+# Files built in place by build_ext.
+BUILD_EXTENSIONS = ('.so', '.pyd', '.dylib')
+
+
+class MetadataCache(object):
+    """Keep loaded package metadata from one run to the other, in
+    order not to read egg-info files or run setuptools again when
+    nothing changed. Entries are indexed by archive checksum, by
+    egg-info location and modification time, or by checkout revision.
+    In place builds of checkouts are remembered as well.
+    """
+    FIELDS = ('name', 'summary', 'author', 'author_email', 'license',
+              'classifiers', 'entry_points', 'extensions')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._filename = None
+        self._changed = False
+        self._packages = {}
+        self._checksums = {}
+        self._builds = {}
+
+    def open(self, filename):
+        """Load the cache stored in the given file, and save it there
+        later on.
+        """
+        self._lock.acquire()
+        try:
+            self._filename = filename
+            self._changed = False
+            self._packages = {}
+            self._checksums = {}
+            self._builds = {}
+            if os.path.isfile(filename):
+                try:
+                    stream = open(filename, 'rb')
+                    try:
+                        data = cPickle.load(stream)
+                    finally:
+                        stream.close()
+                except Exception:
+                    logger.info(
+                        u"Ignoring unreadable metadata cache %s.", filename)
+                else:
+                    if data[0] == METADATA_VERSION:
+                        version, packages, checksums, builds = data
+                        self._packages = packages
+                        self._checksums = checksums
+                        self._builds = builds
+        finally:
+            self._lock.release()
+
+    def save(self, *ignore):
+        """Save the cache if it changed.
+        """
+        self._lock.acquire()
+        try:
+            if self._filename is None or not self._changed:
+                return
+            logger.info(u"Saving metadata cache in %s.", self._filename)
+            temporary = self._filename + '.tmp'
+            stream = open(temporary, 'wb')
+            try:
+                cPickle.dump(
+                    (METADATA_VERSION, self._packages, self._checksums,
+                     self._builds),
+                    stream, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            os.rename(temporary, self._filename)
+            self._changed = False
+        finally:
+            self._lock.release()
+
+    def archive_key(self, filename):
+        """Return a key for the archive located at filename, based on
+        its checksum.
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        signature = (stat.st_mtime, stat.st_size)
+        self._lock.acquire()
+        try:
+            cached = self._checksums.get(filename)
+            if cached is not None and cached[0] == signature:
+                return 'md5:' + cached[1]
+        finally:
+            self._lock.release()
+        checksum = compute_checksum(filename)
+        self._lock.acquire()
+        try:
+            self._checksums[filename] = (signature, checksum)
+            self._changed = True
+        finally:
+            self._lock.release()
+        return 'md5:' + checksum
+
+    def egg_key(self, egg_info):
+        """Return a key for the egg-info directory egg_info, based on
+        its location and modification time.
+        """
+        try:
+            stat = os.stat(os.path.join(egg_info, 'PKG-INFO'))
+        except OSError:
+            return None
+        return 'egg:%s:%s:%d' % (
+            os.path.abspath(egg_info), stat.st_mtime, stat.st_size)
+
+    def __contains__(self, key):
+        return key is not None and key in self._packages
+
+    def restore(self, key, distribution):
+        """Restore distribution metadata stored under key. Return
+        True upon success.
+        """
+        if key is None:
+            return False
+        self._lock.acquire()
+        try:
+            entry = self._packages.get(key)
+        finally:
+            self._lock.release()
+        if entry is None:
+            return False
+        for field in self.FIELDS:
+            setattr(distribution, field, entry[field])
+        distribution.version = Version.parse(entry['version'])
+        distribution.requirements = Requirements.parse(entry['requirements'])
+        distribution.extras = dict(
+            (extra, Requirements.parse(requirements))
+            for extra, requirements in entry['extras'].items())
+        if entry['source'] is not None and distribution.package_path:
+            distribution.path = os.path.normpath(os.path.join(
+                    distribution.package_path, entry['source']))
+        return True
+
+    def store(self, key, distribution):
+        """Store the metadata of distribution under key.
+        """
+        if key is None:
+            return
+        entry = dict((field, getattr(distribution, field))
+                     for field in self.FIELDS)
+        entry['version'] = str(distribution.version)
+        entry['requirements'] = map(str, distribution.requirements)
+        entry['extras'] = dict(
+            (extra, map(str, requirements))
+            for extra, requirements in distribution.extras.items())
+        entry['source'] = None
+        if distribution.path and distribution.package_path:
+            entry['source'] = os.path.relpath(
+                distribution.path, distribution.package_path)
+        self._lock.acquire()
+        try:
+            self._packages[key] = entry
+            self._changed = True
+        finally:
+            self._lock.release()
+
+    def restore_build(self, key, path):
+        """Return True if the package in path have already been
+        built in place under key, and the built files are still
+        there.
+        """
+        if key is None:
+            return False
+        self._lock.acquire()
+        try:
+            built = self._builds.get(key)
+        finally:
+            self._lock.release()
+        if built is None:
+            return False
+        for filename in built:
+            if not os.path.isfile(os.path.join(path, filename)):
+                return False
+        return True
+
+    def store_build(self, key, path):
+        """Store that the package in path have been built in place
+        under key, remembering all the built files found in it.
+        """
+        if key is None:
+            return
+        built = []
+        for directory, directories, filenames in os.walk(path):
+            for filename in filenames:
+                if not filename.endswith(BUILD_EXTENSIONS):
+                    continue
+                built.append(os.path.relpath(
+                        os.path.join(directory, filename), path))
+        self._lock.acquire()
+        try:
+            self._builds[key] = built
+            self._changed = True
+        finally:
+            self._lock.release()
+
+
+metadata = MetadataCache()
@@ -17,7 +17,8 @@ class Release(object):
 
     def __init__(self, name=None, version=None, path=None,
                  pyversion=None, platform=None, url=None,
-                 format=None, package_path=None):
+                 format=None, package_path=None, archive=None,
+                 metadata_key=None):
         self.name = name
         self.version = Version.parse(version)
         self.summary = ''
@@ -27,6 +28,9 @@ class Release(object):
         self.classifiers = []
         self.format = format
         self.url = url
+        self.archive = archive
+        # Key of the metadata cache entry, if known in advance.
+        self.metadata_key = metadata_key
         self.pyversion = pyversion
         self.platform = platform
         self.path = path
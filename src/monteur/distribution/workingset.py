@@ -10,6 +10,7 @@ from monteur.error import InstallationError
 from monteur.error import PackageError, PackageNotFound
 from monteur.egginfo.loader import EggLoader
 from monteur.python import PythonInterpreter
+from monteur.utils import stat_cache
 from monteur.version import Requirement, IncompatibleRequirement
 
 logger = logging.getLogger('monteur')
@@ -209,6 +210,7 @@ class WorkingSet(ReleaseSet):
                 'script': script_body})
         script_fd.close()
         os.chmod(script_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP)
+        stat_cache.invalidate(script_path)
         return script_path
 
 
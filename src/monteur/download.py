@@ -30,6 +30,21 @@ def get_checksum(url_parts):
     return None
 
 
+def compute_checksum(path):
+    """Compute the MD5 checksum of the file pointed by path.
+    """
+    input = open(path, 'rb')
+    try:
+        hasher = md5_sum()
+        buffer = input.read(CHUNK_SIZE)
+        while buffer:
+            hasher.update(buffer)
+            buffer = input.read(CHUNK_SIZE)
+    finally:
+        input.close()
+    return hasher.hexdigest()
+
+
 def verify_checksum(path, checksum):
     """Verify that the file pointed by path is a file and verify the
     given MD5 checksum.
@@ -39,13 +54,7 @@ def verify_checksum(path, checksum):
     if not checksum:
         # We don't have a checksum in fact
         return True
-    input = open(path, 'r')
-    hasher = md5_sum()
-    buffer = input.read(CHUNK_SIZE)
-    while buffer:
-        hasher.update(buffer)
-        buffer = input.read(CHUNK_SIZE)
-    computed_checksum = hasher.hexdigest()
+    computed_checksum = compute_checksum(path)
     is_valid = computed_checksum == checksum
     if not is_valid:
         logger.info("Checksum %s mismatch expected %s." % (
@@ -2,6 +2,7 @@
 import os
 import shutil
 
+from monteur.distribution.metadata import metadata
 from monteur.egginfo.read import read_pkg_requires, read_pkg_info
 from monteur.egginfo.read import read_pkg_entry_points, read_native_libs
 from monteur.version import Version
@@ -10,16 +11,19 @@ from monteur.version import Version
 class EggLoader(object):
 
     def __init__(self, path, egg_info, distribution,
-                 source_path=None, execute=None):
+                 source_path=None, execute=None, key=None):
         self.path = path
         self.source_path = source_path or path
         self.egg_info = egg_info
         self.distribution = distribution
         self.execute = execute
+        self.key = key
 
     def load(self):
-        pkg_info = read_pkg_info(self.egg_info)
         self.distribution.package_path = self.path
+        if metadata.restore(self.key, self.distribution):
+            return self.distribution
+        pkg_info = read_pkg_info(self.egg_info)
         self.distribution.name = pkg_info['name']
         self.distribution.version = Version.parse(pkg_info['version'])
         self.distribution.summary = pkg_info.get('summary', '')
@@ -32,6 +36,7 @@ class EggLoader(object):
         self.distribution.requirements, self.distribution.extras = \
             read_pkg_requires(self.egg_info)
         self.distribution.extensions = read_native_libs(self.egg_info)
+        metadata.store(self.key, self.distribution)
         return self.distribution
 
     def build(self, path):
@@ -52,5 +57,6 @@ class EggLoaderFactory(object):
     def __call__(self, distribution, path, interpreter, trust=-99):
         egg_info = os.path.join(path, 'EGG-INFO')
         if os.path.isdir(egg_info):
-            return EggLoader(path, egg_info, distribution)
+            return EggLoader(
+                path, egg_info, distribution, key=metadata.egg_key(egg_info))
         return None
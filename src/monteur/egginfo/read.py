@@ -9,6 +9,19 @@ def read_pkg_info(path):
     """Read the PKG-INFO file located at the given path and return the
     information as a dictionnary.
     """
+    try:
+        pkg_info = open(os.path.join(path, 'PKG-INFO'), 'r')
+    except IOError:
+        raise PackageError('Invalid EGG-INFO directory at %s' % path)
+    try:
+        return parse_pkg_info(pkg_info.readlines(), path)
+    finally:
+        pkg_info.close()
+
+
+def parse_pkg_info(lines, path):
+    """Parse the lines of a PKG-INFO file coming from path.
+    """
     metadata = {}
 
     def add_metadata(key, value):
@@ -26,11 +39,7 @@ def read_pkg_info(path):
 
     key = None
     value = None
-    try:
-        pkg_info = open(os.path.join(path, 'PKG-INFO'), 'r')
-    except IOError:
-        raise PackageError('Invalid EGG-INFO directory at %s' % path)
-    for line in pkg_info.readlines():
+    for line in lines:
         if line and line[0] in '#;':
             continue
         if line[0].isupper() and ':' in line:
@@ -55,11 +64,20 @@ def read_pkg_requires(path):
         data = open(os.path.join(path, 'requires.txt'), 'r')
     except IOError:
         return Requirements(), {}
+    try:
+        return parse_pkg_requires(data.readlines())
+    finally:
+        data.close()
+
+
+def parse_pkg_requires(data):
+    """Parse the lines of a requires.txt file.
+    """
     lines = []
     requires = []
     extras = {}
     current = None
-    for line in data.readlines():
+    for line in data:
         line = line.strip()
         if not line or line[0] in '#;':
             continue
@@ -88,10 +106,19 @@ def read_pkg_entry_points(path):
         data = open(os.path.join(path, 'entry_points.txt'), 'r')
     except IOError:
         return {}
+    try:
+        return parse_pkg_entry_points(data.readlines(), path)
+    finally:
+        data.close()
+
+
+def parse_pkg_entry_points(data, path):
+    """Parse the lines of an entry_points.txt file coming from path.
+    """
     entry_points = {}
     points = {}
     section_name = None
-    for line_number, line in enumerate(data.readlines()):
+    for line_number, line in enumerate(data):
         line = line.strip()
         if not line or line[0] in '#;':
             continue
@@ -136,3 +163,44 @@ def read_native_libs(path):
             extensions.append(line)
     native_libs.close()
     return extensions
+
+
+def read_archive_egg_info(archive, name):
+    """Read the metadata of the package called name from the egg-info
+    directory shipped inside a source archive, without extracting
+    it. Return None if there is no such directory in the archive.
+    """
+    wanted_directory = (name.replace('-', '_') + '.egg-info').lower()
+    egg_info = None
+    members = set()
+    for member in archive.names():
+        parts = member.rstrip('/').split('/')
+        members.add('/'.join(parts))
+        if (len(parts) > 1 and parts[-1] == 'PKG-INFO' and
+            parts[-2].lower() == wanted_directory):
+            # Use the directory the closest to the top of the archive.
+            candidate = '/'.join(parts[:-1])
+            if egg_info is None or len(candidate) < len(egg_info):
+                egg_info = candidate
+    if egg_info is None:
+        return None
+
+    def read_lines(filename):
+        member = '/'.join((egg_info, filename))
+        if member not in members:
+            return None
+        return archive.read(member).splitlines(True)
+
+    origin = ':'.join((archive.filename, egg_info))
+    metadata = {'pkg_info': parse_pkg_info(read_lines('PKG-INFO'), origin),
+                'requirements': Requirements(),
+                'extras': {},
+                'entry_points': {}}
+    requires = read_lines('requires.txt')
+    if requires is not None:
+        metadata['requirements'], metadata['extras'] = \
+            parse_pkg_requires(requires)
+    entry_points = read_lines('entry_points.txt')
+    if entry_points is not None:
+        metadata['entry_points'] = parse_pkg_entry_points(entry_points, origin)
+    return metadata
@@ -178,7 +178,8 @@ class PackageInstaller(object):
         if self._to_install:
             self.query = self.sources(
                 self.interpretor,
-                os.path.abspath(directory))
+                os.path.abspath(directory),
+                strategy=strategy)
             workers = []
             for count in range(self._worker_count):
                 worker = PackageInstallerWorker(self, count, strategy)
@@ -5,21 +5,146 @@ import atexit
 import os
 import logging
 import shutil
+import subprocess
 import threading
+import cPickle
 import distutils
 
 from monteur.archives import ZipArchive
-from monteur.utils import get_cmd_output, have_cmd
-from monteur.setuptools import setuptoolize, install_setuptools
+from monteur.utils import get_cmd_output, have_cmd, stat_cache
+from monteur.setuptools import setuptoolize, install_setuptools, worker
 from monteur.error import InstallationError
 
 logger = logging.getLogger('monteur')
 
 
+class SetuptoolsWorker(object):
+    """A Python process that already loaded setuptools, and fork
+    itself to run setuptools commands.
+    """
+
+    def __init__(self, interpreter, setuptools_path):
+        module_file = worker.__file__
+        if module_file.endswith('.pyc'):
+            module_file = module_file[:-1]
+        cmd = [str(interpreter)]
+        environ = None
+        if setuptools_path is not None:
+            cmd.append('-S')
+            environ = os.environ.copy()
+            environ['PYTHONPATH'] = setuptools_path
+        cmd.append(module_file)
+        logger.debug('Starting setuptools worker: %s', ' '.join(cmd))
+        self._process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=environ)
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def execute(self, arguments, path, environ):
+        """Run a setuptools command in the given path. Return None if
+        the command could not be sent to the worker. Once the command
+        is sent, it might have started, so an error is raised if the
+        worker dies before answering.
+        """
+        try:
+            cPickle.dump(
+                (arguments, os.path.abspath(path or os.getcwd()), environ),
+                self._process.stdin, 2)
+            self._process.stdin.flush()
+        except IOError:
+            self.close()
+            return None
+        try:
+            return cPickle.load(self._process.stdout)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.close()
+            raise InstallationError(
+                u"Setuptools worker died while running command:",
+                ' '.join(arguments))
+
+    def close(self):
+        if self._process.poll() is None:
+            try:
+                cPickle.dump(None, self._process.stdin, 2)
+                self._process.stdin.close()
+            except IOError:
+                pass
+            self._process.wait()
+
+
+class SetuptoolsWorkers(object):
+    """Pool of setuptools workers for an interpreter and a version of
+    setuptools.
+    """
+
+    def __init__(self, interpreter, setuptools_path):
+        self._interpreter = interpreter
+        self._setuptools_path = setuptools_path
+        self._lock = threading.Lock()
+        self._idle = []
+        self._all = []
+        atexit.register(self.close)
+
+    def execute(self, *arguments, **options):
+        """Run a setuptools command with a worker. Return None if it
+        was not possible, without having started the command.
+        """
+        if options.get('no_stdout') or options.get('input') is not None:
+            # Workers always capture the output and have no input.
+            return None
+        self._lock.acquire()
+        try:
+            process = None
+            while self._idle:
+                process = self._idle.pop()
+                if process.is_alive():
+                    break
+                self._all.remove(process)
+                process = None
+            if process is None:
+                process = SetuptoolsWorker(
+                    self._interpreter, self._setuptools_path)
+                self._all.append(process)
+        finally:
+            self._lock.release()
+        logger.debug(
+            'Running setuptools command: %s [in %s]',
+            ' '.join(arguments), options.get('path'))
+        result = None
+        try:
+            result = process.execute(
+                arguments, options.get('path'), options.get('environ') or {})
+        finally:
+            # The command might have changed anything on the filesystem.
+            stat_cache.clear()
+            self._lock.acquire()
+            try:
+                if result is not None:
+                    self._idle.append(process)
+                else:
+                    self._all.remove(process)
+            finally:
+                self._lock.release()
+        return result
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            for process in self._all:
+                process.close()
+            self._all = []
+            self._idle = []
+        finally:
+            self._lock.release()
+
+
 class PythonInterpreter(object):
     """Wrap and gives information about a python interpreter.
     """
     INTERPRETERS = {}
+    # Run setuptools commands in long-lived forking workers.
+    WORKERS = hasattr(os, 'fork')
 
     def __init__(self, path, readonly=False):
         assert path is not None
@@ -45,6 +170,7 @@ class PythonInterpreter(object):
             self._platform = None
             self._python_path = None
         self._setuptools = {}
+        self._workers = {}
         self._lock = threading.RLock()
 
     @classmethod
@@ -97,9 +223,18 @@ class PythonInterpreter(object):
                 if version not in self._setuptools:
                     self._setuptools[version] = find_setuptools(
                         self, version=version)
+                    if self.WORKERS:
+                        self._workers[version] = SetuptoolsWorkers(
+                            self, self._setuptools[version])
             finally:
                 self._lock.release()
 
+        if version in self._workers:
+            result = self._workers[version].execute(*cmd, **options)
+            if result is not None:
+                return result
+            logger.debug(
+                u"Setuptools worker not usable, running command directly.")
         if self._setuptools[version] is not None:
             options.setdefault('environ', {})
             options['environ']['PYTHONPATH'] = self._setuptools[version]
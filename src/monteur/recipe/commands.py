@@ -2,14 +2,17 @@
 import logging
 import os
 import fnmatch
+import operator
+import threading
 
 from monteur.configuration import Section
 from monteur.distribution.workingset import ReleaseSet, WorkingSet
 from monteur.error import ConfigurationError, InstallationError, PackageNotFound
 from monteur.installer import PackageInstaller
-from monteur.recipe.utils import Paths
+from monteur.recipe.utils import Paths, DependencyTask
+from monteur.recipe.utils import topological_sort, connected_components
 from monteur.sources import STRATEGY_UPDATE, STRATEGY_QUICK
-from monteur.utils import create_directory
+from monteur.utils import create_directory, stat_cache
 from monteur.version import Requirements
 
 logger = logging.getLogger('monteur')
@@ -24,6 +27,7 @@ class PartStatus(object):
     def __init__(self, section, installer, strategy=STRATEGY_UPDATE):
         setup = section.configuration['setup']
         self._name = section.name
+        self._section = section
         self._installed_name = 'installed:' + self._name
         self._prefix = setup['prefix_directory'].as_text()
         self.requirements = []
@@ -33,6 +37,14 @@ class PartStatus(object):
         self.installed_paths = Paths()
         self.depends = set(section.get('depends', '').as_list())
         self.depends_paths = Paths()
+        # Digests of the archives installed by the part, and for each
+        # of them the paths it installed.
+        self.archives = {}
+        self.installed_archives = {}
+        self.archive_paths = {}
+        self.installed_archive_paths = {}
+        # Directories whose content is entirely managed by the part.
+        self.managed_directories = []
         self.parts = installer.parts_status
         self.strategy = strategy
 
@@ -43,6 +55,13 @@ class PartStatus(object):
                 self._installed_name, None)
             if self._installed_section is not None:
                 get = self._installed_section.get
+                for line in get('archives', '').as_list():
+                    digest, filename = line.split(' ', 1)
+                    self.installed_archives[filename] = digest
+                for line in get('archive_paths', '').as_list():
+                    digest, path = line.split(' ', 1)
+                    self.installed_archive_paths.setdefault(
+                        digest, []).append(path)
                 # The part is installed if an installed path is missing
                 # Or depending paths are missing, or install prefix changed
                 # Or the configuration changed.
@@ -50,7 +69,7 @@ class PartStatus(object):
                     not (self.installed_paths.extend(
                             get('paths', '').as_list()) and
                          Paths().extend(get('depends', '').as_list()) and
-                         installed_cfg.get(self._name, None) == section) or
+                         self._is_unchanged(installed_cfg)) or
                     installer.prefix_changed)
             else:
                 self._enabled = True
@@ -66,6 +85,13 @@ class PartStatus(object):
                     self._installed_section.get('paths', '').as_list())
             self._enabled = True
 
+    def _is_unchanged(self, installed_cfg):
+        # Compare the part section with the one used at installation.
+        fingerprint = self._installed_section.get('fingerprint', None)
+        if fingerprint is not None:
+            return fingerprint.as_text() == self._section.fingerprint()
+        return installed_cfg.get(self._name, None) == self._section
+
     def add_override_rule(self, rule, pattern):
         """Add a rule to allow or reject overriding given paths.
         """
@@ -81,16 +107,16 @@ class PartStatus(object):
     def test_override_rule(self, pathname, directory=False):
         """Test if it is possible to override the given path.
         """
-        if not os.path.exists(pathname):
+        if not stat_cache.exists(pathname):
             return False
         if directory:
-            if not os.path.isdir(pathname):
+            if not stat_cache.isdir(pathname):
                 raise InstallationError(
                     u"Target directory already exists, but is a file",
                     pathname)
             message = u"Directory already exists"
         else:
-            if os.path.isdir(pathname):
+            if stat_cache.isdir(pathname):
                 raise InstallationError(
                     u"Target file already exists, but is a directory",
                     pathname)
@@ -105,6 +131,38 @@ class PartStatus(object):
                     raise NotImplementedError()
         raise InstallationError(message, pathname)
 
+    def add_managed_directory(self, directory):
+        """Register a directory whose content is installed by the
+        part: previously installed paths in it that are no longer
+        installed will be removed.
+        """
+        directory = os.path.join(directory, '')
+        if directory not in self.managed_directories:
+            self.managed_directories.append(directory)
+
+    def remove_stale_paths(self):
+        """Remove the paths installed previously in the managed
+        directories that are no longer part of the installation.
+        """
+        __status__ = u"Removing files no longer installed."
+        if not self.managed_directories:
+            return
+        prefixes = tuple(self.managed_directories)
+        # Paths are sorted, what a directory contains comes after it.
+        for path in reversed(self.installed_paths.as_list()):
+            if not path.startswith(prefixes) or path in self.paths:
+                continue
+            if stat_cache.isdir(path):
+                if os.listdir(path):
+                    continue
+                os.rmdir(path)
+            elif stat_cache.exists(path):
+                os.remove(path)
+            else:
+                continue
+            logger.info(u"Removed %s, no longer installed.", path)
+            stat_cache.invalidate(path)
+
     def enable(self, flag=True):
         """Enable the part: if the part is enabled it will be called
         during the installation or uninstallation process.
@@ -126,6 +184,7 @@ class PartStatus(object):
         if self.is_enabled():
             # Save new information
             section = Section(self._installed_name, configuration=configuration)
+            section['fingerprint'] = self._section.fingerprint()
             if self.paths:
                 section['paths'] = self.paths.as_list(
                     replaces={self._prefix: '${setup:prefix_directory}'})
@@ -138,6 +197,16 @@ class PartStatus(object):
             if self.depends_paths:
                 section['depends'] = self.depends_paths.as_list(
                     replaces={self._prefix: '${setup:prefix_directory}'})
+            if self.archives:
+                section['archives'] = [
+                    ' '.join((digest, filename))
+                    for filename, digest in sorted(self.archives.items())
+                    if digest is not None]
+            if self.archive_paths:
+                section['archive_paths'] = [
+                    ' '.join((digest, path))
+                    for digest, paths in sorted(self.archive_paths.items())
+                    for path in paths]
         else:
             # Save old information
             section = self._installed_section.__copy__()
@@ -173,13 +242,6 @@ class Part(object):
                 raise ConfigurationError(u"Could load recipe", recipe)
             self.recipes.append(factory(section, self.status))
 
-    def __lt__(self, other):
-        if not isinstance(other, Part):
-            return NotImplemented
-        if self.name in other.status.depends:
-            return True
-        return False
-
     def preinstall(self):
         """Run all pre-installation actions for the part, if it is enabled.
         """
@@ -201,6 +263,7 @@ class Part(object):
             logger.warn(u'Install %s.', self.name)
             for recipe in self.recipes:
                 recipe.install()
+            self.status.remove_stale_paths()
             return True
         logger.warn(u'Nothing to install for %s.', self.name)
         return False
@@ -282,6 +345,7 @@ class InstallerStatus(object):
                     configuration.get_previous_cfg_directory(),
                     'lib')))
         self.get_recipe_entry_point = self._install_set.get_entry_point
+        self._lock = threading.RLock()
 
     def add_recipe_packages(self, names):
         """Install a list of packages required for the parts to
@@ -290,47 +354,36 @@ class InstallerStatus(object):
         """
         # This must be used only to install recipe and recipe dependency.
         requirements = Requirements.parse(names)
-        install_set = self._installer(
-            requirements,
-            strategy=self.strategy)
-        for requirement in requirements:
-            install_set.get(requirement.key).activate()
+        self._lock.acquire()
+        try:
+            install_set = self._installer(
+                requirements,
+                strategy=self.strategy)
+            for requirement in requirements:
+                install_set.get(requirement.key).activate()
+        finally:
+            self._lock.release()
 
     def verify_dependencies(self, refresh=False):
         """Verify the dependencies between all the parts: if a part is
         enabled, any part depending on it should be enabled too.
         """
-        cache = dict()
-        markers = set()
-        partitions = dict()
-
-        def explore(name, is_top=False):
-            if name in markers:
-                raise ConfigurationError(
-                    u"Circular dependencies detected between parts", name)
-            if name not in cache:
-                group = cache[name] = [name]
-                markers.add(name)
-                for depend in self.parts_status[name].depends:
-                    if depend not in self.parts_status:
-                        raise ConfigurationError(
-                            u"Depends on missing part", name, depend)
-                    all_depends, is_cached = explore(depend)
-                    if is_cached:
-                        if depend in partitions:
-                            del partitions[depend]
-                    group.extend(all_depends)
-                markers.remove(name)
-                if is_top:
-                    partitions[name] = group
-                return (group, False)
-            return (cache[name], True)
-
-        map(lambda name: explore(name, True), self.parts_status.keys())
+        def depends(name):
+            status = self.parts_status[name]
+            for depend in status.depends:
+                if depend not in self.parts_status:
+                    raise ConfigurationError(
+                        u"Depends on missing part", name, depend)
+            return status.depends
+
+        names = sorted(self.parts_status.keys())
+        # This detects circular dependencies.
+        topological_sort(names, depends)
+        partitions = connected_components(names, depends)
 
         if not refresh:
             # Enable partitions that at least a part enabled.
-            for partition in partitions.values():
+            for partition in partitions:
                 for name in partition:
                     if self.parts_status[name].is_enabled():
                         break
@@ -374,32 +427,65 @@ class Installer(object):
         self.status.verify_dependencies(refresh)
 
         # Uninstall are in reverse order of dependency informatiom
-        self.parts_to_uninstall.sort(reverse=True)
+        self.parts_to_uninstall = list(reversed(self.sort_parts(
+                    self.parts_to_uninstall)))
         # Install are in order of dependency informations
-        self.parts_to_install.sort()
+        self.parts_to_install = self.sort_parts(self.parts_to_install)
+
+        # Dependencies between parts, to run them in parallel.
+        self._parts = {}
+        self._dependents = {}
+        for part in self.parts_to_install + self.parts_to_uninstall:
+            self._parts[part.name] = part
+            for name in part.status.depends:
+                self._dependents.setdefault(name, []).append(part)
+
+    def sort_parts(self, parts):
+        """Sort parts in order of dependencies.
+        """
+        parts = dict((part.name, part) for part in parts)
+        return [parts[name] for name in topological_sort(
+                sorted(parts.keys()),
+                lambda name: parts[name].status.depends)]
 
     def run(self):
         changed = False
+        workers = self.configuration['setup'].get(
+            'part_workers', '1').as_int()
+
+        def depends(part):
+            # Parts to process before the given one.
+            return [self._parts[name] for name in part.status.depends
+                    if name in self._parts]
+
+        def dependents(part):
+            # Parts to process before the given one, when uninstalling.
+            return self._dependents.get(part.name, [])
+
+        def run_parts(phase, parts, order):
+            return reduce(
+                operator.or_,
+                DependencyTask(phase, workers)(
+                    lambda part: getattr(part, phase)(), parts, order),
+                False)
 
         # Prepare parts to install
         __status__ = u"Preparing installation."
-        for part in self.parts_to_install:
-            changed = part.preinstall() or changed
+        changed = run_parts('preinstall', self.parts_to_install, depends)
 
         # Prepare parts to install
         __status__ = u"Preparing un-installation."
-        for part in self.parts_to_uninstall:
-            changed = part.preuninstall() or changed
+        changed = run_parts(
+            'preuninstall', self.parts_to_uninstall, dependents) or changed
 
         # Uninstall what you need to uninstall first.
         __status__ = u"Running un-installation."
-        for part in self.parts_to_uninstall:
-            changed = part.uninstall() or changed
+        changed = run_parts(
+            'uninstall', self.parts_to_uninstall, dependents) or changed
 
         # Install
         __status__ = u"Running installation."
-        for part in self.parts_to_install:
-            changed = part.install() or changed
+        changed = run_parts('install', self.parts_to_install, depends) or changed
 
         # Save status
         __status__ = u"Finalize installation."
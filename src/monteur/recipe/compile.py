@@ -1,21 +1,138 @@
 
 import py_compile
+import struct
 import sys
 import os
+import time
 
+# This script is run by the target interpreter, it must work with
+# any version of Python.
 
-if __name__ == "__main__":
+if sys.version_info >= (3, 4):
+    import importlib.util
+    MAGIC = importlib.util.MAGIC_NUMBER
+else:
+    import imp
+    MAGIC = imp.get_magic()
+
+
+def get_compiled_filename(source):
+    """Return the bytecode filename for the given source.
+    """
+    if sys.version_info >= (3, 4):
+        return importlib.util.cache_from_source(source)
+    if sys.version_info >= (3, 2):
+        return imp.cache_from_source(source)
+    return source + (__debug__ and 'c' or 'o')
+
+
+def is_up_to_date(source):
+    """Tell if the bytecode of source has been compiled from its
+    current version, using the modification time and size recorded
+    in the bytecode header.
+    """
+    try:
+        stat = os.stat(source)
+        stream = open(get_compiled_filename(source), 'rb')
+    except (OSError, IOError):
+        return False
+    try:
+        header = stream.read(16)
+    finally:
+        stream.close()
+    if header[:4] != MAGIC:
+        return False
+    size = None
+    if sys.version_info >= (3, 7):
+        if len(header) < 16 or struct.unpack('<I', header[4:8])[0]:
+            # Hash based bytecode, let it be recompiled.
+            return False
+        mtime, size = struct.unpack('<II', header[8:16])
+    elif sys.version_info >= (3, 3):
+        if len(header) < 12:
+            return False
+        mtime, size = struct.unpack('<II', header[4:12])
+    else:
+        if len(header) < 8:
+            return False
+        mtime = struct.unpack('<I', header[4:8])[0]
+    if mtime != int(stat.st_mtime) & 0xFFFFFFFF:
+        return False
+    return size is None or size == stat.st_size & 0xFFFFFFFF
+
+
+def compile_file(source):
+    """Compile source, return True upon success.
+    """
+    try:
+        py_compile.compile(source, doraise=True)
+    except Exception:
+        return False
+    return True
+
+
+def find_files(base_path):
+    """Return the Python files in base_path that need to be
+    compiled, and how many are already up to date.
+    """
+    files = []
+    up_to_date = 0
+    for path, directories, filenames in os.walk(base_path):
+        for filename in filenames:
+            if filename.endswith('.py'):
+                source = os.path.join(path, filename)
+                if is_up_to_date(source):
+                    up_to_date += 1
+                else:
+                    files.append(source)
+    return files, up_to_date
+
+
+def compile_directories(directories, jobs=0):
+    """Compile all the Python files in the given directories using
+    jobs processes (0 for one per processor).
+    """
+    pool = None
+    if jobs != 1:
+        try:
+            import multiprocessing
+            jobs = jobs or multiprocessing.cpu_count()
+            pool = multiprocessing.Pool(jobs)
+        except (ImportError, OSError, NotImplementedError):
+            pool = None
     success = 0
     failed = 0
-    for base_path in sys.argv[1:]:
-        for path, directories, filenames in os.walk(base_path):
-            for filename in filenames:
-                if filename.endswith('.py'):
-                    try:
-                        py_compile.compile(
-                            os.path.join(path, filename), doraise=True)
-                        success += 1
-                    except:
-                        failed += 1
-    print 'Compiled %d Python files, plus %d failures.' % (success, failed)
+    try:
+        for base_path in directories:
+            start = time.time()
+            files, up_to_date = find_files(base_path)
+            if pool is not None and len(files) > 1:
+                chunksize = max(1, len(files) // (jobs * 4))
+                results = pool.map(compile_file, files, chunksize)
+            else:
+                results = list(map(compile_file, files))
+            compiled = results.count(True)
+            success += compiled
+            failed += len(results) - compiled
+            sys.stdout.write(
+                'Compiled %d Python files in %s in %.2fs, '
+                '%d up to date, %d failures.\n' % (
+                    compiled, base_path, time.time() - start,
+                    up_to_date, len(results) - compiled))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return success, failed
+
 
+if __name__ == "__main__":
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option(
+        "-j", "--jobs", dest="jobs", type="int", default=0,
+        help="number of processes to use (default to one per processor)")
+    options, directories = parser.parse_args()
+    success, failed = compile_directories(directories, options.jobs)
+    sys.stdout.write(
+        'Compiled %d Python files, plus %d failures.\n' % (success, failed))
@@ -1,20 +1,27 @@
 
+import hashlib
 import os
 import tempfile
 import shutil
 import shlex
 import logging
+import zlib
 
 from monteur.archives import open_archive
-from monteur.download import DownloadManager
+from monteur.distribution.metadata import metadata
+from monteur.download import DownloadManager, compute_checksum, CHUNK_SIZE
 from monteur.recipe.recipe import Recipe
 from monteur.error import ConfigurationError, InstallationError
-from monteur.utils import create_directory, relative_uri
+from monteur.utils import create_directory, relative_uri, stat_cache
+from monteur.utils import copy_file
 from monteur.recipe.utils import MultiTask, Paths
 
 
 logger = logging.getLogger('monteur')
 
+# How to tell if an installed file is different from its source.
+COMPARE_METHODS = ('size', 'mtime', 'digest')
+
 
 def parse_files(options, name):
     """Help to read filenames and put them back where they where
@@ -39,6 +46,58 @@ def parse_files(options, name):
     return map(parse_line, value.as_list())
 
 
+def is_file_unchanged(source_path, destination_path, method):
+    """Tell if the file destination_path is the same than source_path,
+    comparing their size, plus their modification time or digest
+    depending of method.
+    """
+    try:
+        source = os.stat(source_path)
+        destination = os.stat(destination_path)
+    except OSError:
+        return False
+    if source.st_size != destination.st_size:
+        return False
+    if method == 'mtime':
+        return int(source.st_mtime) == int(destination.st_mtime)
+    if method == 'digest':
+        return (compute_checksum(source_path) ==
+                compute_checksum(destination_path))
+    return True
+
+
+def compute_crc(path):
+    """Compute the CRC32 checksum of the file pointed by path.
+    """
+    input = open(path, 'rb')
+    try:
+        crc = zlib.crc32('')
+        buffer = input.read(CHUNK_SIZE)
+        while buffer:
+            crc = zlib.crc32(buffer, crc)
+            buffer = input.read(CHUNK_SIZE)
+    finally:
+        input.close()
+    return crc & 0xffffffffL
+
+
+def is_member_unchanged(info, path):
+    """Tell if the file at path is the same than the archive member
+    described by info, using its size and CRC or modification time.
+    """
+    try:
+        status = os.stat(path)
+    except OSError:
+        return False
+    if info.get('size') != status.st_size:
+        return False
+    if 'crc' in info:
+        return compute_crc(path) == info['crc']
+    if 'mtime' in info:
+        return int(info['mtime']) == int(status.st_mtime)
+    return False
+
+
 class File(Recipe):
     """Download a list of files and archives in a folder.
     """
@@ -49,6 +108,11 @@ class File(Recipe):
         self.files = parse_files(options, 'files')
         self.urls = parse_files(options, 'urls')
         self.directory = options['directory'].as_text()
+        self.compare = options.get('files_compare', 'mtime').as_text()
+        if self.compare not in COMPARE_METHODS:
+            raise ConfigurationError(
+                options['files_compare'].location,
+                u"Invalid comparison method", self.compare)
         download_path = options.get(
             'download_directory',
             '${setup:prefix_directory}/download').as_text()
@@ -57,30 +121,36 @@ class File(Recipe):
         self._do = MultiTask(options, 'download')
 
     def install_file(self, source_path, destination_path, directory):
-        """Install a folder or a file to a installation one.
+        """Install a folder or a file to a installation one. A file
+        previously installed is only copied again if it changed.
         """
-        if destination_path in self.status.installed_paths:
-            self.status.paths.add(destination_path, directory=directory)
-            return
-
+        installed = destination_path in self.status.installed_paths
         if directory:
-            if os.path.exists(destination_path):
-                if not os.path.isdir(destination_path):
+            if stat_cache.exists(destination_path):
+                if not stat_cache.isdir(destination_path):
                     raise InstallationError(
                         u"Error target directory already exists as a file",
                         destination_path)
+                if installed:
+                    self.status.paths.add(destination_path, directory=True)
+                    return
             else:
                 create_directory(destination_path, quiet=True)
         else:
-            self.status.test_override_rule(destination_path)
-            if not os.path.exists(source_path):
+            if not installed:
+                self.status.test_override_rule(destination_path)
+            elif is_file_unchanged(
+                source_path, destination_path, self.compare):
+                self.status.paths.add(destination_path, directory=False)
+                return
+            if not stat_cache.exists(source_path):
                 raise InstallationError(
                     u"Error missing directory or file in source",
                     source_path)
             parent_path = os.path.dirname(destination_path)
-            if not os.path.exists(parent_path):
+            if not stat_cache.exists(parent_path):
                 create_directory(parent_path, quiet=True)
-            shutil.copy2(source_path, destination_path)
+            copy_file(source_path, destination_path)
         self.status.paths.add(destination_path, directory=directory, added=True)
 
     def install_files(self, origin_path, target_path, files):
@@ -98,33 +168,107 @@ class File(Recipe):
         download = lambda (uri, parts): (self.downloader(uri), parts)
         self.files = self._do(download, self.files + self.urls)
 
+    def get_archive_digest(self, filename, parts):
+        """Return a digest of the archive located at filename, and of
+        where its content is installed.
+        """
+        digest = metadata.archive_key(filename)
+        if digest is None:
+            return None
+        return hashlib.md5('\0'.join(
+                [digest, filename, self.directory] +
+                [':'.join(part) for part in parts])).hexdigest()
+
+    def restore_archive(self, filename, digest):
+        """Mark the paths installed by the archive during the previous
+        installation as installed, if the archive didn't change and
+        they are still there. Return True upon success.
+        """
+        if (digest is None or
+            self.status.installed_archives.get(filename) != digest or
+            digest not in self.status.installed_archive_paths):
+            return False
+        destinations = self.status.installed_archive_paths[digest]
+        installed_paths = self.status.installed_paths
+        for destination_path in destinations:
+            if (destination_path not in installed_paths or
+                not stat_cache.exists(destination_path)):
+                return False
+        logger.info(u"Archive %s didn't change.", filename)
+        for destination_path in destinations:
+            self.status.paths.add(
+                destination_path,
+                directory=installed_paths[destination_path]['directory'])
+        self.status.archive_paths[digest] = destinations
+        return True
+
+    def install_archive(self, filename, archive, parts):
+        """Install files from an archive. Nothing is read from the
+        archive if it didn't change since the previous installation,
+        and otherwise only the members that changed are extracted.
+        """
+        digest = self.get_archive_digest(filename, parts)
+        self.status.archives[filename] = digest
+        if self.restore_archive(filename, digest):
+            return
+
+        members = archive.list()
+        if parts:
+            files = {}
+            for source_part, destination_part in parts:
+                part_files = members.as_dict(
+                    prefixes={source_part: destination_part})
+                if not part_files:
+                    raise ConfigurationError(
+                        u'Missing wanted path in archive')
+                files.update(part_files)
+        else:
+            files = members.as_dict()
+        destinations = []
+        for path, info in sorted(files.items()):
+            destination_path = self.directory
+            if path:
+                destination_path = os.path.join(destination_path, path)
+            destinations.append((destination_path, info))
+        if digest is not None:
+            self.status.archive_paths[digest] = [
+                destination_path for destination_path, info in destinations]
+
+        installed_paths = self.status.installed_paths
+        changed = []
+        for destination_path, info in destinations:
+            if (not info['directory'] and
+                destination_path in installed_paths and
+                is_member_unchanged(info, destination_path)):
+                self.status.paths.add(destination_path, directory=False)
+            else:
+                changed.append((destination_path, info))
+        if not changed:
+            return
+        extract_path = tempfile.mkdtemp('monteur.archive')
+        try:
+            archive.extract(extract_path, set(
+                    info['original'] for destination_path, info in changed
+                    if not info['directory']))
+            for destination_path, info in changed:
+                self.install_file(
+                    os.path.join(extract_path, info['original']),
+                    destination_path,
+                    info['directory'])
+        finally:
+            shutil.rmtree(extract_path)
+            stat_cache.invalidate(extract_path)
+
     def install(self):
         __status__ = u"Install files."
         target_directory = self.directory
         for filename, parts in self.files:
             archive = open_archive(filename, 'r')
             if archive is not None:
-                extract_path = tempfile.mkdtemp('monteur.archive')
-                extracted = archive.extract(extract_path)
                 try:
-                    if parts:
-                        for source_part, destination_part in parts:
-                            files = extracted.as_dict(
-                                prefixes={source_part: destination_part})
-                            if not files:
-                                raise ConfigurationError(
-                                    u'Missing wanted path in archive')
-                            self.install_files(
-                                extract_path,
-                                target_directory,
-                                files)
-                    else:
-                        self.install_files(
-                            extract_path,
-                            target_directory,
-                            extracted.as_dict())
+                    self.install_archive(filename, archive, parts)
                 finally:
-                    shutil.rmtree(extract_path)
+                    archive.close()
             else:
                 if not os.path.isdir(filename):
                     raise ConfigurationError(
@@ -147,18 +291,20 @@ class File(Recipe):
                     target_path = os.path.join(
                         target_directory, os.path.basename(filename))
                     self.install_files(
+                        filename,
                         target_path,
-                        target_directory,
-                        files)
+                        files.as_dict())
+        self.status.add_managed_directory(self.directory)
 
     def uninstall(self):
         __status__ = u"Uninstalling files."
         for filename in self.status.installed_paths.as_list():
-            if os.path.exists(filename):
-                if os.path.isdir(filename):
+            if stat_cache.exists(filename):
+                if stat_cache.isdir(filename):
                     shutil.rmtree(filename)
                 else:
                     os.remove(filename)
+                stat_cache.invalidate(filename)
             else:
                 raise InstallationError(
                     u"Missing files while uninstalling", filename)
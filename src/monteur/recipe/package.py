@@ -7,7 +7,7 @@ from monteur.distribution.workingset import WorkingSet
 from monteur.error import ConfigurationError, InstallationError
 from monteur.installer import PackageInstaller, is_installer_changed
 from monteur.recipe.recipe import Recipe
-from monteur.utils import get_package_name
+from monteur.utils import get_package_name, stat_cache
 from monteur.version import Requirements, Requirement
 
 logger = logging.getLogger('monteur')
@@ -145,8 +145,9 @@ class Package(Recipe):
     def uninstall(self):
         __status__ = u"Uninstall scripts."
         for script in self.status.installed_paths.as_list():
-            if os.path.isfile(script):
+            if stat_cache.isfile(script):
                 os.remove(script)
+                stat_cache.invalidate(script)
             else:
                 raise InstallationError(
                     u"Missing script while uninstalling", script)
@@ -160,7 +161,7 @@ class Interpreter(Package):
     def install(self):
         script_path = os.path.join(self.bin_directory, self.options.name)
         if script_path not in self.status.installed_paths:
-            if os.path.exists(script_path):
+            if stat_cache.exists(script_path):
                 raise InstallationError(
                     u"Script already exists", script_path)
 
@@ -2,10 +2,10 @@
 import logging
 
 
+from monteur.error import InstallationError
 from monteur.recipe.recipe import Recipe
 from monteur.recipe import compile
 from monteur.python import PythonInterpreter
-from monteur.recipe.utils import MultiTask
 
 logger = logging.getLogger('monteur')
 
@@ -17,16 +17,21 @@ class PythonCompileFile(Recipe):
         self.interpreter = PythonInterpreter.detect(
             options.get_with_default(
                 'python_executable', 'setup').as_text())
-        self._do = MultiTask(options, 'compile')
+        # Number of processes used to compile, 0 for one per processor.
+        self.jobs = options.get('jobs', '0').as_int()
 
     def install(self):
-
-        def compile_files(path):
-            logger.info('Compile python files in %s.' % path)
-            self.interpreter.execute_module(compile, path)
-            return path
-
-        self._do(
-            compile_files,
-            self.status.paths.query(
-                added=True, directory=True))
+        paths = list(self.status.paths.query(added=True, directory=True))
+        if not paths:
+            return
+        logger.info('Compile python files in %s.' % ', '.join(paths))
+        output, errors, code = self.interpreter.execute_module(
+            compile, '-j', str(self.jobs), *paths)
+        for line in output.splitlines():
+            logger.info(line)
+        for line in errors.splitlines():
+            logger.warning(line)
+        if code:
+            raise InstallationError(
+                u"Error while compiling Python files in",
+                ', '.join(paths), detail=errors)
@@ -1,14 +1,23 @@
 
+import cPickle
+import hashlib
 import logging
 import os
 import shutil
+import threading
 
 from monteur.recipe.recipe import Recipe
-from monteur.utils import open_uri
+from monteur.recipe.utils import MultiTask
+from monteur.utils import open_uri, stat_cache, create_directory
 from monteur.error import InstallationError
 
 logger = logging.getLogger('monteur')
 
+TEMPLATE_DIRECTORY = 'templates'
+RENDERS_FILE = 'renders.cache'
+RENDERS_VERSION = 1
+marker = object()
+
 
 class TemplateRenderingError(InstallationError):
     """Error while rendering the template.
@@ -25,6 +34,251 @@ class TemplateRenderingError(InstallationError):
         super(TemplateRenderingError, self).__init__(message)
 
 
+def read_option(configuration, section_name, key):
+    """Return the value of an option as recorded while rendering a
+    template. A key of None stands for the whole section.
+    """
+    section = configuration.get(section_name, None)
+    if section is None:
+        return None
+    if key is None:
+        return section.fingerprint()
+    if key not in section:
+        return None
+    return section[key].as_text()
+
+
+class RecordingSection(object):
+    """Give access to a section to a template, recording which
+    options are read.
+    """
+
+    def __init__(self, section, reads):
+        self._section = section
+        self._reads = reads
+
+    def _record(self, key):
+        if self._reads is not None:
+            self._reads[(self._section.name, key)] = read_option(
+                self._section.configuration, self._section.name, key)
+
+    def __getitem__(self, key, default=marker):
+        self._record(key)
+        if default is marker:
+            return self._section[key]
+        return self._section.get(key, default)
+
+    get = __getitem__
+
+    def get_with_default(self, key, default_section, default=marker):
+        self._record(key)
+        if key not in self._section:
+            RecordingSection(
+                self._section.configuration[default_section],
+                self._reads)._record(key)
+        return self._section.get_with_default(key, default_section, default)
+
+    def __contains__(self, key):
+        self._record(key)
+        return key in self._section
+
+    def __getattr__(self, name):
+        # Anything else might read the whole section.
+        self._record(None)
+        return getattr(self._section, name)
+
+    def __iter__(self):
+        self._record(None)
+        return iter(self._section)
+
+
+class RecordingConfiguration(object):
+    """Give access to a configuration to a template, recording which
+    options are read.
+    """
+
+    def __init__(self, configuration, record):
+        self._configuration = configuration
+        self._record = record
+
+    def __getitem__(self, name, default=marker):
+        if default is marker:
+            section = self._configuration[name]
+        else:
+            section = self._configuration.get(name, default)
+            if section is default:
+                self._record.reads[(name, None)] = None
+                return default
+        return RecordingSection(section, self._record.reads)
+
+    get = __getitem__
+
+    def __contains__(self, name):
+        self._record.reads[(name, None)] = read_option(
+            self._configuration, name, None)
+        return name in self._configuration
+
+    def __getattr__(self, name):
+        # We cannot tell what is read.
+        self._record.dynamic = True
+        return getattr(self._configuration, name)
+
+
+class RecordingStatus(object):
+    """Give access to the part status to a template. What is read
+    from it cannot be recorded.
+    """
+
+    def __init__(self, status, record):
+        self._status = status
+        self._record = record
+
+    def __getattr__(self, name):
+        self._record.dynamic = True
+        return getattr(self._status, name)
+
+
+class Render(object):
+    """What was used to render a template.
+    """
+
+    def __init__(self, digest):
+        self.digest = digest
+        self.reads = {}
+        self.dynamic = False
+        self.size = None
+        self.mtime = None
+
+    def is_unchanged(self, digest, output_path, configuration):
+        """Tell if rendering the template with the given digest would
+        give the same output than the existing one.
+        """
+        if self.dynamic or self.digest != digest:
+            return False
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return False
+        if stat.st_size != self.size or int(stat.st_mtime) != self.mtime:
+            return False
+        for (section_name, key), value in self.reads.items():
+            if read_option(configuration, section_name, key) != value:
+                return False
+        return True
+
+
+class TemplateCache(object):
+    """Keep compiled templates, indexed by their source digest and
+    Genshi version, and what was used to render each file from one
+    run to the other.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._directory = None
+        self._renders = {}
+        self._changed = False
+
+    def open(self, directory):
+        """Store compiled templates in the given directory.
+        """
+        self._lock.acquire()
+        try:
+            self._directory = create_directory(directory)
+            self._renders = {}
+            self._changed = False
+            filename = os.path.join(self._directory, RENDERS_FILE)
+            if os.path.isfile(filename):
+                try:
+                    stream = open(filename, 'rb')
+                    try:
+                        version, renders = cPickle.load(stream)
+                    finally:
+                        stream.close()
+                except Exception:
+                    logger.info(
+                        u"Ignoring unreadable template cache %s.", filename)
+                else:
+                    if version == RENDERS_VERSION:
+                        self._renders = renders
+        finally:
+            self._lock.release()
+
+    def save(self, *ignore):
+        """Save what was used to render files if it changed.
+        """
+        self._lock.acquire()
+        try:
+            if self._directory is None or not self._changed:
+                return
+            filename = os.path.join(self._directory, RENDERS_FILE)
+            temporary = filename + '.tmp'
+            stream = open(temporary, 'wb')
+            try:
+                cPickle.dump(
+                    (RENDERS_VERSION, self._renders),
+                    stream, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            os.rename(temporary, filename)
+            self._changed = False
+        finally:
+            self._lock.release()
+
+    def get_template(self, source, factory):
+        """Return the template compiled by factory out of source.
+        """
+        import genshi
+        key = hashlib.md5('\0'.join((
+                    factory.__name__,
+                    str(getattr(genshi, '__version__', None)),
+                    source))).hexdigest()
+        if self._directory is None:
+            return factory(source)
+        filename = os.path.join(self._directory, key + '.template')
+        try:
+            stream = open(filename, 'rb')
+            try:
+                return cPickle.load(stream)
+            finally:
+                stream.close()
+        except Exception:
+            pass
+        template = factory(source)
+        temporary = '%s.%d.%d.tmp' % (
+            filename, os.getpid(), threading.current_thread().ident)
+        try:
+            stream = open(temporary, 'wb')
+            try:
+                cPickle.dump(template, stream, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            os.rename(temporary, filename)
+        except Exception:
+            logger.debug(u"Cannot cache compiled template in %s.", filename)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return template
+
+    def get_render(self, output_path):
+        self._lock.acquire()
+        try:
+            return self._renders.get(output_path)
+        finally:
+            self._lock.release()
+
+    def set_render(self, output_path, render):
+        self._lock.acquire()
+        try:
+            self._renders[output_path] = render
+            self._changed = True
+        finally:
+            self._lock.release()
+
+
+templates = TemplateCache()
+
+
 class Template(Recipe):
     """Create files and folder from a given template.
     """
@@ -34,6 +288,8 @@ class Template(Recipe):
         status.requirements.append('Genshi')
         status.add_override_rule('allow', '*.template_xml')
         status.add_override_rule('allow', '*.template_text')
+        self._lock = threading.Lock()
+        self._do = MultiTask(options, 'template')
 
     def preinstall(self):
         from genshi.template import NewTextTemplate, MarkupTemplate
@@ -48,63 +304,100 @@ class Template(Recipe):
         __status__ = u"Rendering template for %s." % output_path
         from genshi.template import TemplateError
 
-        logger.info('Creating file %s from template.' % output_path)
         if output_path not in self.status.installed_paths:
             self.status.test_override_rule(output_path)
-        success = False
         source_file = open_uri(source_path)
         try:
+            source = source_file.read()
+        finally:
+            source_file.close()
+        digest = hashlib.md5(source).hexdigest()
+        configuration = self.options.configuration
+        render = templates.get_render(output_path)
+        if (output_path in self.status.installed_paths and
+            render is not None and
+            render.is_unchanged(digest, output_path, configuration)):
+            logger.info('File %s from template is up to date.' % output_path)
+        else:
+            logger.info('Creating file %s from template.' % output_path)
             try:
-                template = factory(source_file.read())
+                template = templates.get_template(source, factory)
             except TemplateError, error:
                 raise TemplateRenderingError(error)
+            render = Render(digest)
             output_file = open(output_path, 'wb')
             try:
                 output_file.write(
                     template.generate(
-                        section=self.options,
-                        configuration=self.options.configuration,
-                        status=self.status
+                        section=RecordingSection(self.options, render.reads),
+                        configuration=RecordingConfiguration(
+                            configuration, render),
+                        status=RecordingStatus(self.status, render)
                         ).render())
-                success = True
             except TemplateError, error:
                 raise TemplateRenderingError(error)
             finally:
                 output_file.close()
-        finally:
-            source_file.close()
-        if success:
             shutil.copystat(source_path, output_path)
+            stat = os.stat(output_path)
+            render.size = stat.st_size
+            render.mtime = int(stat.st_mtime)
+            templates.set_render(output_path, render)
+        self._lock.acquire()
+        try:
             assert self.status.paths.rename(source_path, output_path)
-            os.remove(source_path)
+        finally:
+            self._lock.release()
+        os.remove(source_path)
+        stat_cache.invalidate(source_path)
+        stat_cache.invalidate(output_path)
         return output_path
 
-    def render_file(self, filename, prefix=None):
-        """Optionally render filename as a template.
+    def find_template(self, filename, prefix=None):
+        """Return the source, output and factory to render filename,
+        if it is a template.
         """
         for format, factory in self.formats.items():
             if filename.endswith(format):
                 if prefix:
                     filename = os.path.join(prefix, filename)
-                return self.render_template(
-                    filename,
-                    filename[:-len(format)],
-                    factory)
+                return (filename, filename[:-len(format)], factory)
+        return None
 
-    def render_directory(self, dirname):
+    def render_file(self, filename, prefix=None):
+        """Optionally render filename as a template.
+        """
+        template = self.find_template(filename, prefix)
+        if template is not None:
+            return self.render_template(*template)
+
+    def find_directory_templates(self, dirname):
         """Look for files to render as a template inside the given path.
         """
+        found = []
         for prefix, directories, filenames in os.walk(dirname):
             for filename in filenames:
-                self.render_file(filename, prefix)
+                template = self.find_template(filename, prefix)
+                if template is not None:
+                    found.append(template)
+        return found
+
+    def render_directory(self, dirname):
+        for template in self.find_directory_templates(dirname):
+            self.render_template(*template)
 
     def install(self):
         """Look in previously installed paths files that can be
         rendered as a template.
         """
         __status__ = u"Installing templates."
+        found = set()
         for path in self.status.paths.query(added=True):
-            if os.path.isdir(path):
-                self.render_directory(path)
+            if stat_cache.isdir(path):
+                found.update(self.find_directory_templates(path))
             else:
-                self.render_file(path)
+                template = self.find_template(path)
+                if template is not None:
+                    found.add(template)
+        self._do(lambda template: self.render_template(*template),
+                 sorted(found))
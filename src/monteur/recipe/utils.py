@@ -1,67 +1,144 @@
 
-import fnmatch
+import collections
 import logging
 import operator
 import os
 import threading
 
-from monteur.error import logs
+from monteur.distribution.manifest import Manifest
+from monteur.error import ConfigurationError, logs
+from monteur.utils import stat_cache
 
 logger = logging.getLogger('monteur')
 _marker = object()
 
 
+def intern_piece(piece):
+    """Intern a path component, as the same names come back over and
+    over in a tree.
+    """
+    if type(piece) is str:
+        return intern(piece)
+    return piece
+
+
+class PathInfo(object):
+    """Information stored about a path.
+    """
+    __slots__ = ('directory', 'root', 'extra')
+
+    def __init__(self, directory, root=None, extra=None):
+        self.directory = directory
+        self.root = root
+        self.extra = extra or None
+
+    def get(self, key, default=None):
+        if key == 'directory':
+            return self.directory
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def materialize(self, original):
+        """Return a dictionary with all information about the path,
+        if it is located at original.
+        """
+        info = {'directory': self.directory, 'original': original}
+        if self.root is not None:
+            info['full'] = os.path.join(self.root, original)
+        if self.extra is not None:
+            info.update(self.extra)
+        return info
+
+
+class PathNode(object):
+    """A node in a tree of path components.
+    """
+    __slots__ = ('children', 'info')
+
+    def __init__(self):
+        self.children = None
+        self.info = None
+
+    def child(self, piece):
+        """Return the child node for piece, creating it if needed.
+        """
+        if self.children is None:
+            self.children = {}
+        node = self.children.get(piece)
+        if node is None:
+            node = self.children[intern_piece(piece)] = PathNode()
+        return node
+
+    def sorted_children(self):
+        if self.children is None:
+            return []
+        return sorted(self.children.iteritems(), key=operator.itemgetter(0))
+
+
 class Paths(object):
 
     def __init__(self, paths=None, verify=True, separator=os.path.sep):
-        self._data = {}
+        self._root = PathNode()
         self._len = 0
         self._verify = verify
         self._separator = separator
         if paths:
             self.extend(paths)
 
+    def _split(self, path):
+        return [piece for piece in path.split(self._separator)
+                if piece != '.']
+
+    def _find(self, pieces):
+        node = self._root
+        for piece in pieces:
+            if node.children is None:
+                return None
+            node = node.children.get(piece)
+            if node is None:
+                return None
+        return node
+
+    def _set(self, node, info):
+        if node.info is None:
+            node.info = info
+            self._len += 1
+            return True
+        return False
+
     def add(self, path, verify=None, directory=None, **extra):
         if verify is None:
             verify = self._verify
         if verify:
-            if not os.path.exists(path):
+            if not stat_cache.exists(path):
                 logger.error(
                     u"WARNING: Missing installed path %s.",
                     path)
                 return False
-        data = self._data
-        for piece in path.split(self._separator):
-            if piece != '.':
-                data = data.setdefault(piece, {})
-        path = os.path.normpath(path)
+        node = self._root
+        for piece in self._split(path):
+            node = node.child(piece)
         if directory is None:
-            directory = os.path.isdir(path)
-        info = {'directory': directory, 'original': path}
-        info.update(extra)
-        if None not in data:
-            data[None] = info
-            self._len += 1
+            directory = stat_cache.isdir(os.path.normpath(path))
+        self._set(node, PathInfo(directory, extra=extra))
         return True
 
     def listdir(self, path):
         """Populate the path object from the filesystem.
         """
+        root = intern_piece(path)
 
-        def populate(path, prefix):
+        def populate(path, node):
             for item in os.listdir(path):
-                item_prefix = os.path.join(prefix, item)
                 item_path = os.path.join(path, item)
-                item_directory = os.path.isdir(item_path)
-                self.add(
-                    item_prefix,
-                    verify=False,
-                    directory=item_directory,
-                    full=item_path)
+                item_directory = stat_cache.isdir(item_path)
+                item_node = node.child(item)
+                self._set(item_node, PathInfo(item_directory, root=root))
                 if item_directory:
-                    populate(item_path, item_prefix)
+                    populate(item_path, item_node)
 
-        populate(path, '')
+        populate(path, self._root)
 
     def extend(self, paths, verify=None):
         added = True
@@ -70,162 +147,146 @@ class Paths(object):
         return added
 
     def rename(self, old, new):
-
-        def rename_sub(old_data, old_ids, new_data, new_ids):
-            assert len(old_ids) == len(new_ids), \
-                'Path of different depths are not supported'
-
-            if not old_ids:
-                if None not in old_data:
-                    raise ValueError
-                new_data[None] = old_data[None]
-                del old_data[None]
-                return len(old_data) == 0
-
-            old_id = old_ids.pop(0)
-            new_id = new_ids.pop(0)
-
-            if old_id not in old_data:
-                raise ValueError
-
-            add_data = new_data.get(new_id, {})
-            unique = len(old_data[old_id]) == 1
-
-            prune = rename_sub(
-                old_data[old_id], old_ids,
-                add_data, new_ids)
-
-            prune = unique and prune
-            new_data[new_id] = add_data
-
-            if old_id == new_id:
-                return prune
-            if prune:
-                del old_data[old_id]
-            return prune
-
-        try:
-            rename_sub(
-                self._data, old.split(os.path.sep),
-                self._data, new.split(os.path.sep))
-            return True
-        except ValueError:
+        old_ids = old.split(os.path.sep)
+        new_ids = new.split(os.path.sep)
+        assert len(old_ids) == len(new_ids), \
+            'Path of different depths are not supported'
+        parents = [self._root]
+        for piece in old_ids:
+            children = parents[-1].children
+            if children is None or piece not in children:
+                return False
+            parents.append(children[piece])
+        old_node = parents.pop()
+        if old_node.info is None:
             return False
+        if old_ids == new_ids:
+            return True
+        info = old_node.info
+        old_node.info = None
+        self._len -= 1
+        # Prune the branches that are now empty.
+        for parent, piece in reversed(zip(parents, old_ids)):
+            node = parent.children[piece]
+            if node.info is not None or node.children:
+                break
+            del parent.children[piece]
+        node = self._root
+        for piece in new_ids:
+            node = node.child(piece)
+        if node.info is not None:
+            self._len -= 1
+            node.info = None
+        self._set(node, info)
+        return True
 
     def query(self, **matches):
-        return self._search(
-            lambda key, value: os.path.sep.join(key),
-            True, matches=matches)
+        return self.as_list(True, matches=matches)
 
-    def as_list(self, simplify=False, matches={}, prefixes={}, replaces={}):
-        return self._search(
-            lambda key, value: os.path.sep.join(key),
-            simplify=simplify, matches=matches,
-            prefixes=prefixes, replaces=replaces)
-
-    def as_dict(self, simplify=False, matches={}, prefixes={}, replaces={}):
-        return dict(self._search(
-            lambda key, value: (os.path.sep.join(key), value),
-            simplify=simplify, matches=matches,
-            prefixes=prefixes, replaces=replaces))
-
-    def as_manifest(self, local_rules, recursive_rules, prefixes=[]):
-        result = []
-
-        def build(search_prefix, path, filename, data, recurse_rules):
-            if search_prefix in recursive_rules:
-                recurse_rules = recurse_rules + recursive_rules[search_prefix]
-            prefix_rules = local_rules.get(search_prefix, []) + recurse_rules
-            for key, value in sorted(data.items(), key=operator.itemgetter(0)):
-                if key is None:
-                    if filename is not None:
-                        for rule in prefix_rules:
-                            if rule and fnmatch.fnmatch(filename, rule):
-                                result.append((path, value))
-                                break
-                else:
-                    if search_prefix == './':
-                        if filename:
-                            local_search = filename + '/'
-                        else:
-                            local_search = search_prefix
-                    else:
-                        if filename:
-                            local_search = search_prefix + filename + '/'
-                        else:
-                            local_search = search_prefix
-                    if path:
-                        local_path = path + '/' + key
-                    else:
-                        local_path = key
-                    build(local_search, local_path, key, value, recurse_rules)
-
-        if prefixes:
-            for path in prefixes:
-                data = self._data
-                for piece in path.split(os.path.sep):
-                    data = data.get(piece)
-                    if data is None:
-                        break
-                else:
-                    build(path + '/', '', None, data, [])
-        else:
-            build('./', '', None, self._data, [])
-        return result
-
-    def _search(self, visitor, simplify=False, matches={}, prefixes={}, replaces={}):
-        result = []
+    def iterate(self, simplify=False, matches={}, prefixes={}, replaces={}):
+        """Iterate over the path and information about them, in order.
+        """
         changes = {}
         for path, value in replaces.items():
             changes[tuple(path.split(self._separator))] = value
+        join = os.path.sep.join
 
-        def build(prefix, data):
+        def build(prefix, original, node):
             change = changes.get(tuple(prefix), _marker)
             if change is not _marker:
                 if change:
                     prefix = [change]
                 else:
                     return
-            for key, value in sorted(data.items(), key=operator.itemgetter(0)):
-                if key is None:
-                    for match_key, match_value in matches.items():
-                        if value.get(match_key, None) != match_value:
-                            break
-                    else:
-                        result.append(visitor(prefix, value))
-                        if simplify:
-                            # None is always the smallest.
-                            break
+            info = node.info
+            if info is not None:
+                for match_key, match_value in matches.items():
+                    if info.get(match_key, None) != match_value:
+                        break
                 else:
-                    build(prefix + [key], value)
+                    yield join(prefix), info, original
+                    if simplify:
+                        return
+            for key, child in node.sorted_children():
+                for result in build(prefix + [key], original + [key], child):
+                    yield result
 
         if prefixes:
             for path, replace in prefixes.iteritems():
-                data = self._data
-                for piece in path.split(self._separator):
-                    if piece != '.':
-                        data = data.get(piece)
-                        if data is None:
-                            break
-                else:
+                pieces = self._split(path)
+                node = self._find(pieces)
+                if node is not None:
                     if replace:
-                        build([replace], data)
+                        results = build([replace], pieces, node)
                     else:
-                        build([], data)
+                        results = build([], pieces, node)
+                    for result in results:
+                        yield result
+        else:
+            for result in build([], [], self._root):
+                yield result
+
+    def iter_list(self, simplify=False, matches={}, prefixes={}, replaces={}):
+        for path, info, original in self.iterate(
+            simplify=simplify, matches=matches,
+            prefixes=prefixes, replaces=replaces):
+            yield path
+
+    def iter_dict(self, simplify=False, matches={}, prefixes={}, replaces={}):
+        for path, info, original in self.iterate(
+            simplify=simplify, matches=matches,
+            prefixes=prefixes, replaces=replaces):
+            yield path, info.materialize(
+                os.path.normpath(os.path.sep.join(original)))
+
+    def as_list(self, simplify=False, matches={}, prefixes={}, replaces={}):
+        return list(self.iter_list(
+                simplify=simplify, matches=matches,
+                prefixes=prefixes, replaces=replaces))
+
+    def as_dict(self, simplify=False, matches={}, prefixes={}, replaces={}):
+        return dict(self.iter_dict(
+                simplify=simplify, matches=matches,
+                prefixes=prefixes, replaces=replaces))
+
+    def iter_manifest(self, local_rules, recursive_rules, prefixes=[]):
+        manifest = Manifest(local_rules, recursive_rules)
+
+        def entries(node):
+            for key, child in node.sorted_children():
+                children = None
+                if child.children:
+                    children = lambda child=child: entries(child)
+                yield key, child.info, children
+
+        def result(path, original, info):
+            return path, info.materialize(
+                os.path.normpath(os.path.sep.join(original)))
+
+        if prefixes:
+            for path in prefixes:
+                pieces = path.split(os.path.sep)
+                node = self._find(pieces)
+                if node is not None:
+                    for selected in manifest.select(
+                        path + '/', '', pieces, entries(node), []):
+                        yield result(*selected)
         else:
-            build([], self._data)
-        return result
+            for selected in manifest.select(
+                './', '', [], entries(self._root), []):
+                yield result(*selected)
+
+    def as_manifest(self, local_rules, recursive_rules, prefixes=[]):
+        return list(self.iter_manifest(
+                local_rules, recursive_rules, prefixes=prefixes))
 
     def get(self, path, default=None):
-        data = self._data
-        for piece in path.split(self._separator):
-            if piece != '.':
-                data = data.get(piece, _marker)
-                if data is _marker:
-                    return default
-        if None in data:
-            return data[None]
-        return default
+        pieces = self._split(path)
+        node = self._find(pieces)
+        if node is None or node.info is None:
+            return default
+        return node.info.materialize(
+            os.path.normpath(self._separator.join(pieces)))
 
     def __len__(self):
         return self._len
@@ -237,7 +298,8 @@ class Paths(object):
         return value
 
     def __contains__(self, path):
-        return self.get(path, default=_marker) is not _marker
+        node = self._find(self._split(path))
+        return node is not None and node.info is not None
 
 
 WORK_DONE = object()
@@ -323,3 +385,201 @@ class MultiTaskWorker(threading.Thread):
             self.manager.mark_failed(error)
         finally:
             logs.unregister()
+
+
+def topological_sort(names, depends):
+    """Return names sorted so that each name comes after the names
+    it depends on. depends is called on a name to get its
+    dependencies, those not in names are ignored. The order of names
+    is kept as much as possible.
+    """
+    names = list(names)
+    known = set(names)
+    waiting = {}
+    dependents = {}
+    ready = collections.deque()
+    for name in names:
+        count = 0
+        for depend in set(depends(name)):
+            if depend in known and depend != name:
+                dependents.setdefault(depend, []).append(name)
+                count += 1
+        if count:
+            waiting[name] = count
+        else:
+            ready.append(name)
+    result = []
+    while ready:
+        name = ready.popleft()
+        result.append(name)
+        for dependent in dependents.get(name, []):
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                del waiting[dependent]
+                ready.append(dependent)
+    if waiting:
+        raise ConfigurationError(
+            u"Circular dependencies detected between parts",
+            ', '.join(sorted(waiting)))
+    return result
+
+
+def connected_components(names, depends):
+    """Return the groups of names that are linked together by
+    dependencies, whatever their direction.
+    """
+    names = list(names)
+    neighbours = dict((name, []) for name in names)
+    for name in names:
+        for depend in depends(name):
+            if depend in neighbours:
+                neighbours[name].append(depend)
+                neighbours[depend].append(name)
+    components = []
+    seen = set()
+    for name in names:
+        if name in seen:
+            continue
+        seen.add(name)
+        component = []
+        queue = [name]
+        while queue:
+            current = queue.pop()
+            component.append(current)
+            for neighbour in neighbours[current]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        components.append(component)
+    return components
+
+
+class DependencyTask(object):
+    """Process items following their dependencies: an item is
+    processed only after all the items it depends on are done. Up to
+    a given number of independent items are processed at the same
+    time.
+    """
+
+    def __init__(self, name, worker_count=1):
+        self.name = name
+        self._condition = threading.Condition(threading.RLock())
+        self._worker_count = max(worker_count, 1)
+        self._ready = []
+        self._waiting = {}
+        self._dependents = {}
+        self._running = 0
+        self._results = []
+        self._error = None
+
+    def get_work(self):
+        self._condition.acquire()
+        try:
+            while (not self._ready and self._running and
+                   self._error is None):
+                self._condition.wait()
+            if self._error is not None or not self._ready:
+                return WORK_DONE
+            self._running += 1
+            return self._ready.pop(0)
+        finally:
+            self._condition.release()
+
+    def mark_done(self, item, result):
+        self._condition.acquire()
+        try:
+            self._running -= 1
+            self._results.append(result)
+            for dependent in self._dependents.pop(item, []):
+                waiting = self._waiting[dependent]
+                waiting.discard(item)
+                if not waiting:
+                    del self._waiting[dependent]
+                    self._ready.append(dependent)
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def mark_failed(self, error):
+        self._condition.acquire()
+        try:
+            logger.debug(u'Failure')
+            self._running -= 1
+            self._error = error
+            logs.report(fatal=False)
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def __call__(self, processor, items, depends):
+        """Call processor on each item, after calling it on the items
+        returned by depends for it. Return the processor results.
+        """
+        items = list(items)
+        known = set(items)
+        self._ready = []
+        self._waiting = {}
+        self._dependents = {}
+        self._running = 0
+        self._results = []
+        self._error = None
+        for item in items:
+            waiting = set(filter(lambda i: i in known and i is not item,
+                                 depends(item)))
+            if waiting:
+                self._waiting[item] = waiting
+                for dependency in waiting:
+                    self._dependents.setdefault(dependency, []).append(item)
+            else:
+                self._ready.append(item)
+
+        if self._worker_count == 1 or len(items) < 2:
+            # Process everything in this thread.
+            while True:
+                item = self.get_work()
+                if item is WORK_DONE:
+                    break
+                self.mark_done(item, processor(item))
+        else:
+            workers = []
+            for count in range(min(len(items), self._worker_count)):
+                worker = DependencyTaskWorker(self, processor, count)
+                worker.start()
+                workers.append(worker)
+            for worker in workers:
+                worker.join()
+            if self._error is not None:
+                raise self._error
+        if self._waiting:
+            raise ConfigurationError(
+                u"Circular dependencies detected between parts",
+                ', '.join(sorted(map(lambda i: getattr(i, 'name', str(i)),
+                                     self._waiting))))
+        return self._results
+
+
+class DependencyTaskWorker(threading.Thread):
+    """Process items as long as some are ready.
+    """
+
+    def __init__(self, manager, processor, count):
+        super(DependencyTaskWorker, self).__init__(
+            name=''.join((manager.name, ' ', str(count))))
+        self.manager = manager
+        self.process = processor
+
+    def run(self):
+        logs.register(self.getName())
+        try:
+            while True:
+                task = self.manager.get_work()
+                if task is WORK_DONE:
+                    break
+                try:
+                    result = self.process(task)
+                except Exception, error:
+                    self.manager.mark_failed(error)
+                    break
+                self.manager.mark_done(task, result)
+        finally:
+            logs.unregister()
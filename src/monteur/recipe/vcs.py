@@ -7,7 +7,7 @@ from monteur.recipe.recipe import Recipe
 from monteur.vcs import VCSCheckout, VCS
 from monteur.vcs.error import VCSError
 from monteur.error import ConfigurationError
-from monteur.utils import create_directory
+from monteur.utils import create_directory, stat_cache
 from monteur.recipe.utils import MultiTask
 
 
@@ -88,3 +88,4 @@ class VersionSystemCheckout(Recipe):
         __status__ = u"Removing VCS directories."
         for path in self.status.installed_paths.as_list():
             shutil.rmtree(path)
+            stat_cache.invalidate(path)
@@ -3,9 +3,8 @@ import logging
 import os
 
 from monteur.archives import ARCHIVE_MANAGER
-from monteur.distribution.manifest import parse_manifest
+from monteur.distribution.manifest import compile_manifest
 from monteur.error import PackageError
-from monteur.recipe.utils import Paths
 
 logger = logging.getLogger('monteur')
 
@@ -16,10 +15,14 @@ def get_archive_manager(config, filename, mode):
     """Create an archive manager for correct selected format selected
     in the configuration.
     """
-    format = config['setup']['archive_format'].as_text()
+    setup = config['setup']
+    format = setup['archive_format'].as_text()
     if format not in ARCHIVE_MANAGER.keys():
         raise PackageError(u"Unknow package format %s" % format)
-    return ARCHIVE_MANAGER[format]('.'.join((filename, format,),), mode)
+    return ARCHIVE_MANAGER[format](
+        '.'.join((filename, format,),), mode,
+        workers=setup.get('archive_workers', '0').as_int(),
+        reproducible=setup.get('archive_reproducible', 'off').as_bool())
 
 
 class SourceDistribution(object):
@@ -37,9 +40,7 @@ class SourceDistribution(object):
         if 'manifest' in egginfo:
             manifest_name = egginfo['manifest'].as_file()
 
-        files = Paths(verify=False)
-        files.listdir(self.prefix)
-        return files.as_manifest(*parse_manifest(manifest_name))
+        return compile_manifest(manifest_name).walk(self.prefix)
 
     def run(self):
         basename = '%s-%s' % (self.package.name, self.package.version)
@@ -5,6 +5,7 @@ import sys
 import shutil
 
 from monteur.configuration import Configuration
+from monteur.configuration.cache import configurations, CACHE_DIRECTORY
 from monteur.distribution.workingset import working_set
 from monteur.utils import create_directory
 
@@ -69,7 +70,7 @@ class SessionConfiguration(Configuration):
             filename = os.path.join(directory, PREVIOUS_CONFIG_FILE)
             if os.path.isfile(filename):
                 logger.info(u'Loading previous configuration')
-                return Configuration.read(filename)
+                return configurations.read(Configuration, filename)
         return Configuration()
 
     def save(self, *ignore):
@@ -169,12 +170,15 @@ class Session(object):
                 sys.stderr.write('Cannot install default configuration.')
                 sys.exit(-1)
         logger.info(u'Reading default configuration.')
-        return Configuration.read(filename)
+        return configurations.read(Configuration, filename)
 
     def configure(self):
         assert self.configuration is None, u'Configuration already active.'
         logger.info(u'Reading configuration %s.', self.options.config)
-        self.configuration = SessionConfiguration.read(self.options.config)
+        configurations.open(os.path.join(
+                self.get_default_cfg_directory(), CACHE_DIRECTORY))
+        self.configuration = configurations.read(
+            SessionConfiguration, self.options.config)
         self.configuration += self.get_default_cfg()
         self.configuration.utilities.register('events', Events)
         self.events.bind(self.configuration.utilities.events)
@@ -7,11 +7,15 @@ import sys
 
 from monteur.session import Session
 from monteur.distribution.kgs import KGS
+from monteur.distribution.metadata import metadata, METADATA_FILE
 from monteur.distribution.workingset import working_set
 from monteur.distribution.release import current_package, Loaders
 from monteur.error import InstallationError, logs
 from monteur.recipe.commands import Installer
-from monteur.utils import create_directory
+from monteur.recipe.template import templates, TEMPLATE_DIRECTORY
+from monteur.setuptools.autotools import builder, AUTOTOOLS_DIRECTORY
+from monteur.utils import create_directory, stat_cache
+from monteur.vcs.mirror import mirrors, MIRROR_DIRECTORY
 from monteur.sources.sources import Sources
 from monteur.egginfo.commands import EggInfoCommand
 
@@ -87,6 +91,8 @@ def bootstrap(session):
 
     __status__ = u"Initialization configuration."
     utilities = configuration.utilities
+    stat_cache.reset()
+    utilities.events.subscribe('finish', stat_cache.log_usage)
     utilities.register('releases', Loaders)
     utilities.register('sources', Sources)
     utilities.register('kgs', KGS)
@@ -95,6 +101,33 @@ def bootstrap(session):
     utilities.events.subscribe('savepoint', configuration.save)
     utilities.events.subscribe('savepoint', logs.save)
 
+    # Package metadata cache
+    metadata.open(os.path.join(
+            configuration.get_previous_cfg_directory(), METADATA_FILE))
+    utilities.events.subscribe('finish', metadata.save)
+
+    # Compiled templates
+    templates.open(os.path.join(
+            configuration.get_previous_cfg_directory(), TEMPLATE_DIRECTORY))
+    utilities.events.subscribe('finish', templates.save)
+
+    # VCS mirrors, shared between environments
+    if 'vcs_mirror_directory' in setup:
+        mirrors.open(setup['vcs_mirror_directory'].as_text() or None)
+    else:
+        mirrors.open(os.path.join(
+                session.get_default_cfg_directory(), MIRROR_DIRECTORY))
+
+    # Extensions builds
+    jobs = setup.get('build_jobs', '0').as_int()
+    ccache = None
+    if 'build_ccache' in setup:
+        ccache = setup['build_ccache'].as_bool()
+    builder.open(
+        os.path.join(
+            configuration.get_previous_cfg_directory(), AUTOTOOLS_DIRECTORY),
+        jobs=jobs, ccache=ccache)
+
 
 class BootstrapCommand(object):
     """Basic command to bootstrap the project.
@@ -1,11 +1,15 @@
 
 import atexit
+import hashlib
 import logging
+import multiprocessing
 import operator
 import os
+import shutil
 import tempfile
+import time
 
-from monteur.utils import get_cmd_output
+from monteur.utils import get_cmd_output, have_cmd, create_directory
 from monteur.error import PackageError
 
 logger = logging.getLogger('monteur')
@@ -32,6 +36,15 @@ AUTOMAKE_OPTIONS = {'': """
 AUTOMAKE_OPTIONS = 1.10 foreign
 ACLOCAL_AMFLAGS=-I m4
 """}
+AUTOTOOLS_DIRECTORY = 'autotools'
+# Files created by autoreconf next to configure.ac.
+AUTORECONF_OUTPUTS = ('configure', 'aclocal.m4', 'config.h.in',
+                      'install-sh', 'missing', 'depcomp', 'compile',
+                      'config.guess', 'config.sub', 'ltmain.sh')
+AUTORECONF_MACROS = 'm4'
+# Files created in the source directory to remember what was done.
+AUTOTOOLS_STAMP = '.monteur-autotools'
+CONFIGURE_STAMP = '.monteur-configure'
 
 def relative_path(path_orig, path_dest):
     """Takes two path as list of ids and return a new path that is the
@@ -179,38 +192,223 @@ def create_autotools(distribution, source_prefix, extensions):
     macros_dir = os.path.join(working_dir, 'm4')
     if not os.path.isdir(macros_dir):
         os.makedirs(macros_dir)
-    python_m4 = os.path.join(os.path.dirname(__file__), 'python.m4')
-    # XXX os.link doesn't work on windaube
-    os.link(python_m4, os.path.join(macros_dir, 'python.m4'))
+    python_m4 = os.path.join(macros_dir, 'python.m4')
+    if not os.path.exists(python_m4):
+        # XXX os.link doesn't work on windaube
+        os.link(os.path.join(os.path.dirname(__file__), 'python.m4'),
+                python_m4)
 
-    stdout, stderr, code = get_cmd_output(
-        'autoreconf', '-v', '-f', '-i', path=working_dir)
-    if code:
-        raise PackageError(u"Autotools creation failed in %s." % working_dir)
+    builder.autoreconf(
+        working_dir, ['configure.ac', os.path.join('m4', 'python.m4')] +
+        map(lambda m: m + '.am', makefiles))
 
 
+def list_files(directory):
+    """Return a dictionary of all files in directory, relative to it,
+    with their modification time.
+    """
+    files = {}
+    for path, directories, filenames in os.walk(directory):
+        for filename in filenames:
+            full_filename = os.path.join(path, filename)
+            files[os.path.relpath(full_filename, directory)] = \
+                os.path.getmtime(full_filename)
+    return files
+
+
+def list_autoreconf_outputs(directory, inputs):
+    """Return the files generated by autoreconf in directory, relative
+    to it, out of the given inputs.
+    """
+    candidates = list(AUTORECONF_OUTPUTS)
+    for filename in inputs:
+        if filename.endswith('.am'):
+            candidates.append(filename[:-3] + '.in')
+    macros = os.path.join(directory, AUTORECONF_MACROS)
+    if os.path.isdir(macros):
+        candidates.extend(
+            os.path.join(AUTORECONF_MACROS, filename)
+            for filename in os.listdir(macros))
+    return [filename for filename in candidates
+            if filename not in inputs and
+            os.path.isfile(os.path.join(directory, filename))]
+
+
+def read_stamp(filename):
+    """Return the content of the stamp file filename.
+    """
+    stream = open(filename, 'r')
+    try:
+        return stream.read()
+    finally:
+        stream.close()
+
+
+def free_build_slots():
+    """Return the number of processors that are not busy.
+    """
+    try:
+        count = multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+    try:
+        count -= int(os.getloadavg()[0])
+    except (AttributeError, OSError):
+        pass
+    return max(count, 1)
+
 
 class AutomakeBuilder(object):
+    """Generate, configure and build autotools installations. Files
+    generated by autoreconf and configure results are cached in a
+    directory, and compiled objects with ccache if available.
+    """
 
     def __init__(self):
-        self.cache_name = tempfile.mkstemp('monteur.autotools.cache')[1]
-        atexit.register(os.remove, self.cache_name)
+        self.jobs = None
+        self.ccache = None
+        self.cache_directory = None
+        self._cache_name = None
+
+    def open(self, directory, jobs=None, ccache=None):
+        """Cache results in the given directory. Build with the given
+        number of jobs, and with ccache (None to use it if present).
+        """
+        self.cache_directory = directory
+        self.jobs = jobs
+        self.ccache = ccache
+
+    def get_jobs(self):
+        if self.jobs:
+            return self.jobs
+        return free_build_slots()
+
+    def get_ccache(self):
+        if self.ccache is None:
+            self.ccache = have_cmd('ccache', '--version')[0]
+        return self.ccache
+
+    def get_configure_cache(self, distribution, path, interpretor):
+        """Return the configure cache file to use to build
+        distribution in path with interpretor.
+        """
+        if self.cache_directory is None:
+            if self._cache_name is None:
+                self._cache_name = tempfile.mkdtemp(
+                    'monteur.autotools.cache')
+                atexit.register(shutil.rmtree, self._cache_name)
+            directory = self._cache_name
+        else:
+            directory = create_directory(
+                os.path.join(self.cache_directory, 'configure'))
+        # Configure results depend on the interpreter and the prefix.
+        target = hashlib.md5(
+            '\0'.join((str(interpretor), os.path.abspath(path)))).hexdigest()
+        return os.path.join(directory, '%s-%s-%s.cache' % (
+                distribution.name, distribution.version, target))
+
+    def autoreconf(self, working_dir, inputs):
+        """Run autoreconf in working_dir, unless the result for those
+        generated inputs is already available.
+        """
+        digest = hashlib.md5()
+        for filename in sorted(inputs):
+            digest.update(filename + '\0')
+            stream = open(os.path.join(working_dir, filename), 'rb')
+            try:
+                digest.update(stream.read())
+            finally:
+                stream.close()
+        digest = digest.hexdigest()
+        stamp = os.path.join(working_dir, AUTOTOOLS_STAMP)
+        if (os.path.isfile(stamp) and
+            os.path.isfile(os.path.join(working_dir, 'configure')) and
+            read_stamp(stamp) == digest):
+            logger.info(u"Autotools installation in %s is up to date.",
+                        working_dir)
+            return
+
+        cache_dir = None
+        if self.cache_directory is not None:
+            cache_dir = os.path.join(self.cache_directory, 'autoreconf', digest)
+        if cache_dir is not None and os.path.isdir(cache_dir):
+            logger.info(u"Using cached autotools installation for %s.",
+                        working_dir)
+            # Inputs must not look newer than what was generated from
+            # them, or make would regenerate everything again.
+            now = time.time()
+            for filename in inputs:
+                os.utime(os.path.join(working_dir, filename),
+                         (now - 1, now - 1))
+            for filename in list_files(cache_dir):
+                destination = os.path.join(working_dir, filename)
+                create_directory(os.path.dirname(destination))
+                shutil.copy2(os.path.join(cache_dir, filename), destination)
+                os.utime(destination, (now, now))
+        else:
+            stdout, stderr, code = get_cmd_output(
+                'autoreconf', '-v', '-f', '-i', path=working_dir)
+            if code:
+                raise PackageError(
+                    u"Autotools creation failed in %s." % working_dir)
+            if cache_dir is not None:
+                temporary_dir = tempfile.mkdtemp(
+                    'monteur.autotools', dir=create_directory(
+                        os.path.dirname(cache_dir)))
+                for filename in list_autoreconf_outputs(working_dir, inputs):
+                    destination = os.path.join(temporary_dir, filename)
+                    create_directory(os.path.dirname(destination))
+                    shutil.copy2(
+                        os.path.join(working_dir, filename), destination)
+                try:
+                    os.rename(temporary_dir, cache_dir)
+                except OSError:
+                    # Somebody else cached it in the mean time.
+                    shutil.rmtree(temporary_dir)
+        stream = open(stamp, 'w')
+        try:
+            stream.write(digest)
+        finally:
+            stream.close()
 
     def build(self, distribution, path, interpretor):
         working_dir = distribution.package_path
         logger.info("Building extensions in %s" % working_dir)
         environ = {'PYTHON': str(interpretor)}
+        if self.get_ccache():
+            environ['CC'] = 'ccache ' + os.environ.get('CC', 'cc')
+            # Let objects compiled in other directories be reused.
+            environ['CCACHE_BASEDIR'] = os.path.abspath(working_dir)
+
+        # Configure only if needed.
+        configure = os.path.join(working_dir, 'configure')
+        status = os.path.join(working_dir, 'config.status')
+        stamp = os.path.join(working_dir, CONFIGURE_STAMP)
+        arguments = ['--prefix=%s' % path,
+                     '--cache-file=%s' % self.get_configure_cache(
+                         distribution, path, interpretor)]
+        signature = '\n'.join(arguments + map(
+                '='.join, sorted(environ.items())))
+        if (os.path.isfile(status) and os.path.isfile(stamp) and
+            os.path.getmtime(status) >= os.path.getmtime(configure) and
+            read_stamp(stamp) == signature):
+            logger.info(u"Extensions are already configured in %s.",
+                        working_dir)
+        else:
+            stdout, stderr, code = get_cmd_output(
+                './configure', *arguments,
+                path=working_dir, environ=environ, no_stdout=True)
+            if code:
+                raise PackageError(
+                    u"Extensions configuration failed for %s." % distribution)
+            stream = open(stamp, 'w')
+            try:
+                stream.write(signature)
+            finally:
+                stream.close()
         stdout, stderr, code = get_cmd_output(
-            'configure',
-            '--prefix=%s' % path,
-            '--cache-file=%s' % self.cache_name,
+            'make', '-j%d' % self.get_jobs(),
             path=working_dir, environ=environ, no_stdout=True)
-        if code:
-            raise PackageError(
-                u"Extensions configuration failed for %s." % distribution)
-        stdout, stderr, code = get_cmd_output(
-            'make',
-            path=working_dir, no_stdout=True)
         if code:
             raise PackageError(
                 u"Extensions build failed for %s." % distribution)
@@ -227,3 +425,4 @@ class AutomakeBuilder(object):
                 u"Extensions installation failed for %s." % distribution)
 
 
+builder = AutomakeBuilder()
@@ -1,11 +1,13 @@
 
 import os
 import logging
+import StringIO
 
 from monteur.configuration import Configuration
 from monteur.python import PythonInterpreter
 from monteur.setuptools.autotools import create_autotools
 from monteur.setuptools import unsetuptoolize
+from monteur.setuptools.static import read_setup
 from monteur.version import Version, Requirements
 
 logger = logging.getLogger('monteur')
@@ -13,9 +15,10 @@ logger = logging.getLogger('monteur')
 
 class InterpretedSetuptoolsLoader(object):
 
-    def __init__(self, path, source):
+    def __init__(self, path, source, distribution):
         self.path = path
         self.source = source
+        self.distribution = distribution
 
     def extensions(self, prefix, section):
         __status__ = u"Introspecting distutils/setuptools extensions."
@@ -65,7 +68,8 @@ class InterpretedSetuptoolsLoader(object):
                               'includes': includes})
         return extensions
 
-    def load(self, distribution, interpretor):
+    def load(self):
+        distribution = self.distribution
         distribution.package_path = self.path
 
         # Read extracted configuration
@@ -85,6 +89,7 @@ class InterpretedSetuptoolsLoader(object):
                     extra_requirements.as_list())
 
         # Look for source directory
+        prefix = ''
         if 'package_dir' in setuptool_config:
             package_config = config[
                 setuptool_config['package_dir'].as_text()]
@@ -113,19 +118,37 @@ class InterpretedSetuptoolsLoader(object):
         raise NotImplementedError
 
 
+def serialize_setup(arguments):
+    """Serialize arguments given to setup like unsetuptoolize does.
+    """
+    stream = StringIO.StringIO()
+    setup = unsetuptoolize.export_setup('setuptools', stream)
+    setup(**arguments)
+    return stream.getvalue()
+
+
 class InterpretedSetuptoolsLoaderFactory(object):
     """Load a setuptool source package.
     """
 
-    def __call__(self, distribution, path, interpreter):
+    def __init__(self, options):
+        self.options = options
+
+    def __call__(self, distribution, path, interpreter, trust=-99):
         setup_py = os.path.join(path, 'setup.py')
         if os.path.isfile(setup_py):
+            # Declarative setup.py are read without being run.
+            arguments = read_setup(path)
+            if arguments is not None:
+                return InterpretedSetuptoolsLoader(
+                    path, serialize_setup(arguments), distribution)
             interpretor = PythonInterpreter.detect()
             # XXX Review this
             source, _, code = interpretor.execute_module(
                 unsetuptoolize, '-d', path)
             if not code:
                 if source:
-                    return InterpretedSetuptoolsLoader(path, source)
+                    return InterpretedSetuptoolsLoader(
+                        path, source, distribution)
             logger.debug(u"Missing setuptools configuration in  %s, " % path)
         return None
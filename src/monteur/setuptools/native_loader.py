@@ -1,29 +1,97 @@
 
+import hashlib
 import logging
 import os
 import shutil
 
+from monteur.distribution.metadata import metadata
 from monteur.egginfo.loader import EggLoader
 from monteur.error import InstallationError, PackageError
+from monteur.setuptools.static import read_setup, read_setup_argument
 from monteur.utils import have_cmd, get_cmd_output
 from monteur.utils import open_uri, create_directory
+from monteur.version import Version, Requirements
 
 
 logger = logging.getLogger('monteur')
 
-def find_egg_info(distribution, base_path):
-    """Go through a path to find an egg-info directory.
+# Directories that never contain an egg-info directory.
+PRUNED_DIRECTORIES = set(('.git', '.hg', '.svn', '.bzr', 'CVS', '_darcs',
+                          'build', 'dist', 'doc', 'docs', 'data',
+                          'test', 'tests', 'testdata', 'examples',
+                          'node_modules', '__pycache__'))
+# How deep to look for an egg-info directory if it is not at a
+# usual location.
+MAX_EGG_INFO_DEPTH = 4
+
+
+def find_egg_info(distribution, base_path, package_dirs=None):
+    """Go through a path to find an egg-info directory. Usual
+    locations (the root, package_dir roots and src) are tried first,
+    then the tree is searched up to a limited depth, skipping
+    directories that are not likely to contain it.
     """
     # We need to be case insensitif here as well.
     # Setuptools replace - with _ (why ?)
     wanted_directory = (distribution.name.replace('-', '_') +
                         '.egg-info').lower()
-    for path, directories, filenames in os.walk(base_path):
-        for directory in directories:
-            if wanted_directory == directory.lower():
-                return path, os.path.join(path, directory)
+
+    def lookup(path):
+        # Return the egg-info in path, and the names in path.
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return None, []
+        for name in names:
+            if name.lower() == wanted_directory:
+                candidate = os.path.join(path, name)
+                if os.path.isdir(candidate):
+                    return candidate, names
+        return None, names
+
+    base_path = os.path.normpath(base_path)
+    if package_dirs is None:
+        package_dirs = read_setup_argument(base_path, 'package_dir', {})
+    candidates = ['']
+    if isinstance(package_dirs, dict) and \
+            isinstance(package_dirs.get(''), basestring):
+        candidates.append(package_dirs[''])
+    candidates.append('src')
+    seen = set()
+    listings = {}
+    for candidate in candidates:
+        path = os.path.normpath(os.path.join(base_path, candidate))
+        if path in seen:
+            continue
+        seen.add(path)
+        egg_info, names = lookup(path)
+        if egg_info is not None:
+            return path, egg_info
+        listings[path] = names
+
+    # Not at a usual location, search a bit more.
+    queue = [(base_path, listings[base_path], 0)]
+    while queue:
+        path, names, depth = queue.pop(0)
+        if depth >= MAX_EGG_INFO_DEPTH:
+            continue
+        for name in sorted(names):
+            if name in PRUNED_DIRECTORIES or name.startswith('.'):
+                continue
+            directory = os.path.join(path, name)
+            if not os.path.isdir(directory) or os.path.islink(directory):
+                continue
+            if directory in seen:
+                egg_info, names = None, listings[directory]
+            else:
+                seen.add(directory)
+                egg_info, names = lookup(directory)
+            if egg_info is not None:
+                return directory, egg_info
+            queue.append((directory, names, depth + 1))
     return None, None
 
+
 def create_manifest_from_source(source_file, manifest_file):
     """Create a missing manifest file from an existing source file.
     """
@@ -51,7 +119,8 @@ class NativeSetuptoolsLoader(EggLoader):
 
     def install(self, path):
         # Remove egg_info to prevent strange things to happen
-        shutil.rmtree(self.egg_info)
+        if self.egg_info is not None and os.path.isdir(self.egg_info):
+            shutil.rmtree(self.egg_info)
 
         create_directory(path)
         output, errors, code = self.execute(
@@ -64,6 +133,39 @@ class NativeSetuptoolsLoader(EggLoader):
                 detail='\n'.join((output, errors)))
 
 
+class StaticSetuptoolsLoader(NativeSetuptoolsLoader):
+    """Load a setuptool source package from the arguments given to
+    setup, without running it.
+    """
+
+    def __init__(self, path, arguments, distribution, execute=None, key=None):
+        super(StaticSetuptoolsLoader, self).__init__(
+            path, None, distribution, execute=execute, key=key)
+        self.arguments = arguments
+
+    def load(self):
+        self.distribution.package_path = self.path
+        if metadata.restore(self.key, self.distribution):
+            return self.distribution
+        arguments = self.arguments
+        self.distribution.name = arguments['name']
+        self.distribution.version = Version.parse(arguments['version'])
+        self.distribution.summary = arguments.get('description', '')
+        self.distribution.author = arguments.get('author', '')
+        self.distribution.author_email = arguments.get('author_email', '')
+        self.distribution.license = arguments.get('license', '')
+        self.distribution.path = os.path.abspath(os.path.join(
+                self.path, arguments['package_dir'].get('', '')))
+        self.distribution.entry_points = arguments['entry_points']
+        self.distribution.requirements = Requirements.parse(
+            arguments['install_requires'])
+        self.distribution.extras = dict(
+            (extra, Requirements.parse(requirements))
+            for extra, requirements in arguments['extras_require'].items())
+        metadata.store(self.key, self.distribution)
+        return self.distribution
+
+
 class NativeSetuptoolsLoaderFactory(object):
     """Load a setuptool source package.
     """
@@ -72,11 +174,14 @@ class NativeSetuptoolsLoaderFactory(object):
         self.options = options
         self.version = None
         self.errors = False
+        self.static = True
         self.environ = {}
         self.patches = {}
         if options is not None:
             if 'errors' in options:
                 self.errors = options['errors'].as_bool()
+            if 'static' in options:
+                self.static = options['static'].as_bool()
             if 'version' in options:
                 self.version = options['version'].as_str()
             if 'environ' in options:
@@ -100,21 +205,6 @@ class NativeSetuptoolsLoaderFactory(object):
     def __call__(self, distribution, path, interpretor, trust=-99):
         setup_py = os.path.join(path, 'setup.py')
         if os.path.isfile(setup_py):
-            # You need to clean first the egg_info. install_requires
-            # will trigger strange things only if it exists.
-            egg_info_parent, egg_info = find_egg_info(distribution, path)
-            if egg_info is not None and os.path.isdir(egg_info):
-                # We will use the egg SOURCES.txt as input for a
-                # MANIFEST. Most of packages miss one or have a
-                # incomplete one and won't install everything without
-                # one.
-                if trust < 0:
-                    source_file = os.path.join(egg_info, 'SOURCES.txt')
-                    manifest_file = os.path.join(path, 'MANIFEST.in')
-                    if os.path.isfile(source_file):
-                        create_manifest_from_source(source_file, manifest_file)
-                shutil.rmtree(egg_info)
-
             # Determine which version of setuptools to use
             version = None
             environ = self.environ.get(distribution.name, {})
@@ -130,29 +220,75 @@ class NativeSetuptoolsLoaderFactory(object):
                 return interpretor.execute_setuptools(
                     *command, **kwargs)
 
+            # Metadata of an unchanged checkout doesn't need egg_info,
+            # and must not touch it.
+            key = distribution.metadata_key
+            if key in metadata:
+                return NativeSetuptoolsLoader(
+                    path, None, distribution, execute=execute, key=key)
+
+            package_dirs = read_setup_argument(path, 'package_dir', {})
+            egg_info_parent, egg_info = find_egg_info(
+                distribution, path, package_dirs)
+            if egg_info is not None and os.path.isdir(egg_info):
+                # We will use the egg SOURCES.txt as input for a
+                # MANIFEST. Most of packages miss one or have a
+                # incomplete one and won't install everything without
+                # one.
+                if trust < 0:
+                    source_file = os.path.join(egg_info, 'SOURCES.txt')
+                    manifest_file = os.path.join(path, 'MANIFEST.in')
+                    if os.path.isfile(source_file):
+                        create_manifest_from_source(source_file, manifest_file)
+
             # Apply patches
-            if distribution.name in self.patches:
-                for patch in self.patches[distribution.name]:
-                    stream = open_uri(patch)
-                    try:
-                        output, errors, code = get_cmd_output(
-                            'patch', '-p0', path=path, input=stream.read())
-                    finally:
-                        stream.close()
-                    if code:
-                        raise InstallationError(
-                            u'Error while patching setuptools egg %s.' % (
-                                distribution.name),
-                            detail='\n'.join((output, errors)))
+            patches = []
+            for patch in self.patches.get(distribution.name, []):
+                stream = open_uri(patch)
+                try:
+                    patches.append(stream.read())
+                finally:
+                    stream.close()
+                output, errors, code = get_cmd_output(
+                    'patch', '-p0', path=path, input=patches[-1])
+                if code:
+                    raise InstallationError(
+                        u'Error while patching setuptools egg %s.' % (
+                            distribution.name),
+                        detail='\n'.join((output, errors)))
+
+            # Metadata of an already seen archive doesn't need egg_info.
+            if distribution.archive is not None:
+                key = metadata.archive_key(distribution.archive)
+                if key is not None and patches:
+                    # Patches might change the metadata.
+                    key += ':' + hashlib.md5('\0'.join(patches)).hexdigest()
+                if key in metadata:
+                    return NativeSetuptoolsLoader(
+                        path, None, distribution, execute=execute, key=key)
+
+            # Declarative setup.py don't need to be run to be known.
+            if self.static:
+                arguments = read_setup(path)
+                if arguments is not None:
+                    return StaticSetuptoolsLoader(
+                        path, arguments, distribution,
+                        execute=execute, key=key)
+
+            # You need to clean first the egg_info. install_requires
+            # will trigger strange things only if it exists.
+            if egg_info is not None and os.path.isdir(egg_info):
+                shutil.rmtree(egg_info)
 
             # Get fresh egg_info
             output, errors, code = execute('egg_info', path=path)
             if not code:
-                egg_info_parent, egg_info = find_egg_info(distribution, path)
+                egg_info_parent, egg_info = find_egg_info(
+                    distribution, path, package_dirs)
                 if egg_info is not None and os.path.isdir(egg_info):
                     return NativeSetuptoolsLoader(
                         path, egg_info, distribution,
-                        source_path=egg_info_parent, execute=execute)
+                        source_path=egg_info_parent, execute=execute, key=key)
                 else:
                     logger.debug(
                         u"Could not find egg-info in  %s, " % (path))
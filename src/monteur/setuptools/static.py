@@ -0,0 +1,318 @@
+
+import ast
+import ConfigParser
+import os
+import logging
+
+logger = logging.getLogger('monteur')
+
+# setup() arguments that must be known to describe a package.
+REQUIRED_ARGUMENTS = ('name', 'version')
+# setup() arguments used to load a package.
+METADATA_ARGUMENTS = ('name', 'version', 'install_requires', 'extras_require',
+                      'entry_points', 'package_dir', 'description',
+                      'author', 'author_email', 'license')
+# setup() arguments that need more than metadata to be installed.
+UNSUPPORTED_ARGUMENTS = ('ext_modules', 'features', 'setup_requires',
+                         'cmdclass', 'distclass', 'use_2to3')
+SETUP_NAMES = ('setup',)
+# setup.cfg sections that can complete the arguments given to setup().
+DECLARATIVE_SECTIONS = ('metadata', 'options')
+
+
+class DynamicSetup(Exception):
+    """The setup.py cannot be understood without running it.
+    """
+
+
+class LiteralEvaluator(object):
+    """Evaluate an AST expression made of literals and of names
+    assigned to literals at module level.
+    """
+
+    def __init__(self, names):
+        self.names = names
+
+    def __call__(self, node):
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            raise DynamicSetup(node.__class__.__name__)
+        return method(node)
+
+    def visit_Str(self, node):
+        return node.s
+
+    def visit_Num(self, node):
+        return node.n
+
+    def visit_List(self, node):
+        return map(self, node.elts)
+
+    def visit_Tuple(self, node):
+        return tuple(map(self, node.elts))
+
+    def visit_Dict(self, node):
+        return dict(zip(map(self, node.keys), map(self, node.values)))
+
+    def visit_Name(self, node):
+        if node.id in ('True', 'False', 'None'):
+            return {'True': True, 'False': False, 'None': None}[node.id]
+        if node.id in self.names:
+            return self(self.names[node.id])
+        raise DynamicSetup(node.id)
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, ast.Add):
+            left = self(node.left)
+            right = self(node.right)
+            if type(left) is type(right) and isinstance(
+                left, (basestring, list, tuple)):
+                return left + right
+        raise DynamicSetup('operation')
+
+
+def find_setup_call(tree):
+    """Return the only call to setup in the module.
+    """
+    calls = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            function = node.func
+            if isinstance(function, ast.Attribute):
+                name = function.attr
+            elif isinstance(function, ast.Name):
+                name = function.id
+            else:
+                continue
+            if name in SETUP_NAMES:
+                calls.append(node)
+    if len(calls) != 1:
+        raise DynamicSetup('setup calls')
+    return calls[0]
+
+
+def find_literal_names(tree, call=None):
+    """Return names that are assigned only once at module level, and
+    never modified afterwards (reassigned, augmented, changed by item
+    or attribute, used to call a method or given to a function other
+    than setup).
+    """
+    names = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+                isinstance(node.targets[0], ast.Name):
+            names[node.targets[0].id] = node.value
+    assigned = set()
+    modified = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, (ast.Store, ast.Del, ast.Param)):
+                if node.id in assigned:
+                    modified.add(node.id)
+                assigned.add(node.id)
+        elif isinstance(node, (ast.Subscript, ast.Attribute)):
+            if isinstance(node.value, ast.Name) and \
+                    not isinstance(node.ctx, ast.Load):
+                modified.add(node.value.id)
+        elif isinstance(node, ast.AugAssign):
+            for name in ast.walk(node.target):
+                if isinstance(name, ast.Name):
+                    modified.add(name.id)
+        elif isinstance(node, ast.Call):
+            function = node.func
+            if isinstance(function, ast.Attribute) and \
+                    isinstance(function.value, ast.Name):
+                modified.add(function.value.id)
+            if node is not call:
+                arguments = list(node.args)
+                arguments.extend(keyword.value for keyword in node.keywords)
+                arguments.extend(filter(None, [node.starargs, node.kwargs]))
+                for argument in arguments:
+                    if isinstance(argument, ast.Name):
+                        modified.add(argument.id)
+    for name in modified:
+        names.pop(name, None)
+    return names
+
+
+def parse_entry_points(value):
+    """Normalize entry points given to setup into a dictionary of
+    groups to dictionaries of names.
+    """
+    if isinstance(value, basestring):
+        entry_points = {}
+        group = None
+        for line in value.splitlines():
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line[0] == '[' and line[-1] == ']':
+                group = entry_points.setdefault(line[1:-1].strip(), {})
+            elif group is not None and '=' in line:
+                name, target = line.split('=', 1)
+                group[name.strip()] = target.strip()
+            else:
+                raise DynamicSetup('entry_points')
+        return entry_points
+    if isinstance(value, dict):
+        entry_points = {}
+        for group, lines in value.items():
+            if isinstance(lines, basestring):
+                lines = lines.splitlines()
+            points = entry_points.setdefault(group, {})
+            for line in lines:
+                if not line.strip():
+                    continue
+                if '=' not in line:
+                    raise DynamicSetup('entry_points')
+                name, target = line.split('=', 1)
+                points[name.strip()] = target.strip()
+        return entry_points
+    raise DynamicSetup('entry_points')
+
+
+def parse_requirements(value):
+    """Normalize requirements given to setup into a list.
+    Requirements with an environment marker are left to egg_info,
+    which turns them into conditional extras.
+    """
+    if isinstance(value, basestring):
+        value = value.splitlines()
+    if not isinstance(value, (list, tuple)):
+        raise DynamicSetup('requirements')
+    for requirement in value:
+        if not isinstance(requirement, basestring) or ';' in requirement:
+            raise DynamicSetup('requirements')
+    return filter(None, map(lambda s: s.strip(), value))
+
+
+def analyse_setup(source, filename='setup.py'):
+    """Statically analyse the source of a setup.py and return the
+    arguments given to setup used to describe the package. Raise
+    DynamicSetup if the file needs to be executed to know them.
+    """
+    try:
+        tree = ast.parse(source, filename)
+    except SyntaxError:
+        raise DynamicSetup('syntax')
+    call = find_setup_call(tree)
+    if call.args or call.starargs or call.kwargs:
+        raise DynamicSetup('arguments')
+    evaluate = LiteralEvaluator(find_literal_names(tree, call))
+    arguments = {}
+    for keyword in call.keywords:
+        if keyword.arg in UNSUPPORTED_ARGUMENTS:
+            raise DynamicSetup(keyword.arg)
+        if keyword.arg not in METADATA_ARGUMENTS:
+            continue
+        try:
+            arguments[keyword.arg] = evaluate(keyword.value)
+        except DynamicSetup:
+            if keyword.arg in ('description', 'author', 'author_email',
+                               'license'):
+                # Only informative, we can live without it.
+                continue
+            raise
+    for name in REQUIRED_ARGUMENTS:
+        if not isinstance(arguments.get(name), basestring):
+            raise DynamicSetup(name)
+    arguments['install_requires'] = parse_requirements(
+        arguments.get('install_requires', []))
+    extras = arguments.get('extras_require', {})
+    if not isinstance(extras, dict):
+        raise DynamicSetup('extras_require')
+    arguments['extras_require'] = dict(
+        (extra, parse_requirements(requirements))
+        for extra, requirements in extras.items())
+    arguments['entry_points'] = parse_entry_points(
+        arguments.get('entry_points', {}))
+    package_dir = arguments.get('package_dir', {})
+    if not isinstance(package_dir, dict):
+        raise DynamicSetup('package_dir')
+    arguments['package_dir'] = package_dir
+    return arguments
+
+
+def have_declarative_setup(path):
+    """Return true if a setup.cfg in path completes the setup.py.
+    """
+    filename = os.path.join(path, 'setup.cfg')
+    if not os.path.isfile(filename):
+        return False
+    parser = ConfigParser.RawConfigParser()
+    try:
+        parser.read(filename)
+    except ConfigParser.Error:
+        return True
+    for section in DECLARATIVE_SECTIONS:
+        if parser.has_section(section):
+            return True
+    return False
+
+
+def analyse_setup_argument(source, name, filename='setup.py'):
+    """Statically analyse the source of a setup.py and return the
+    value of only one argument given to setup. Raise DynamicSetup if
+    it cannot be known without running the file.
+    """
+    try:
+        tree = ast.parse(source, filename)
+    except SyntaxError:
+        raise DynamicSetup('syntax')
+    call = find_setup_call(tree)
+    for keyword in call.keywords:
+        if keyword.arg == name:
+            evaluate = LiteralEvaluator(find_literal_names(tree, call))
+            return evaluate(keyword.value)
+    if call.kwargs:
+        raise DynamicSetup('arguments')
+    raise KeyError(name)
+
+
+def read_setup_source(path):
+    """Return the source of the setup.py located in path, or None.
+    """
+    filename = os.path.join(path, 'setup.py')
+    try:
+        stream = open(filename, 'r')
+    except IOError:
+        return None
+    try:
+        return stream.read().replace('\r\n', '\n')
+    finally:
+        stream.close()
+
+
+def read_setup(path):
+    """Read the setup.py located in path and return the arguments
+    given to setup, or None if it cannot be done without running it.
+    """
+    filename = os.path.join(path, 'setup.py')
+    if have_declarative_setup(path):
+        logger.debug(u"Cannot analyse %s without running it (setup.cfg).",
+                     filename)
+        return None
+    source = read_setup_source(path)
+    if source is None:
+        return None
+    try:
+        return analyse_setup(source, filename)
+    except DynamicSetup, error:
+        logger.debug(
+            u"Cannot analyse %s without running it (%s).", filename, error)
+        return None
+
+
+def read_setup_argument(path, name, default=None):
+    """Read the setup.py located in path and return the value of the
+    argument name given to setup, or default if it cannot be done
+    without running it.
+    """
+    source = read_setup_source(path)
+    if source is None:
+        return default
+    try:
+        return analyse_setup_argument(
+            source, name, os.path.join(path, 'setup.py'))
+    except (DynamicSetup, KeyError):
+        return default
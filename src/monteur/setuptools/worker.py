@@ -0,0 +1,73 @@
+
+if __name__ == "__main__":
+    # Long running version of setuptoolize: setuptools is loaded
+    # once, and each command received on stdin is run in a forked
+    # process, reporting its output on the original stdout.
+    import sys, os, imp, cPickle, tempfile, traceback
+    python_path = os.environ.get('PYTHONPATH')
+    if python_path:
+        imp.load_module(
+            'setuptools',
+            *imp.find_module('setuptools', [python_path]))
+    else:
+        __import__('setuptools')
+
+    # Keep the original stdout to answer, commands output goes elsewhere.
+    requests = os.fdopen(os.dup(0), 'rb')
+    answers = os.fdopen(os.dup(1), 'wb')
+    null = os.open(os.devnull, os.O_RDWR)
+    os.dup2(null, 0)
+    os.dup2(null, 1)
+
+    def run(arguments, path, environ):
+        # This runs in the forked process and never returns.
+        code = 0
+        try:
+            os.chdir(path)
+            os.environ.update(environ)
+            # Add the current directory to sys.path, for pseudo clever scripts
+            sys.path[0] = path
+            # Some scripts try to be even clever.
+            sys.argv = [os.path.join(path, 'setup.py')] + list(arguments)
+            imp.load_source('__main__', 'setup.py')
+        except SystemExit, error:
+            code = error.code
+            if code is None:
+                code = 0
+            elif not isinstance(code, int):
+                sys.stderr.write(str(code) + '\n')
+                code = 1
+        except:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+    while True:
+        try:
+            request = cPickle.load(requests)
+        except EOFError:
+            break
+        if request is None:
+            break
+        arguments, path, environ = request
+        output = tempfile.TemporaryFile()
+        errors = tempfile.TemporaryFile()
+        pid = os.fork()
+        if not pid:
+            os.dup2(output.fileno(), 1)
+            os.dup2(errors.fileno(), 2)
+            run(arguments, path, environ)
+        pid, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            code = -os.WTERMSIG(status)
+        else:
+            code = os.WEXITSTATUS(status)
+        output.seek(0)
+        errors.seek(0)
+        cPickle.dump((output.read(), errors.read(), code), answers, 2)
+        answers.flush()
+        output.close()
+        errors.close()
+    sys.exit(0)
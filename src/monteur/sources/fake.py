@@ -5,6 +5,7 @@ import os
 from monteur.distribution.release import Release
 from monteur.egginfo.write import write_egg_info
 from monteur.sources import Installers, Source, Query
+from monteur.utils import stat_cache
 from monteur.version import Version, Requirements
 
 
@@ -42,6 +43,7 @@ class FakeInstaller(object):
         if not os.path.isdir(install_path):
             os.makedirs(install_path)
         write_egg_info(distribution, package_path=install_path)
+        stat_cache.invalidate(install_path)
 
         # Package path is now the installed path
         distribution.path = install_path
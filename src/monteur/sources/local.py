@@ -6,7 +6,7 @@ from monteur.sources.utils import (
     parse_filename,
     UninstalledPackageInstaller,
     PackageInstaller)
-from monteur.utils import create_directory
+from monteur.utils import create_directory, stat_cache
 
 
 class LocalSource(Source):
@@ -28,7 +28,7 @@ class LocalSource(Source):
         """
         for filename in os.listdir(path):
             full_path = os.path.join(path, filename)
-            if not os.path.isfile(full_path):
+            if not stat_cache.isfile(full_path):
                 continue
             information = parse_filename(filename, url=full_path)
             if information:
@@ -66,7 +66,7 @@ class EggsSource(LocalSource):
         """
         for filename in os.listdir(path):
             full_path = os.path.join(path, filename)
-            if not os.path.isdir(full_path):
+            if not stat_cache.isdir(full_path):
                 continue
             information = parse_filename(filename, path=full_path)
             if information:
@@ -165,6 +165,8 @@ class QueryContext(object):
         self.releases = source.options.utilities.releases
         self.priority = priority
         self.trust = trust
+        # Strategy used by the queries, set once the context is created.
+        self.strategy = STRATEGY_UPDATE
 
     def load(self, distribution):
         """Load distribution metadata.
@@ -274,13 +276,15 @@ class Sources(object):
                     self.sources))
         return self._uptodate
 
-    def __call__(self, interpretor, path):
+    def __call__(self, interpretor, path, strategy=STRATEGY_UPDATE):
         """Return an object Queries that can be used to lookup
-        packages to install.
+        packages to install with the given strategy.
         """
         queries = []
         for priority, source in enumerate(self.sources):
-            query = source.prepare(source.create(interpretor, path, priority))
+            context = source.create(interpretor, path, priority)
+            context.strategy = strategy
+            query = source.prepare(context)
             if query is None:
                 continue
             queries.append(query)
@@ -6,7 +6,9 @@ import tempfile
 import shutil
 
 from monteur.archives import ARCHIVE_MANAGER
+from monteur.distribution.metadata import metadata
 from monteur.distribution.release import Release
+from monteur.egginfo.read import read_archive_egg_info
 from monteur.error import PackageError
 from monteur.version import Version, InvalidVersion
 
@@ -124,8 +126,27 @@ class UninstalledPackageInstaller(ExtractedPackageInstaller):
                 u"Don't know how to read package file %s, " \
                 u"unknown format %s." % (archive, format))
         extractor = factory(archive, 'r')
+
+        self.informations['archive'] = archive
+
+        # If the archive metadata is known, its dependencies can be
+        # scheduled right now, while we extract and build it.
+        preview = Release(**self.informations)
+        if metadata.restore(metadata.archive_key(archive), preview):
+            install_dependencies(preview)
+        else:
+            included = read_archive_egg_info(
+                extractor, self.informations['name'])
+            if included is not None:
+                logger.debug(
+                    u"Using metadata included in archive %s" % archive)
+                preview.requirements = included['requirements']
+                preview.extras = included['extras']
+                install_dependencies(preview)
+
         build_dir = tempfile.mkdtemp('monteur')
         extractor.extract(build_dir)
+        extractor.close()
 
         # Archive name without extension, paying attention to .tar.gz
         # (so can't use os.path.splitext)
@@ -1,4 +1,13 @@
 
+import fnmatch
+import hashlib
+import os
+import sys
+import threading
+
+from monteur.distribution.metadata import metadata
+from monteur.download import compute_checksum
+from monteur.error import logs
 from monteur.sources import Installers, Source, QueryContext, STRATEGY_QUICK
 from monteur.utils import create_directory
 from monteur.vcs import VCS, VCSCheckout
@@ -6,6 +15,56 @@ from monteur.version import keyify
 from monteur.distribution.release import Release
 
 marker = object()
+# Files created while loading or building a package, that don't
+# change its content.
+BUILD_PATTERNS = ('*.pyc', '*.pyo', '*.so', '*.pyd', '*.dylib', '*.o',
+                  '*.egg-info', '*.egg-info/*', '*__pycache__/*',
+                  'build/*', 'dist/*')
+
+
+def is_build_output(path):
+    """Tell if the given relative path is created by building a
+    package.
+    """
+    for pattern in BUILD_PATTERNS:
+        if fnmatch.fnmatch(path, pattern):
+            return True
+    return False
+
+
+def get_checkout_key(repository, interpretor):
+    """Return a key identifying the content of a checkout, made of
+    its revision and a digest of its local modifications, or None if
+    it cannot be computed.
+    """
+    state = repository.get_state()
+    if state.revision is None:
+        return None
+    changes = repository.get_changes()
+    if changes is None:
+        return None
+    checksum = hashlib.md5()
+    for change in sorted(changes):
+        filenames = [change]
+        path = os.path.join(repository.directory, change)
+        if os.path.isdir(path):
+            filenames = []
+            for directory, directories, names in os.walk(path):
+                for name in names:
+                    filenames.append(os.path.relpath(
+                            os.path.join(directory, name),
+                            repository.directory))
+        for filename in sorted(filenames):
+            if is_build_output(filename):
+                continue
+            checksum.update(filename + '\0')
+            path = os.path.join(repository.directory, filename)
+            if os.path.isfile(path):
+                checksum.update(compute_checksum(path))
+            checksum.update('\0')
+    return 'vcs:%s:%s:%s:%s' % (
+        os.path.abspath(repository.directory), interpretor.get_version(),
+        state.revision, checksum.hexdigest())
 
 
 class SourceInstaller(object):
@@ -32,8 +91,12 @@ class SourceInstaller(object):
     def install(self, install_dependencies):
         install_dependencies(self.release)
         if self.context.develop:
-            # Build files in place
-            self.loader.build(self.release.path)
+            # Build files in place, if the checkout changed
+            key = self.release.metadata_key
+            path = self.release.package_path
+            if not metadata.restore_build(key, path):
+                self.loader.build(self.release.path)
+                metadata.store_build(key, path)
         else:
             # Install files
             install_path = self.context.get_install_path(self.release)
@@ -46,18 +109,86 @@ class SourceInstaller(object):
         return self.release, self.loader
 
 
+class VCSFetch(object):
+    """Fetch or update a checkout only once, and let everybody else
+    wait for it to be done.
+    """
+
+    def __init__(self, repository, update):
+        self.repository = repository
+        self.update = update
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._started = False
+        self._error = None
+
+    def start(self):
+        """Fetch or update the checkout, unless it is already done
+        or being done.
+        """
+        self._lock.acquire()
+        try:
+            if self._started:
+                return
+            self._started = True
+        finally:
+            self._lock.release()
+        try:
+            self.repository(update=self.update)
+        except Exception:
+            self._error = sys.exc_info()
+        self._done.set()
+
+    def __call__(self):
+        """Return the checkout once it is fetched or updated.
+        """
+        self.start()
+        self._done.wait()
+        if self._error is not None:
+            cls, error, trace = self._error
+            raise cls, error, trace
+        return self.repository
+
+
+class VCSPrefetchWorker(threading.Thread):
+    """Fetch or update checkouts in the background. The worker is
+    not a daemon, so a fetch is never interrupted when the program
+    ends, but it stops taking new ones when the thread that started
+    it is gone: they are done on demand.
+    """
+
+    def __init__(self, fetches, count):
+        super(VCSPrefetchWorker, self).__init__(
+            name=' '.join(('prefetch', str(count))))
+        self.fetches = fetches
+        self.parent = threading.current_thread()
+
+    def run(self):
+        logs.register(self.getName())
+        try:
+            while self.parent.is_alive():
+                try:
+                    fetch = self.fetches.pop(0)
+                except IndexError:
+                    break
+                fetch.start()
+        finally:
+            logs.unregister()
+
+
 class VCSQuery(object):
 
-    def __init__(self, context, sources):
+    def __init__(self, context, fetches):
         self.context = context
-        self.sources = sources
+        self.fetches = fetches
 
     def __call__(self, requirement, strategy):
-        if requirement.key in self.sources:
-            source = self.sources[requirement.key]
-            checkout = source(update=(strategy!= STRATEGY_QUICK))
+        if requirement.key in self.fetches:
+            checkout = self.fetches[requirement.key]()
             installer = SourceInstaller(
-                self.context, name=source.name, path=checkout.directory)
+                self.context, name=checkout.name, path=checkout.directory,
+                metadata_key=get_checkout_key(
+                    checkout, self.context.interpretor))
             return Installers([installer]).get_installers_for(requirement)
         return []
 
@@ -83,6 +214,13 @@ class VCSSource(Source):
         self.develop = self.options.get('develop', 'on').as_bool()
         if 'available' in self.options:
             self.enabled = self.options['available'].as_list()
+        self.workers = self.options.get_with_default(
+            'install_workers', 'setup', '5').as_int()
+        self._fetches = {}
+        self._workers = []
+        self._lock = threading.Lock()
+        self.options.configuration.utilities.events.subscribe(
+            'finish', self.finish)
 
     def get_checkouts(self):
         configuration = self.options.configuration
@@ -104,19 +242,49 @@ class VCSSource(Source):
                     return False
         return True
 
+    def get_fetch(self, checkout, update):
+        """Return the fetch of the given checkout, reusing the one of
+        a previous query if it did as much.
+        """
+        self._lock.acquire()
+        try:
+            fetch = self._fetches.get(checkout.directory)
+            if fetch is None or (update and not fetch.update):
+                fetch = VCSFetch(VCS(checkout), update)
+                self._fetches[checkout.directory] = fetch
+            return fetch
+        finally:
+            self._lock.release()
+
     def prepare(self, context):
         __status__ = u"Preparing remote development sources."
         checkouts = list(self.get_checkouts())
         if checkouts:
             VCS.initialize()
             create_directory(self.directory)
-            sources = {}
+            update = context.strategy != STRATEGY_QUICK
+            fetches = {}
             for checkout in checkouts:
                 if self.enabled and checkout.name not in self.enabled:
                     continue
-                sources[keyify(checkout.name)] = VCS(checkout)
-            return VCSQuery(context, sources)
+                fetches[keyify(checkout.name)] = self.get_fetch(
+                    checkout, update)
+            # Fetch or update all checkouts now, queries will wait for them.
+            pending = list(fetches.values())
+            for count in range(min(len(pending), self.workers)):
+                worker = VCSPrefetchWorker(pending, count)
+                worker.start()
+                self._workers.append(worker)
+            return VCSQuery(context, fetches)
         return None
 
+    def finish(self, *ignore):
+        """Wait for the checkouts being fetched or updated.
+        """
+        for worker in self._workers:
+            del worker.fetches[:]
+            worker.join()
+        self._workers = []
+
     def __repr__(self):
         return '<VCSSource at %s>' % (self.directory)
@@ -0,0 +1,72 @@
+
+import random
+import sys
+import time
+
+from monteur.recipe.commands import InstallerStatus
+from monteur.recipe.utils import topological_sort, connected_components
+
+
+class FakeStatus(object):
+    """Part status with only dependency information.
+    """
+
+    def __init__(self, depends):
+        self.depends = set(depends)
+        self.enabled = False
+
+    def is_enabled(self):
+        return self.enabled
+
+    def enable(self, flag=True):
+        if flag:
+            self.enabled = True
+
+
+def generate_graph(count, shape):
+    """Generate a graph of count parts, as a dictionary of part
+    names to the names they depend on.
+    """
+    names = ['part%d' % index for index in range(count)]
+    graph = {}
+    for index, name in enumerate(names):
+        if shape == 'chain':
+            graph[name] = names[index - 1:index]
+        elif shape == 'forest':
+            # Many small independent trees.
+            graph[name] = index % 10 and [names[index - index % 10]] or []
+        else:
+            graph[name] = random.sample(names[:index], min(index, 3))
+    return graph
+
+
+def measure(method, *args):
+    start = time.time()
+    method(*args)
+    return time.time() - start
+
+
+def benchmark(counts):
+    """Time dependency analysis of synthetic part graphs.
+    """
+    random.seed(42)
+    print "%8s %8s %10s %10s %10s" % (
+        'parts', 'shape', 'sort', 'groups', 'verify')
+    for count in counts:
+        for shape in ('chain', 'forest', 'random'):
+            graph = generate_graph(count, shape)
+            status = InstallerStatus.__new__(InstallerStatus)
+            status.parts_status = dict(
+                (name, FakeStatus(depends))
+                for name, depends in graph.items())
+            status.parts_status['part0'].enable()
+            print "%8d %8s %9.3fs %9.3fs %9.3fs" % (
+                count, shape,
+                measure(topological_sort, graph.keys(), graph.get),
+                measure(connected_components, graph.keys(), graph.get),
+                measure(status.verify_dependencies))
+
+
+if __name__ == "__main__":
+    counts = map(int, sys.argv[1:]) or [100, 1000, 10000, 50000]
+    benchmark(counts)
@@ -0,0 +1,74 @@
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from monteur.python import PythonInterpreter
+from monteur.setuptools import unsetuptoolize
+from monteur.setuptools.static import read_setup
+
+
+def find_setups(paths):
+    """Return the directories containing a setup.py in paths.
+    """
+    directories = []
+    for path in paths:
+        for directory, directories_names, filenames in os.walk(path):
+            if 'setup.py' in filenames:
+                directories.append(directory)
+                del directories_names[:]
+    return sorted(directories)
+
+
+def measure(method, directories):
+    """Run method on each directory, return the time it took and
+    the number of successes.
+    """
+    success = 0
+    start = time.time()
+    for directory in directories:
+        if method(directory):
+            success += 1
+    return time.time() - start, success
+
+
+def benchmark(paths):
+    """Compare the static analysis of setup.py files with running
+    unsetuptoolize and setuptools egg_info on them.
+    """
+    directories = find_setups(paths)
+    interpreter = PythonInterpreter.detect()
+
+    def static(directory):
+        return read_setup(directory) is not None
+
+    def interpreted(directory):
+        source, _, code = interpreter.execute_module(
+            unsetuptoolize, '-d', directory)
+        return not code and source
+
+    def native(directory):
+        # Don't leave egg-info directories behind.
+        temporary = tempfile.mkdtemp('monteur.benchmark')
+        try:
+            output, errors, code = interpreter.execute_setuptools(
+                'egg_info', '-e', temporary, path=directory)
+        finally:
+            shutil.rmtree(temporary)
+        return not code
+
+    print "%d setup.py files" % len(directories)
+    for name, method in (('static', static),
+                         ('interpreted', interpreted),
+                         ('native', native)):
+        duration, success = measure(method, directories)
+        print "%-12s %8.3fs %5d loaded" % (name, duration, success)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "usage: %s directory [directory...]" % sys.argv[0]
+        sys.exit(1)
+    benchmark(sys.argv[1:])
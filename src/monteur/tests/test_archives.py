@@ -0,0 +1,251 @@
+
+import gzip
+import os
+import shutil
+import StringIO
+import tempfile
+import time
+import unittest
+
+from monteur import archives
+from monteur.archives import ParallelGzipFile, GZIP_BLOCK_SIZE
+from monteur.archives import TarGzArchive, ZipArchive, open_archive
+from monteur.recipe.file import File, is_member_unchanged
+from monteur.recipe.utils import Paths
+from monteur.utils import stat_cache
+
+
+class ParallelGzipTestCase(unittest.TestCase):
+    """Test writing gzip streams in parallel.
+    """
+
+    def test_write(self):
+        """Test blocks compressed in parallel make a valid gzip stream
+        """
+        data = ''.join(str(i) for i in xrange(GZIP_BLOCK_SIZE / 2))
+        self.assertTrue(len(data) > 2 * GZIP_BLOCK_SIZE)
+        for workers in (1, 4):
+            output = StringIO.StringIO()
+            stream = ParallelGzipFile(output, workers=workers, mtime=0)
+            stream.write(data[:100])
+            stream.write(data[100:])
+            self.assertEqual(stream.tell(), len(data))
+            stream.close()
+            self.assertEqual(
+                gzip.GzipFile(
+                    fileobj=StringIO.StringIO(output.getvalue())).read(),
+                data)
+
+
+class ArchiveSourceTestCase(unittest.TestCase):
+    """Create archives out of a source directory.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+        self.source = os.path.join(self.directory, 'source')
+        os.makedirs(os.path.join(self.source, 'package'))
+        for name in ('setup.py', 'package/__init__.py'):
+            stream = open(os.path.join(self.source, name), 'w')
+            stream.write('# %s\n' % name)
+            stream.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create(self, factory, name, **options):
+        filename = os.path.join(self.directory, name)
+        archive = factory(filename, 'w', **options)
+        for name in ('setup.py', 'package', 'package/__init__.py'):
+            archive.add(
+                os.path.join(self.source, name),
+                os.path.join('source-1.0', name))
+        archive.close()
+        stream = open(filename, 'rb')
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
+
+class ArchiveTestCase(ArchiveSourceTestCase):
+    """Test creating archives.
+    """
+
+    def test_reproducible(self):
+        """Test reproducible archives are identical for the same files
+        """
+        for factory, name in ((TarGzArchive, 'source.tar.gz'),
+                              (ZipArchive, 'source.zip')):
+            first = self.create(
+                factory, name, workers=2, reproducible=True)
+            later = time.time() + 3600
+            os.utime(os.path.join(self.source, 'setup.py'), (later, later))
+            second = self.create(
+                factory, name, workers=2, reproducible=True)
+            self.assertEqual(first, second)
+
+            archive = open_archive(os.path.join(self.directory, name), 'r')
+            try:
+                self.assertEqual(
+                    archive.read('source-1.0/package/__init__.py'),
+                    '# package/__init__.py\n')
+            finally:
+                archive.close()
+
+    def test_zip(self):
+        """Test zip entries compressed in parallel by chunks
+        """
+        # Zip entries are written with zipfile internals.
+        self.assertTrue(archives.ZIP_PRECOMPRESSED)
+        data = ''.join(str(i) for i in xrange(archives.ZIP_CHUNK_SIZE / 2))
+        self.assertTrue(len(data) > 2 * archives.ZIP_CHUNK_SIZE)
+        stream = open(os.path.join(self.source, 'setup.py'), 'w')
+        stream.write(data)
+        stream.close()
+        original = archives.ZIP_PRECOMPRESSED
+        try:
+            for precompressed in (True, False):
+                archives.ZIP_PRECOMPRESSED = precompressed
+                name = 'source-%s.zip' % precompressed
+                self.create(ZipArchive, name, workers=4)
+                archive = open_archive(
+                    os.path.join(self.directory, name), 'r')
+                try:
+                    self.assertEqual(archive._zip.testzip(), None)
+                    self.assertEqual(
+                        archive.read('source-1.0/setup.py'), data)
+                    self.assertEqual(
+                        archive.read('source-1.0/package/__init__.py'),
+                        '# package/__init__.py\n')
+                finally:
+                    archive.close()
+        finally:
+            archives.ZIP_PRECOMPRESSED = original
+
+    def test_extract_members(self):
+        """Test listing an archive, and extracting only some members
+        """
+        for factory, name in ((TarGzArchive, 'source.tar.gz'),
+                              (ZipArchive, 'source.zip')):
+            self.create(factory, name)
+            archive = open_archive(os.path.join(self.directory, name), 'r')
+            try:
+                members = archive.list().as_dict()
+                self.assertEqual(
+                    sorted(members.keys()),
+                    ['source-1.0/package',
+                     'source-1.0/package/__init__.py',
+                     'source-1.0/setup.py'])
+                self.assertTrue(members['source-1.0/package']['directory'])
+                info = members['source-1.0/setup.py']
+                self.assertEqual(info['size'], 11)
+
+                destination = os.path.join(self.directory, 'extract')
+                archive.extract(destination, set(['source-1.0/setup.py']))
+                self.assertEqual(
+                    os.listdir(os.path.join(destination, 'source-1.0')),
+                    ['setup.py'])
+                extracted = os.path.join(
+                    destination, 'source-1.0', 'setup.py')
+                self.assertTrue(is_member_unchanged(info, extracted))
+                stream = open(extracted, 'w')
+                stream.write('# changed!\n')
+                stream.close()
+                os.utime(extracted, (1000000000, 1000000000))
+                self.assertFalse(is_member_unchanged(info, extracted))
+                shutil.rmtree(destination)
+            finally:
+                archive.close()
+
+
+class FakeStatus(object):
+
+    def __init__(self, previous=None):
+        self.paths = Paths()
+        self.installed_paths = Paths()
+        self.archives = {}
+        self.installed_archives = {}
+        self.archive_paths = {}
+        self.installed_archive_paths = {}
+        if previous is not None:
+            self.installed_paths.extend(previous.paths.as_list())
+            self.installed_archives = previous.archives
+            self.installed_archive_paths = previous.archive_paths
+
+    def test_override_rule(self, path):
+        return False
+
+
+class FileArchiveTestCase(ArchiveSourceTestCase):
+    """Test installing archives with the file recipe.
+    """
+
+    def install(self, status):
+        recipe = File.__new__(File)
+        recipe.directory = os.path.join(self.directory, 'installed')
+        recipe.compare = 'mtime'
+        recipe.status = status
+        filename = os.path.join(self.directory, 'source.tar.gz')
+        archive = open_archive(filename, 'r')
+        try:
+            recipe.install_archive(filename, archive, [])
+        finally:
+            archive.close()
+        return status
+
+    def test_unchanged(self):
+        """Test an unchanged archive is not read again
+        """
+        self.create(TarGzArchive, 'source.tar.gz')
+        first = self.install(FakeStatus())
+        self.assertEqual(
+            first.paths.as_list(),
+            [os.path.join(self.directory, 'installed', 'source-1.0', name)
+             for name in ('package', 'package/__init__.py', 'setup.py')])
+
+        original_list = TarGzArchive.list
+        def list(archive):
+            self.fail('Archive should not be read')
+        TarGzArchive.list = list
+        try:
+            second = self.install(FakeStatus(first))
+        finally:
+            TarGzArchive.list = original_list
+        self.assertEqual(second.paths.as_list(), first.paths.as_list())
+        self.assertEqual(second.archive_paths, first.archive_paths)
+
+        # Missing paths are installed again.
+        removed = os.path.join(
+            self.directory, 'installed', 'source-1.0', 'setup.py')
+        os.remove(removed)
+        stat_cache.invalidate(removed)
+        third = self.install(FakeStatus(second))
+        self.assertEqual(third.paths.as_list(), first.paths.as_list())
+        self.assertTrue(os.path.isfile(os.path.join(
+                    self.directory, 'installed', 'source-1.0', 'setup.py')))
+
+    def test_unchanged_shared_directory(self):
+        """Test other files installed next to the content of an
+        unchanged archive don't make it read again
+        """
+        self.create(TarGzArchive, 'source.tar.gz')
+        first = self.install(FakeStatus())
+        other = os.path.join(
+            self.directory, 'installed', 'source-1.0', 'other.py')
+        open(other, 'w').close()
+        stat_cache.invalidate(other)
+        first.paths.add(other, directory=False)
+
+        original_list = TarGzArchive.list
+        def list(archive):
+            self.fail('Archive should not be read')
+        TarGzArchive.list = list
+        try:
+            second = self.install(FakeStatus(first))
+        finally:
+            TarGzArchive.list = original_list
+        self.assertEqual(
+            second.paths.as_list(),
+            [os.path.join(self.directory, 'installed', 'source-1.0', name)
+             for name in ('package', 'package/__init__.py', 'setup.py')])
@@ -0,0 +1,65 @@
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+from monteur.recipe.compile import compile_directories, is_up_to_date
+from monteur.recipe.compile import get_compiled_filename
+
+
+class CompileTestCase(unittest.TestCase):
+    """Test compiling Python files.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.tests')
+        self.sources = []
+        for name in ('first.py', 'second.py', 'package/third.py'):
+            source = os.path.join(self.directory, name)
+            if not os.path.isdir(os.path.dirname(source)):
+                os.makedirs(os.path.dirname(source))
+            stream = open(source, 'w')
+            stream.write('value = %r\n' % name)
+            stream.close()
+            self.sources.append(source)
+        self.broken = os.path.join(self.directory, 'broken.py')
+        stream = open(self.broken, 'w')
+        stream.write('value = (\n')
+        stream.close()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+
+    def test_up_to_date(self):
+        """Test up to date bytecode is detected
+        """
+        source = self.sources[0]
+        self.assertFalse(is_up_to_date(source))
+        self.assertEqual(compile_directories([self.directory], 1), (3, 1))
+        self.assertTrue(os.path.isfile(get_compiled_filename(source)))
+        self.assertTrue(is_up_to_date(source))
+        stat = os.stat(source)
+        os.utime(source, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(is_up_to_date(source))
+
+    def test_compile_directories(self):
+        """Test only out of date files are compiled
+        """
+        self.assertEqual(compile_directories([self.directory], 1), (3, 1))
+        self.assertEqual(compile_directories([self.directory], 1), (0, 1))
+        os.remove(get_compiled_filename(self.sources[1]))
+        self.assertEqual(compile_directories([self.directory], 1), (1, 1))
+
+    def test_jobs(self):
+        """Test compiling with more than one process
+        """
+        self.assertEqual(compile_directories([self.directory], 2), (3, 1))
+        for source in self.sources:
+            self.assertTrue(is_up_to_date(source))
+        self.assertFalse(is_up_to_date(self.broken))
@@ -1,8 +1,12 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 
 from monteur.configuration import Configuration
+from monteur.configuration import cache
+from monteur.configuration.cache import ConfigurationCache
 from monteur.error import FileError, ConfigurationError
 
 
@@ -106,3 +110,245 @@ class OptionTestCase(unittest.TestCase):
         self.assertEqual(
             section['option_empty'].as_list(),
             [])
+
+
+REFERENCES_CFG = """
+[setup]
+prefix_directory = /opt
+bin_directory = ${setup:prefix_directory}/bin
+python = ${:bin_directory}/python
+
+[part]
+script = ${setup:python} -c ${:code}
+code = 'pass'
+
+[cycle]
+first = ${:second}
+second = ${:first}
+"""
+
+
+class ReferenceTestCase(unittest.TestCase):
+    """Test references between options
+    """
+
+    def setUp(self):
+        self.config = Configuration.read_lines(
+            REFERENCES_CFG.splitlines, 'references.cfg')
+
+    def test_resolve(self):
+        """Test resolving references to other options
+        """
+        self.assertEqual(
+            self.config['part']['script'].as_text(),
+            "/opt/bin/python -c 'pass'")
+
+    def test_invalidate(self):
+        """Test changing an option used by others
+        """
+        script = self.config['part']['script']
+        self.assertEqual(script.as_text(), "/opt/bin/python -c 'pass'")
+        self.config['setup']['prefix_directory'] = '/usr'
+        self.assertEqual(script.as_text(), "/usr/bin/python -c 'pass'")
+        self.config['setup']['bin_directory'] = '/bin'
+        self.assertEqual(script.as_text(), "/bin/python -c 'pass'")
+        del self.config['part']['code']
+        self.assertRaises(ConfigurationError, script.as_text)
+        self.config['part']['code'] = '1'
+        self.assertEqual(script.as_text(), "/bin/python -c 1")
+
+    def test_invalidate_while_computing(self):
+        """Test a value computed while an option it uses changed is
+        not kept
+        """
+        script = self.config['part']['script']
+        changes = ['/usr']
+
+        def change(value):
+            # Change an option while script is being computed.
+            if changes:
+                self.config['setup']['prefix_directory'] = changes.pop()
+
+        script.register(change)
+        self.assertEqual(script.as_text(), "/opt/bin/python -c 'pass'")
+        self.assertEqual(script.as_text(), "/usr/bin/python -c 'pass'")
+
+    def test_cycle(self):
+        """Test detection of circular references
+        """
+        self.assertRaises(
+            ConfigurationError, self.config['cycle']['first'].as_text)
+        self.config['cycle']['second'] = 'done'
+        self.assertEqual(self.config['cycle']['first'].as_text(), 'done')
+
+    def test_fingerprint(self):
+        """Test section fingerprints follow changes
+        """
+        other = Configuration.read_lines(
+            REFERENCES_CFG.splitlines, 'other.cfg')
+        part = self.config['part']
+        fingerprint = part.fingerprint()
+        self.assertEqual(fingerprint, other['part'].fingerprint())
+        self.assertEqual(part, other['part'])
+        self.assertNotEqual(fingerprint, self.config['setup'].fingerprint())
+
+        # Changing an option used by the section changes it.
+        self.config['setup']['prefix_directory'] = '/usr'
+        self.assertNotEqual(part.fingerprint(), fingerprint)
+        self.assertNotEqual(part, other['part'])
+        other['setup']['prefix_directory'] = '/usr'
+        self.assertEqual(part, other['part'])
+
+        part['extra'] = 'value'
+        self.assertNotEqual(part, other['part'])
+        del part['extra']
+        self.assertEqual(part, other['part'])
+
+
+USER_CFG = """
+[setup]
+install += user
+prefix_directory = /home/user
+
+[user]
+recipe = file
+"""
+
+DEFAULT_CFG = """
+[setup]
+install =
+    default
+prefix_directory = /opt
+bin_directory = ${:prefix_directory}/bin
+"""
+
+
+class LayeredConfigurationTestCase(unittest.TestCase):
+    """Test adding configurations together
+    """
+
+    def setUp(self):
+        self.default = Configuration.read_lines(
+            DEFAULT_CFG.splitlines, 'default.cfg')
+        self.config = Configuration.read_lines(
+            USER_CFG.splitlines, 'user.cfg') + self.default
+
+    def test_lookup(self):
+        """Test options are looked up in the added configurations
+        """
+        setup = self.config['setup']
+        self.assertEqual(sorted(self.config.keys()), ['setup', 'user'])
+        self.assertEqual(
+            sorted(setup.keys()),
+            ['bin_directory', 'install', 'prefix_directory'])
+        self.assertEqual(setup['install'].as_list(), ['default', 'user'])
+        self.assertEqual(setup['bin_directory'].as_text(), '/home/user/bin')
+        self.assertEqual(self.config['user']['recipe'].as_text(), 'file')
+        self.assertEqual(
+            setup['prefix_directory'].location, 'user.cfg: line 4')
+
+    def test_copy_on_write(self):
+        """Test options are copied only when they are used
+        """
+        setup = self.config['setup']
+        self.assertEqual(len(setup._options), 0)
+        self.assertEqual(setup['prefix_directory'].as_text(), '/home/user')
+        self.assertEqual(setup._options.keys(), ['prefix_directory'])
+
+        setup['prefix_directory'] = '/usr'
+        del setup['install']
+        self.assertEqual(setup['bin_directory'].as_text(), '/usr/bin')
+        self.assertFalse('install' in setup)
+        default = self.default['setup']
+        self.assertEqual(default['bin_directory'].as_text(), '/opt/bin')
+        self.assertEqual(default['install'].as_list(), ['default'])
+
+    def test_snapshot(self):
+        """Test changing an added configuration doesn't change the
+        result of the addition
+        """
+        default = self.default['setup']
+        default['prefix_directory'] = '/usr'
+        default['bin_directory'].set_value('/bin')
+        default['install'] = 'other'
+        del default['install']
+        default['lib_directory'] = '/lib'
+        setup = self.config['setup']
+        self.assertEqual(setup['bin_directory'].as_text(), '/home/user/bin')
+        self.assertEqual(setup['install'].as_list(), ['default', 'user'])
+        self.assertFalse('lib_directory' in setup)
+        self.assertEqual(default['bin_directory'].as_text(), '/bin')
+
+
+class ConfigurationCacheTestCase(unittest.TestCase):
+    """Test caching parsed configurations
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+        self.cache = ConfigurationCache()
+        self.cache.open(os.path.join(self.directory, 'cache'))
+        self.write('base.cfg', '[setup]\nbase = value\n')
+        self.write('monteur.cfg', '[setup]\nextends = base.cfg\n'
+                   '[part]\nrecipe = file\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, content):
+        stream = open(os.path.join(self.directory, filename), 'w')
+        stream.write(content)
+        stream.close()
+
+    def read(self):
+        return self.cache.read(
+            Configuration, os.path.join(self.directory, 'monteur.cfg'))
+
+    def test_read(self):
+        """Test reading a configuration from the cache
+        """
+        config = self.read()
+        self.assertEqual(config['setup']['base'].as_text(), 'value')
+        self.assertEqual(len(os.listdir(
+                    os.path.join(self.directory, 'cache'))), 1)
+
+        original_read_lines = Configuration.read_lines
+        def read_lines(*args):
+            self.fail('Configuration should not be parsed')
+        Configuration.read_lines = classmethod(read_lines)
+        try:
+            cached = self.read()
+        finally:
+            Configuration.read_lines = original_read_lines
+        self.assertTrue(isinstance(cached, Configuration))
+        self.assertEqual(sorted(cached.keys()), ['part', 'setup'])
+        self.assertEqual(cached['part']['recipe'].as_text(), 'file')
+        self.assertEqual(cached['part']['recipe'].location,
+                         config['part']['recipe'].location)
+
+    def test_invalidate(self):
+        """Test the cache is not used if an extended file changed
+        """
+        self.assertEqual(self.read()['setup']['base'].as_text(), 'value')
+        self.write('base.cfg', '[setup]\nbase = other value\n')
+        self.assertEqual(
+            self.read()['setup']['base'].as_text(), 'other value')
+
+    def test_touched(self):
+        """Test files touched but not modified are checked only once
+        """
+        self.read()
+        base = os.path.join(self.directory, 'base.cfg')
+        stat = os.stat(base)
+        os.utime(base, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(self.read()['setup']['base'].as_text(), 'value')
+
+        original_checksum = cache.compute_file_checksum
+        def compute_file_checksum(filename):
+            self.fail('File should not be checked again')
+        cache.compute_file_checksum = compute_file_checksum
+        try:
+            self.assertEqual(
+                self.read()['setup']['base'].as_text(), 'value')
+        finally:
+            cache.compute_file_checksum = original_checksum
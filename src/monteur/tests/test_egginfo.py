@@ -0,0 +1,93 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from monteur.archives import ZipArchive
+from monteur.egginfo.read import read_archive_egg_info
+
+
+PKG_INFO = """Metadata-Version: 1.0
+Name: zeam.form
+Version: 1.0
+Summary: Forms
+
+Description: A long
+        description.
+"""
+
+REQUIRES = """zeam.component
+grokcore.view >= 1.0
+
+[test]
+zope.testing
+"""
+
+ENTRY_POINTS = """[console_scripts]
+form = zeam.form:main
+"""
+
+
+class ArchiveEggInfoTestCase(unittest.TestCase):
+    """Test reading egg-info information directly from an archive.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_archive(self, files):
+        filename = os.path.join(self.directory, 'zeam.form-1.0.zip')
+        archive = zipfile.ZipFile(filename, 'w')
+        for name, content in files.items():
+            archive.writestr(name, content)
+        archive.close()
+        return ZipArchive(filename, 'r')
+
+    def test_read(self):
+        """Read metadata included in a source archive
+        """
+        archive = self.create_archive({
+                'zeam.form-1.0/PKG-INFO': PKG_INFO,
+                'zeam.form-1.0/setup.py': '',
+                'zeam.form-1.0/src/zeam.form.egg-info/PKG-INFO': PKG_INFO,
+                'zeam.form-1.0/src/zeam.form.egg-info/requires.txt': REQUIRES,
+                'zeam.form-1.0/src/zeam.form.egg-info/entry_points.txt':
+                    ENTRY_POINTS})
+        metadata = read_archive_egg_info(archive, 'zeam.form')
+        archive.close()
+        self.assertNotEqual(metadata, None)
+        self.assertEqual(metadata['pkg_info']['name'], 'zeam.form')
+        self.assertEqual(metadata['pkg_info']['version'], '1.0')
+        self.assertEqual(
+            sorted(map(str, metadata['requirements'])),
+            ['grokcore.view>=1.0', 'zeam.component'])
+        self.assertEqual(metadata['extras'].keys(), ['test'])
+        self.assertEqual(
+            metadata['entry_points'],
+            {'console_scripts': {'form': 'zeam.form:main'}})
+
+    def test_read_without_requires(self):
+        """Read metadata from an archive without requirements
+        """
+        archive = self.create_archive({
+                'zeam.form-1.0/zeam.form.egg-info/PKG-INFO': PKG_INFO})
+        metadata = read_archive_egg_info(archive, 'zeam.form')
+        archive.close()
+        self.assertNotEqual(metadata, None)
+        self.assertEqual(len(metadata['requirements']), 0)
+        self.assertEqual(metadata['extras'], {})
+        self.assertEqual(metadata['entry_points'], {})
+
+    def test_read_missing(self):
+        """Read metadata from an archive that doesn't include it
+        """
+        archive = self.create_archive({
+                'zeam.form-1.0/PKG-INFO': PKG_INFO,
+                'zeam.form-1.0/setup.py': ''})
+        self.assertEqual(read_archive_egg_info(archive, 'zeam.form'), None)
+        archive.close()
@@ -1,8 +1,10 @@
 
 import os
+import shutil
+import tempfile
 import unittest
 
-from monteur.distribution.manifest import parse_manifest
+from monteur.distribution.manifest import parse_manifest, Manifest
 
 
 def get_test_file(name):
@@ -34,3 +36,64 @@ class ManifestTestCase(unittest.TestCase):
             ({'./': ['setup.py']},
              {'src/': ['*.txt', '*.ini'],
               './': ['*.py']}))
+
+    def test_walk(self):
+        """Walk a directory selecting files with manifest rules
+        """
+        directory = tempfile.mkdtemp('monteur.test')
+        try:
+            for path in ('setup.py', 'lib/egg/module.py',
+                         'src/package/__init__.py', 'src/package/data.txt'):
+                path = os.path.join(directory, path)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                open(path, 'w').close()
+            manifest = Manifest(
+                {'./': ['setup.py']}, {'src/': ['*.py', '*.txt']})
+            # lib is not walked, since no rule can select a file in it.
+            self.assertFalse(manifest.reaches('lib/', []))
+            self.assertTrue(manifest.reaches('src/', []))
+            self.assertEqual(
+                [path for path, info in manifest.walk(directory)],
+                ['setup.py',
+                 'src/package/__init__.py',
+                 'src/package/data.txt'])
+            self.assertEqual(
+                list(manifest.walk(directory, prefixes=['src'])),
+                [('package/__init__.py',
+                  {'directory': False,
+                   'original': 'src/package/__init__.py',
+                   'full': os.path.join(
+                        directory, 'src/package/__init__.py')}),
+                 ('package/data.txt',
+                  {'directory': False,
+                   'original': 'src/package/data.txt',
+                   'full': os.path.join(
+                        directory, 'src/package/data.txt')})])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_walk_links(self):
+        """Walk a directory containing links to directories
+        """
+        directory = tempfile.mkdtemp('monteur.test')
+        try:
+            os.makedirs(os.path.join(directory, 'src', 'package'))
+            os.makedirs(os.path.join(directory, 'shared'))
+            open(os.path.join(
+                    directory, 'src', 'package', 'module.py'), 'w').close()
+            open(os.path.join(directory, 'shared', 'utils.py'), 'w').close()
+            os.symlink(
+                os.path.join(directory, 'shared'),
+                os.path.join(directory, 'src', 'package', 'shared'))
+            # A link to a parent directory is not walked again.
+            os.symlink(
+                os.path.join(directory, 'src'),
+                os.path.join(directory, 'src', 'package', 'loop'))
+            manifest = Manifest({}, {'src/': ['*.py']})
+            self.assertEqual(
+                [path for path, info in manifest.walk(directory)],
+                ['src/package/module.py',
+                 'src/package/shared/utils.py'])
+        finally:
+            shutil.rmtree(directory)
@@ -1,8 +1,13 @@
 
+import os
+import shutil
+import tempfile
 import unittest
 
+from monteur.distribution.metadata import MetadataCache
 from monteur.distribution.release import Release
 from monteur.distribution.workingset import ReleaseSet
+from monteur.version import Requirements
 
 
 class ReleaseTestCase(unittest.TestCase):
@@ -19,3 +24,43 @@ class ReleaseTestCase(unittest.TestCase):
         self.assertEqual(len(packages), 1)
         packages.add(Release(name='zeam.software'))
         self.assertEqual(len(packages), 1)
+
+
+class MetadataCacheTestCase(unittest.TestCase):
+    """Test the package metadata cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store_and_restore(self):
+        """Store release metadata and restore it from the saved cache
+        """
+        filename = os.path.join(self.directory, 'metadata.cache')
+        cache = MetadataCache()
+        cache.open(filename)
+        release = Release(name='zeam.form', version='1.0',
+                          path='/eggs/zeam.form/src',
+                          package_path='/eggs/zeam.form')
+        release.requirements = Requirements.parse(['zeam.component'])
+        release.extras = {'test': Requirements.parse(['zope.testing'])}
+        release.entry_points = {'console_scripts': {'form': 'zeam.form:main'}}
+        self.assertFalse('md5:42' in cache)
+        cache.store('md5:42', release)
+        self.assertTrue('md5:42' in cache)
+        cache.save()
+
+        cache = MetadataCache()
+        cache.open(filename)
+        restored = Release(package_path='/lib/zeam.form')
+        self.assertFalse(cache.restore('md5:21', restored))
+        self.assertTrue(cache.restore('md5:42', restored))
+        self.assertEqual(restored.name, 'zeam.form')
+        self.assertEqual(str(restored.version), '1.0')
+        self.assertEqual(restored.path, '/lib/zeam.form/src')
+        self.assertEqual(map(str, restored.requirements), ['zeam.component'])
+        self.assertEqual(map(str, restored.extras['test']), ['zope.testing'])
+        self.assertEqual(restored.entry_points, release.entry_points)
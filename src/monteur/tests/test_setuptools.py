@@ -1,7 +1,21 @@
 
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 
-from monteur.setuptools.autotools import relative_path
+from monteur.distribution.release import Release
+from monteur.error import InstallationError
+from monteur.python import PythonInterpreter, SetuptoolsWorkers
+from monteur.setuptools.autotools import relative_path, AutomakeBuilder
+from monteur.setuptools.autotools import free_build_slots
+from monteur.setuptools.autotools import list_autoreconf_outputs
+from monteur.setuptools.interpreted_loader import InterpretedSetuptoolsLoader
+from monteur.setuptools.interpreted_loader import serialize_setup
+from monteur.setuptools.native_loader import find_egg_info
+from monteur.setuptools.static import analyse_setup, DynamicSetup
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -21,3 +35,318 @@ class UtilsTestCase(unittest.TestCase):
         self.assertEqual(
             relative_path('src/persistance', 'src/persistance/space/time.c'),
             'space/time.c')
+
+    def test_free_build_slots(self):
+        """Test number of jobs used to build
+        """
+        self.assertTrue(free_build_slots() >= 1)
+
+
+class AutomakeBuilderTestCase(unittest.TestCase):
+    """Test autotools installation caching.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+        self.source = os.path.join(self.directory, 'source')
+        os.makedirs(self.source)
+        self.builder = AutomakeBuilder()
+        self.builder.open(os.path.join(self.directory, 'cache'))
+        for name in ('configure.ac', 'Makefile.am'):
+            stream = open(os.path.join(self.source, name), 'w')
+            stream.write(name)
+            stream.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_autoreconf(self):
+        """Generated autotools files are reused from the cache
+        """
+        # Prime the cache as a previous autoreconf would have done.
+        inputs = ['Makefile.am', 'configure.ac']
+        digest = hashlib.md5()
+        for filename in inputs:
+            digest.update(filename + '\0')
+            digest.update(filename)
+        cache = os.path.join(self.directory, 'cache', 'autoreconf',
+                             digest.hexdigest())
+        os.makedirs(cache)
+        stream = open(os.path.join(cache, 'configure'), 'w')
+        stream.write('#!/bin/sh')
+        stream.close()
+
+        self.builder.autoreconf(self.source, inputs)
+        configure = os.path.join(self.source, 'configure')
+        self.assertTrue(os.path.isfile(configure))
+        self.assertTrue(
+            os.path.getmtime(configure) >
+            os.path.getmtime(os.path.join(self.source, 'configure.ac')))
+
+        # Second time, nothing has to be done.
+        os.remove(os.path.join(cache, 'configure'))
+        self.builder.autoreconf(self.source, inputs)
+        self.assertTrue(os.path.isfile(configure))
+
+    def test_autoreconf_outputs(self):
+        """Only files generated by autoreconf are cached
+        """
+        os.makedirs(os.path.join(self.source, 'm4'))
+        for name in ('configure', 'Makefile.in', 'README',
+                     'm4/libtool.m4', 'm4/python.m4'):
+            stream = open(os.path.join(self.source, name), 'w')
+            stream.write(name)
+            stream.close()
+        self.assertEqual(
+            sorted(list_autoreconf_outputs(
+                    self.source,
+                    ['configure.ac', 'Makefile.am', 'm4/python.m4'])),
+            ['Makefile.in', 'configure', 'm4/libtool.m4'])
+
+    def test_configure_cache(self):
+        """Configure results are cached by interpreter and prefix
+        """
+        release = Release(name='zeam', version='1.0')
+        cache = self.builder.get_configure_cache(
+            release, '/prefix', '/usr/bin/python2.7')
+        self.assertEqual(
+            cache, self.builder.get_configure_cache(
+                release, '/prefix', '/usr/bin/python2.7'))
+        self.assertNotEqual(
+            cache, self.builder.get_configure_cache(
+                release, '/prefix', '/usr/bin/python2.6'))
+        self.assertNotEqual(
+            cache, self.builder.get_configure_cache(
+                release, '/other', '/usr/bin/python2.7'))
+
+
+DECLARATIVE_SETUP = """
+from setuptools import setup, find_packages
+import os
+
+version = '1.0'
+tests_require = ['zope.testing']
+
+def read(*path):
+    return open(os.path.join(*path)).read()
+
+setup(name='zeam.form',
+      version=version,
+      description="Forms",
+      long_description=read('README.txt'),
+      packages=find_packages('src'),
+      package_dir={'': 'src'},
+      install_requires=['setuptools',
+                        'zeam.component'],
+      extras_require={'test': tests_require},
+      entry_points=\"\"\"
+      [console_scripts]
+      form = zeam.form:main
+      \"\"\",
+      )
+"""
+
+DYNAMIC_SETUP = """
+from setuptools import setup
+
+requires = ['setuptools']
+if sys.version_info < (2, 6):
+    requires += ['simplejson']
+
+setup(name='zeam.form',
+      version='1.0',
+      install_requires=requires)
+"""
+
+
+class StaticSetupTestCase(unittest.TestCase):
+    """Test static analysis of setup.py files.
+    """
+
+    def test_declarative(self):
+        """Analyse a setup.py using only literals
+        """
+        arguments = analyse_setup(DECLARATIVE_SETUP)
+        self.assertEqual(arguments['name'], 'zeam.form')
+        self.assertEqual(arguments['version'], '1.0')
+        self.assertEqual(arguments['description'], 'Forms')
+        self.assertEqual(arguments['package_dir'], {'': 'src'})
+        self.assertEqual(
+            arguments['install_requires'], ['setuptools', 'zeam.component'])
+        self.assertEqual(
+            arguments['extras_require'], {'test': ['zope.testing']})
+        self.assertEqual(
+            arguments['entry_points'],
+            {'console_scripts': {'form': 'zeam.form:main'}})
+
+    def test_dynamic(self):
+        """Analyse setup.py files that must be run
+        """
+        self.assertRaises(DynamicSetup, analyse_setup, DYNAMIC_SETUP)
+        self.assertRaises(
+            DynamicSetup, analyse_setup,
+            "from setuptools import setup\nsetup(**options)\n")
+        self.assertRaises(
+            DynamicSetup, analyse_setup,
+            "from setuptools import setup\n"
+            "setup(name='zeam', version=get_version())\n")
+        self.assertRaises(
+            DynamicSetup, analyse_setup,
+            "from setuptools import setup, Extension\n"
+            "setup(name='zeam', version='1.0', "
+            "ext_modules=[Extension('zeam', ['zeam.c'])])\n")
+
+    def test_modified(self):
+        """Analyse setup.py files modifying literals before setup
+        """
+        for change in ("requires.append('argparse')",
+                       "requires += ['argparse']",
+                       "requires[0] = 'argparse'",
+                       "requires = ['argparse']",
+                       "add_requirement(requires, 'argparse')"):
+            self.assertRaises(
+                DynamicSetup, analyse_setup,
+                "from setuptools import setup\n"
+                "requires = ['zope.interface']\n"
+                "if sys.version_info < (2, 7):\n"
+                "    %s\n"
+                "setup(name='zeam', version='1.0', "
+                "install_requires=requires)\n" % change)
+
+    def test_markers(self):
+        """Analyse setup.py files with requirements using markers
+        """
+        self.assertRaises(
+            DynamicSetup, analyse_setup,
+            "from setuptools import setup\n"
+            "setup(name='zeam', version='1.0', install_requires=["
+            "\"pywin32; sys_platform == 'win32'\", 'six'])\n")
+        self.assertRaises(
+            DynamicSetup, analyse_setup,
+            "from setuptools import setup\n"
+            "setup(name='zeam', version='1.0', extras_require={'test': "
+            "[\"mock; python_version < '3.3'\"]})\n")
+
+    def test_serialize(self):
+        """Arguments found statically are understood by the
+        interpreted loader
+        """
+        arguments = analyse_setup(DECLARATIVE_SETUP)
+        release = Release()
+        loader = InterpretedSetuptoolsLoader(
+            '/package', serialize_setup(arguments), release)
+        self.assertEqual(loader.load(), release)
+        self.assertEqual(str(release.version), '1.0')
+        self.assertEqual(release.path, '/package/src')
+        self.assertEqual(
+            sorted(map(str, release.requirements)),
+            ['setuptools', 'zeam.component'])
+        self.assertEqual(
+            map(str, release.extras['test']), ['zope.testing'])
+
+
+class FindEggInfoTestCase(unittest.TestCase):
+    """Test lookup of egg-info directories in source packages.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+        self.release = Release(name='zeam-form')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create(self, *paths):
+        for path in paths:
+            os.makedirs(os.path.join(self.directory, path))
+
+    def find(self, package_dirs={}):
+        parent, egg_info = find_egg_info(
+            self.release, self.directory, package_dirs)
+        if egg_info is None:
+            return None
+        self.assertEqual(os.path.dirname(egg_info), parent)
+        return os.path.relpath(egg_info, self.directory)
+
+    def test_usual_locations(self):
+        """Find egg-info at the root, in src or in package_dir
+        """
+        self.create('zeam_form.egg-info')
+        self.assertEqual(self.find(), 'zeam_form.egg-info')
+        shutil.rmtree(os.path.join(self.directory, 'zeam_form.egg-info'))
+        self.create('src/Zeam_Form.egg-info')
+        self.assertEqual(self.find(), 'src/Zeam_Form.egg-info')
+        self.create('lib/python/zeam_form.egg-info')
+        self.assertEqual(
+            self.find({'': 'lib/python'}), 'lib/python/zeam_form.egg-info')
+
+    def test_search(self):
+        """Search egg-info in the tree, skipping unlikely directories
+        """
+        self.create('tests/zeam_form.egg-info', '.git/zeam_form.egg-info')
+        self.assertEqual(self.find(), None)
+        self.create('packages/zeam_form.egg-info')
+        self.assertEqual(self.find(), 'packages/zeam_form.egg-info')
+        self.assertEqual(find_egg_info(
+                Release(name='other'), self.directory, {}), (None, None))
+
+
+WORKER_SETUP_PY = """
+import os
+import sys
+if sys.argv[1:] == ['kill']:
+    os.kill(os.getppid(), 9)
+print os.getppid()
+"""
+
+
+class SetuptoolsWorkersTestCase(unittest.TestCase):
+    """Test running setuptools commands with workers.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+        stream = open(os.path.join(self.directory, 'setup.py'), 'w')
+        stream.write(WORKER_SETUP_PY)
+        stream.close()
+        self.workers = SetuptoolsWorkers(
+            PythonInterpreter.detect(sys.executable, readonly=True), None)
+
+    def tearDown(self):
+        self.workers.close()
+        shutil.rmtree(self.directory)
+
+    def test_reuse(self):
+        """Test workers are reused between commands
+        """
+        first, errors, code = self.workers.execute(
+            'first', path=self.directory)
+        self.assertEqual(code, 0)
+        second, errors, code = self.workers.execute(
+            'second', path=self.directory)
+        self.assertEqual(code, 0)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.workers._all), 1)
+
+    def test_fallback(self):
+        """Test commands that cannot run in a worker are not started
+        """
+        self.assertEqual(
+            self.workers.execute(
+                'test', path=self.directory, no_stdout=True),
+            None)
+        self.assertEqual(
+            self.workers.execute('test', path=self.directory, input='y'),
+            None)
+        self.assertEqual(len(self.workers._all), 0)
+
+    def test_died(self):
+        """Test commands are not run again if the worker died
+        """
+        self.assertRaises(
+            InstallationError,
+            self.workers.execute, 'kill', path=self.directory)
+        self.assertEqual(len(self.workers._all), 0)
+        output, errors, code = self.workers.execute(
+            'test', path=self.directory)
+        self.assertEqual(code, 0)
@@ -0,0 +1,77 @@
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from monteur.configuration import Configuration
+from monteur.recipe.template import Render, RecordingSection
+from monteur.recipe.template import RecordingConfiguration
+
+TEMPLATE_CFG = """
+[setup]
+prefix_directory = /opt
+
+[part]
+recipe = template
+name = test
+"""
+
+
+class RenderTestCase(unittest.TestCase):
+    """Test what is recorded to skip rendering a template.
+    """
+
+    def setUp(self):
+        self.config = Configuration.read_lines(
+            TEMPLATE_CFG.splitlines, 'template.cfg')
+        self.directory = tempfile.mkdtemp('monteur.tests')
+        self.output = os.path.join(self.directory, 'output')
+        self.render = Render('digest')
+        section = RecordingSection(self.config['part'], self.render.reads)
+        configuration = RecordingConfiguration(self.config, self.render)
+        stream = open(self.output, 'w')
+        try:
+            stream.write(section['name'].as_text())
+            stream.write(configuration['setup']['prefix_directory'].as_text())
+        finally:
+            stream.close()
+        stat = os.stat(self.output)
+        self.render.size = stat.st_size
+        self.render.mtime = int(stat.st_mtime)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_unchanged(self):
+        """Test a template that read only unchanged options
+        """
+        self.assertEqual(
+            sorted(self.render.reads.keys()),
+            [('part', 'name'), ('setup', 'prefix_directory')])
+        self.assertTrue(
+            self.render.is_unchanged('digest', self.output, self.config))
+        self.assertFalse(
+            self.render.is_unchanged('other', self.output, self.config))
+
+    def test_changed(self):
+        """Test a template that read a modified option
+        """
+        self.config['setup']['prefix_directory'] = '/usr'
+        self.assertFalse(
+            self.render.is_unchanged('digest', self.output, self.config))
+        self.config['setup']['prefix_directory'] = '/opt'
+        self.config['part']['recipe'] = 'file'
+        self.assertTrue(
+            self.render.is_unchanged('digest', self.output, self.config))
+        os.remove(self.output)
+        self.assertFalse(
+            self.render.is_unchanged('digest', self.output, self.config))
+
+    def test_dynamic(self):
+        """Test a template that used something that cannot be recorded
+        """
+        RecordingConfiguration(self.config, self.render).keys()
+        self.assertFalse(
+            self.render.is_unchanged('digest', self.output, self.config))
+
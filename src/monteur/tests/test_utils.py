@@ -1,8 +1,17 @@
 
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 from monteur.recipe.commands import Paths
-from monteur.utils import relative_uri
+from monteur.recipe.utils import DependencyTask
+from monteur.recipe.utils import topological_sort, connected_components
+from monteur.error import ConfigurationError
+from monteur.recipe.file import is_file_unchanged
+from monteur.utils import relative_uri, copy_file, StatCache
 
 
 class PathContainerTestCase(unittest.TestCase):
@@ -148,6 +157,215 @@ class PathContainerTestCase(unittest.TestCase):
              '/storage/data',
              '/storage/logs'])
 
+    def test_listdir(self):
+        """Test populating a path container from a directory
+        """
+        directory = tempfile.mkdtemp('monteur.test')
+        try:
+            os.makedirs(os.path.join(directory, 'src', 'package'))
+            open(os.path.join(directory, 'src', 'package', 'a.py'), 'w').close()
+            container = Paths(verify=False)
+            container.listdir(directory)
+            self.assertEqual(len(container), 3)
+            self.assertEqual(
+                list(container.iter_list(True)),
+                ['src'])
+            self.assertEqual(
+                list(container.iter_dict(prefixes={'src/package': 'lib'})),
+                [('lib', {'directory': True,
+                          'original': 'src/package',
+                          'full': os.path.join(directory, 'src/package')}),
+                 ('lib/a.py', {'directory': False,
+                               'original': 'src/package/a.py',
+                               'full': os.path.join(
+                                   directory, 'src/package/a.py')})])
+            self.assertEqual(
+                container['src/package/a.py']['full'],
+                os.path.join(directory, 'src/package/a.py'))
+        finally:
+            shutil.rmtree(directory)
+
+
+GRAPH = {'a': [], 'b': ['a'], 'c': ['a'], 'd': ['b', 'c'], 'e': []}
+
+
+class DependencyTaskTestCase(unittest.TestCase):
+    """Test processing items following their dependencies
+    """
+
+    def verify_order(self, order):
+        self.assertEqual(sorted(order), sorted(GRAPH.keys()))
+        for name, depends in GRAPH.items():
+            for depend in depends:
+                self.assertTrue(order.index(depend) < order.index(name))
+
+    def test_sequential(self):
+        """Test processing items one by one
+        """
+        task = DependencyTask('test')
+        self.verify_order(task(lambda n: n, sorted(GRAPH.keys()), GRAPH.get))
+
+    def test_parallel(self):
+        """Test processing independent items at the same time
+        """
+        lock = threading.Lock()
+        running = []
+        order = []
+
+        def process(name):
+            lock.acquire()
+            running.append(name)
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            order.append((name, len(running)))
+            running.remove(name)
+            lock.release()
+            return name
+
+        task = DependencyTask('test', 3)
+        self.verify_order(task(process, sorted(GRAPH.keys()), GRAPH.get))
+        self.assertTrue(max(map(lambda o: o[1], order)) > 1)
+
+    def test_circular(self):
+        """Test circular dependencies are detected
+        """
+        task = DependencyTask('test')
+        graph = {'a': ['b'], 'b': ['a'], 'c': []}
+        self.assertRaises(
+            ConfigurationError, task, lambda n: n, graph.keys(), graph.get)
+
+
+class DependencyGraphTestCase(unittest.TestCase):
+    """Test dependency graph helpers
+    """
+
+    def test_topological_sort(self):
+        """Test sorting names in order of dependencies
+        """
+        self.assertEqual(
+            topological_sort(sorted(GRAPH.keys()), GRAPH.get),
+            ['a', 'e', 'b', 'c', 'd'])
+        # Unknown dependencies are ignored
+        self.assertEqual(
+            topological_sort(['b', 'd'], GRAPH.get), ['b', 'd'])
+        # Deep graphs are not a problem
+        chain = range(10000)
+        self.assertEqual(
+            topological_sort(reversed(chain), lambda i: [i - 1]), chain)
+        self.assertRaises(
+            ConfigurationError,
+            topological_sort, ['a', 'b'], {'a': ['b'], 'b': ['a']}.get)
+
+    def test_connected_components(self):
+        """Test grouping names linked by dependencies
+        """
+        graph = dict(GRAPH, f=['g'], g=[])
+        self.assertEqual(
+            sorted(map(sorted, connected_components(
+                        sorted(graph.keys()), graph.get))),
+            [['a', 'b', 'c', 'd'], ['e'], ['f', 'g']])
+
+
+class StatCacheTestCase(unittest.TestCase):
+    """Test the filesystem status cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cache(self):
+        """Test status are cached until invalidated
+        """
+        cache = StatCache()
+        folder = os.path.join(self.directory, 'folder')
+        document = os.path.join(folder, 'document')
+        self.assertFalse(cache.exists(folder))
+        self.assertFalse(cache.isdir(document))
+        os.mkdir(folder)
+        open(document, 'w').close()
+        # Changes done behind the back of the cache are not seen
+        self.assertFalse(cache.exists(folder))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        # Invalidating a directory invalidates what it contains
+        cache.invalidate(folder)
+        self.assertTrue(cache.isdir(folder))
+        self.assertTrue(cache.isfile(document))
+        self.assertFalse(cache.isdir(document))
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        # And invalidating a file its parents
+        shutil.rmtree(folder)
+        cache.invalidate(document)
+        self.assertFalse(cache.exists(folder))
+        self.assertFalse(cache.exists(document))
+        cache.reset()
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    def test_invalidate(self):
+        """Test invalidating a path only forgets it, its parents and
+        what it contains
+        """
+        cache = StatCache()
+        folder = os.path.join(self.directory, 'folder')
+        document = os.path.join(folder, 'document')
+        other = os.path.join(self.directory, 'other')
+        for path in (document, other, folder):
+            cache.stat(path)
+        cache.invalidate(document)
+        self.assertEqual(
+            sorted(cache._stats.keys()), [other])
+        cache.stat(document)
+        cache.invalidate(folder)
+        self.assertEqual(
+            sorted(cache._stats.keys()), [other])
+
+    def test_size(self):
+        """Test the cache doesn't grow without limit
+        """
+        cache = StatCache(size=2)
+        for name in ('first', 'second', 'third'):
+            cache.stat(os.path.join(self.directory, name))
+        self.assertEqual(len(cache._stats), 1)
+
+
+class CopyFileTestCase(unittest.TestCase):
+    """Test copying files
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('monteur.test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_copy(self):
+        """Test copying a file, and detecting that it changed
+        """
+        source = os.path.join(self.directory, 'source.txt')
+        destination = os.path.join(self.directory, 'destination.txt')
+        stream = open(source, 'w')
+        stream.write('Source file\n')
+        stream.close()
+        os.utime(source, (1000000000, 1000000000))
+        self.assertFalse(is_file_unchanged(source, destination, 'size'))
+        copy_file(source, destination)
+        self.assertEqual(open(destination).read(), 'Source file\n')
+        for method in ('size', 'mtime', 'digest'):
+            self.assertTrue(is_file_unchanged(source, destination, method))
+
+        # Same size, but different content.
+        stream = open(source, 'w')
+        stream.write('Source File\n')
+        stream.close()
+        os.utime(source, (1000000000, 1000000000))
+        self.assertTrue(is_file_unchanged(source, destination, 'size'))
+        self.assertTrue(is_file_unchanged(source, destination, 'mtime'))
+        self.assertFalse(is_file_unchanged(source, destination, 'digest'))
+        os.utime(source, None)
+        self.assertFalse(is_file_unchanged(source, destination, 'mtime'))
 
 
 class RewriteLinkTestCase(unittest.TestCase):
@@ -0,0 +1,270 @@
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+from monteur.configuration import Configuration
+from monteur.distribution.metadata import MetadataCache
+from monteur.sources.vcs import VCSFetch, VCSPrefetchWorker, get_checkout_key
+from monteur.utils import get_cmd_output
+from monteur.vcs import VCSCheckout
+from monteur.vcs.git import GitFactory
+from monteur.vcs.mirror import mirrors
+
+
+def run_git(path, *arguments):
+    command = ['git', '-c', 'user.name=Test', '-c', 'user.email=test@test']
+    command.extend(arguments)
+    stdout, stderr, code = get_cmd_output(*command, path=path)
+    assert not code, stderr
+    return stdout.strip()
+
+
+def commit_file(repository, filename, content):
+    stream = open(os.path.join(repository, filename), 'w')
+    try:
+        stream.write(content)
+    finally:
+        stream.close()
+    run_git(repository, 'add', filename)
+    run_git(repository, 'commit', '--quiet', '-m', 'Add ' + filename)
+
+
+class FakeRepository(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, update=True):
+        self.lock.acquire()
+        try:
+            self.calls.append(update)
+        finally:
+            self.lock.release()
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class FetchTestCase(unittest.TestCase):
+    """Test prefetching checkouts.
+    """
+
+    def test_single(self):
+        """Test a checkout is fetched only once
+        """
+        repository = FakeRepository()
+        fetch = VCSFetch(repository, False)
+        workers = [VCSPrefetchWorker([fetch], count) for count in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(fetch(), repository)
+        self.assertEqual(fetch(), repository)
+        self.assertEqual(repository.calls, [False])
+
+    def test_error(self):
+        """Test errors are raised when the checkout is asked
+        """
+        repository = FakeRepository(error=ValueError('failed'))
+        fetch = VCSFetch(repository, True)
+        worker = VCSPrefetchWorker([fetch], 0)
+        worker.start()
+        worker.join()
+        self.assertRaises(ValueError, fetch)
+        self.assertRaises(ValueError, fetch)
+        self.assertEqual(repository.calls, [True])
+
+
+    def test_parent_gone(self):
+        """Test no more checkouts are fetched once the thread that
+        asked for them is gone
+        """
+        repository = FakeRepository()
+        pending = [VCSFetch(repository, True)]
+        workers = []
+        parent = threading.Thread(
+            target=lambda: workers.append(VCSPrefetchWorker(pending, 0)))
+        parent.start()
+        parent.join()
+        worker = workers[0]
+        self.assertFalse(worker.daemon)
+        worker.start()
+        worker.join()
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(repository.calls, [])
+
+
+class FakeInterpretor(object):
+
+    def get_version(self):
+        return '2.7'
+
+
+class GitTestCase(unittest.TestCase):
+    """Test git checkouts.
+    """
+
+    def setUp(self):
+        self.factory = GitFactory()
+        if not self.factory.available:
+            self.skipTest('git is not available')
+        self.directory = tempfile.mkdtemp('monteur.tests')
+        self.upstream = os.path.join(self.directory, 'upstream')
+        os.mkdir(self.upstream)
+        run_git(self.upstream, 'init', '--quiet')
+        run_git(self.upstream, 'checkout', '--quiet', '-b', 'master')
+        commit_file(self.upstream, 'README.txt', 'Readme\n')
+        self.config = Configuration.read_lines(
+            ('[vcs:develop]\npackage = git %s\n' % self.upstream).splitlines,
+            os.path.join(self.directory, 'test.cfg'))
+        self.mirrors = os.path.join(self.directory, 'mirrors')
+
+    def tearDown(self):
+        mirrors.open(None)
+        shutil.rmtree(self.directory)
+
+    def get_checkout(self, *extra):
+        option = self.config['vcs:develop']['package']
+        return VCSCheckout(
+            'package', option, option.as_words() + list(extra),
+            base=os.path.join(self.directory, 'src'))
+
+    def test_mirror(self):
+        """Test checkouts are created and updated from a mirror
+        """
+        mirrors.open(self.mirrors)
+        checkout = self.get_checkout()
+        self.factory(checkout)()
+        mirror = mirrors.get_path('git', self.upstream)
+        self.assertTrue(os.path.isfile(os.path.join(mirror, 'HEAD')))
+        self.assertTrue(os.path.isfile(
+                os.path.join(checkout.directory, 'README.txt')))
+        # Objects are borrowed from the mirror.
+        self.assertTrue(os.path.isfile(os.path.join(
+                    checkout.directory, '.git', 'objects', 'info',
+                    'alternates')))
+        self.assertEqual(
+            run_git(checkout.directory, 'config', 'remote.origin.url'),
+            self.upstream)
+
+        commit_file(self.upstream, 'CHANGES.txt', 'Changes\n')
+        # The mirror is updated only once per run.
+        self.factory(self.get_checkout())()
+        self.assertFalse(os.path.isfile(
+                os.path.join(checkout.directory, 'CHANGES.txt')))
+        mirrors.open(self.mirrors)
+        self.factory(self.get_checkout())()
+        self.assertTrue(os.path.isfile(
+                os.path.join(checkout.directory, 'CHANGES.txt')))
+
+    def test_no_mirror(self):
+        """Test checkouts without mirrors
+        """
+        mirrors.open(None)
+        checkout = self.get_checkout()
+        self.factory(checkout)()
+        self.assertTrue(os.path.isfile(
+                os.path.join(checkout.directory, 'README.txt')))
+        self.assertFalse(os.path.exists(self.mirrors))
+
+    def test_shallow(self):
+        """Test shallow checkouts of a branch
+        """
+        mirrors.open(self.mirrors)
+        commit_file(self.upstream, 'CHANGES.txt', 'Changes\n')
+        run_git(self.upstream, 'checkout', '--quiet', '-b', 'other')
+        commit_file(self.upstream, 'TODO.txt', 'Todo\n')
+        run_git(self.upstream, 'checkout', '--quiet', 'master')
+        checkout = self.get_checkout(
+            'branch=other', 'depth=1', 'single_branch=on')
+        self.assertEqual(checkout.depth, 1)
+        self.assertEqual(checkout.single_branch, True)
+        # Git refuses to make shallow clones of local paths.
+        checkout.uri = 'file://' + self.upstream
+        self.factory(checkout)()
+        self.assertTrue(os.path.isfile(
+                os.path.join(checkout.directory, 'TODO.txt')))
+        self.assertEqual(
+            run_git(checkout.directory, 'rev-parse', '--abbrev-ref', 'HEAD'),
+            'other')
+        self.assertEqual(
+            run_git(checkout.directory, 'rev-list', '--count', 'HEAD'), '1')
+        self.assertEqual(
+            run_git(checkout.directory, 'branch', '-r').split(),
+            ['origin/other'])
+        # Shallow checkouts are not mirrored.
+        self.assertFalse(os.path.exists(os.path.join(self.mirrors, 'git')))
+
+    def test_state(self):
+        """Test reading the state of a checkout
+        """
+        mirrors.open(None)
+        checkout = self.get_checkout()
+        repository = self.factory(checkout)()
+        state = repository.get_state()
+        self.assertEqual(state.branch, 'master')
+        self.assertEqual(state.uris, [self.upstream])
+        self.assertEqual(
+            state.revision, run_git(checkout.directory, 'rev-parse', 'HEAD'))
+        self.assertTrue(repository.status())
+        self.assertTrue(repository.verify())
+
+        stream = open(os.path.join(checkout.directory, 'README.txt'), 'a')
+        stream.write('Modified\n')
+        stream.close()
+        self.assertTrue(repository.get_state(refresh=True).dirty)
+        self.assertFalse(repository.status())
+        checkout.branch = 'other'
+        self.assertFalse(repository.verify())
+
+    def test_checkout_key(self):
+        """Test the key identifying the content of a checkout
+        """
+        mirrors.open(None)
+        checkout = self.get_checkout()
+        repository = self.factory(checkout)()
+        interpretor = FakeInterpretor()
+
+        def get_key():
+            repository.get_state(refresh=True)
+            return get_checkout_key(repository, interpretor)
+
+        key = get_key()
+        self.assertTrue(key.startswith('vcs:'))
+        self.assertEqual(get_key(), key)
+        # Building doesn't change the checkout.
+        os.makedirs(os.path.join(
+                checkout.directory, 'package.egg-info'))
+        for filename in ('package.egg-info/PKG-INFO', 'module.so'):
+            stream = open(os.path.join(checkout.directory, filename), 'w')
+            stream.write('Built\n')
+            stream.close()
+        self.assertEqual(get_key(), key)
+
+        # Files built by a previous run are remembered as well.
+        os.utime(os.path.join(checkout.directory, 'module.so'),
+                 (1000000000, 1000000000))
+
+        cache = MetadataCache()
+        self.assertFalse(cache.restore_build(key, checkout.directory))
+        cache.store_build(key, checkout.directory)
+        self.assertTrue(cache.restore_build(key, checkout.directory))
+        os.remove(os.path.join(checkout.directory, 'module.so'))
+        self.assertFalse(cache.restore_build(key, checkout.directory))
+
+        # Local modifications do.
+        stream = open(os.path.join(checkout.directory, 'README.txt'), 'a')
+        stream.write('Modified\n')
+        stream.close()
+        modified = get_key()
+        self.assertNotEqual(modified, key)
+        stream = open(os.path.join(checkout.directory, 'README.txt'), 'a')
+        stream.write('Modified again\n')
+        stream.close()
+        self.assertNotEqual(get_key(), modified)
@@ -2,14 +2,29 @@
 import logging
 import os
 import re
+import shutil
+import stat
 import subprocess
+import sys
+import threading
 import urllib2
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from monteur.error import FileError, NetworkError, ConfigurationError
 
 VERSION = re.compile(r'(version)? ([0-9\.]+)')
 logger = logging.getLogger('monteur')
 
+# ioctl sharing the data of a file with an another one on Linux.
+FICLONE = 0x40049409
+COPY_BUFFER_SIZE = 1024 * 1024
+# Maximum number of paths remembered by the filesystem status cache.
+STAT_CACHE_SIZE = 500000
+
 
 def have_cmd(*cmd):
     """Test if a command is available.
@@ -59,6 +74,8 @@ def get_cmd_output(*cmd, **opts):
         stdin=subprocess.PIPE, stdout=stdout, stderr=stderr,
         cwd=path, env=cmd_environ)
     stdout, stderr = process.communicate(input=opts.get('input', None))
+    # The command might have changed anything on the filesystem.
+    stat_cache.clear()
     return stdout, stderr, process.returncode
 
 def is_remote_uri(uri):
@@ -113,17 +130,153 @@ def compare_uri(uri1, uri2):
     """
     return uri1.rstrip('/') == uri2.rstrip('/')
 
+class StatCache(object):
+    """Remember the status of files on the filesystem for the time of
+    a run. Paths created or removed by monteur must be invalidated.
+    """
+
+    def __init__(self, size=STAT_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._size = size
+        self._stats = {}
+        # Cached paths indexed by their parent directory.
+        self._children = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stat(self, path):
+        """Return the status of path, or None if it doesn't exists.
+        """
+        path = os.path.abspath(path)
+        self._lock.acquire()
+        try:
+            if path in self._stats:
+                self.hits += 1
+                return self._stats[path]
+            self.misses += 1
+        finally:
+            self._lock.release()
+        try:
+            result = os.stat(path)
+        except OSError:
+            result = None
+        self._lock.acquire()
+        try:
+            if len(self._stats) >= self._size:
+                self._stats = {}
+                self._children = {}
+            self._stats[path] = result
+            self._children.setdefault(os.path.dirname(path), set()).add(path)
+        finally:
+            self._lock.release()
+        return result
+
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    def isdir(self, path):
+        result = self.stat(path)
+        return result is not None and stat.S_ISDIR(result.st_mode)
+
+    def isfile(self, path):
+        result = self.stat(path)
+        return result is not None and stat.S_ISREG(result.st_mode)
+
+    def invalidate(self, path):
+        """Forget about path, what it contains and its parents, after
+        it have been created or removed.
+        """
+        path = os.path.abspath(path)
+        self._lock.acquire()
+        try:
+            # What is contained in path, if it was a directory.
+            paths = [path]
+            while paths:
+                current = paths.pop()
+                self._stats.pop(current, None)
+                paths.extend(self._children.pop(current, ()))
+            parent = os.path.dirname(path)
+            if parent in self._children:
+                self._children[parent].discard(path)
+            # Its parents.
+            while parent != path:
+                self._stats.pop(parent, None)
+                path = parent
+                parent = os.path.dirname(path)
+        finally:
+            self._lock.release()
+
+    def clear(self, *ignore):
+        """Forget everything.
+        """
+        self._lock.acquire()
+        try:
+            self._stats = {}
+            self._children = {}
+        finally:
+            self._lock.release()
+
+    def reset(self, *ignore):
+        """Forget everything and reset the counters, for a new run.
+        """
+        self._lock.acquire()
+        try:
+            self._stats = {}
+            self._children = {}
+            self.hits = 0
+            self.misses = 0
+        finally:
+            self._lock.release()
+
+    def log_usage(self, *ignore):
+        logger.info(u"Filesystem status cache: %d hits, %d misses.",
+                    self.hits, self.misses)
+
+
+stat_cache = StatCache()
+
+
 def create_directory(directory, quiet=False):
     """Create a directory called directory if it doesn't exits
     already.
     """
     directory = os.path.expanduser(directory.strip())
-    if not os.path.isdir(directory):
+    if not stat_cache.isdir(directory):
         if not quiet:
             logger.info('Creating directory %s', directory)
         os.makedirs(directory)
+        stat_cache.invalidate(directory)
     return directory
 
+def clone_file(input, output):
+    """Make output share the data of input on the disk if the
+    filesystem supports it. Return True upon success.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        fcntl.ioctl(output.fileno(), FICLONE, input.fileno())
+    except (IOError, OSError):
+        return False
+    return True
+
+def copy_file(source, destination):
+    """Copy the file source to destination, with its permissions and
+    modification time.
+    """
+    input = open(source, 'rb')
+    try:
+        output = open(destination, 'wb')
+        try:
+            if not clone_file(input, output):
+                shutil.copyfileobj(input, output, COPY_BUFFER_SIZE)
+        finally:
+            output.close()
+    finally:
+        input.close()
+    shutil.copystat(source, destination)
+    stat_cache.invalidate(destination)
+
 # Configuration related helpers
 
 def get_package_name(section):
@@ -1,5 +1,5 @@
 
-from monteur.vcs.vcs import VCSRegistry, VCSCheckout
+from monteur.vcs.vcs import VCSRegistry, VCSCheckout, VCSState
 
 VCS = VCSRegistry()
-__all__ = ['VCS', 'VCSCheckout']
+__all__ = ['VCS', 'VCSCheckout', 'VCSState']
@@ -1,7 +1,7 @@
 
 import os
 
-from monteur.vcs.vcs import VCS, VCSFactory
+from monteur.vcs.vcs import VCS, VCSFactory, VCSState
 from monteur.vcs.error import VCSError
 
 
@@ -23,10 +23,15 @@ class FileSystem(VCS):
 
     update = fetch
 
-    def verify(self):
+    def read_state(self):
+        uris = []
         if os.path.islink(self.checkout.directory):
-            current = os.path.abspath(
-                os.readlink(self.checkout.directory))
+            uris.append(os.path.abspath(
+                    os.readlink(self.checkout.directory)))
+        return VCSState(uris=uris, dirty=False)
+
+    def match(self, state):
+        for current in state.uris:
             if self.checkout.uri != current:
                 return False
         return True
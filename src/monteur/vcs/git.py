@@ -3,12 +3,24 @@ import logging
 import re
 
 from monteur.utils import have_cmd, get_cmd_output
-from monteur.vcs.vcs import VCS, VCSFactory
+from monteur.vcs.vcs import VCS, VCSFactory, VCSState
 from monteur.vcs.error import GitError
+from monteur.vcs.mirror import mirrors
 
 logger = logging.getLogger('monteur')
 
 
+def get_version_info(version):
+    """Return the given version as a tuple of integers.
+    """
+    info = []
+    for part in (version or '0').split('.'):
+        if not part.isdigit():
+            break
+        info.append(int(part))
+    return tuple(info)
+
+
 class Git(VCS):
     prefix = "remotes/origin"
     re_prefix = re.escape(prefix)
@@ -30,47 +42,204 @@ class Git(VCS):
                 error,  self.checkout.uri, command=command, detail=stderr)
         return stdout.strip()
 
-    def fetch(self):
+    def _create_mirror(self, path):
         self._run_git(
-            ['clone', '--quiet', self.checkout.uri, self.checkout.directory],
-            error=u"Error while cloning")
-        if self.checkout.branch != 'master':
-            self.switch()
+            ['clone', '--quiet', '--mirror', self.checkout.uri, path],
+            error=u"Error while mirroring")
+        # Checkouts borrow objects from the mirror, never prune them.
+        self._run_git(['config', 'gc.pruneExpire', 'never'], path=path)
 
-    def update(self):
+    def _update_mirror(self, path):
         self._run_git(
-            ['pull', '--quiet'],
-            path=self.checkout.directory,
-            error=u"Error while pulling")
+            ['fetch', '--quiet'],
+            path=path,
+            error=u"Error while updating mirror")
+
+    def get_mirror(self):
+        """Return the path to an up to date mirror of the repository,
+        or None if mirrors are not used.
+        """
+        if self.checkout.depth or self.checkout.filter:
+            # A full mirror would defeat a shallow or partial clone.
+            return None
+        return mirrors.get(
+            'git', self.checkout.uri, self._create_mirror, self._update_mirror)
+
+    def fetch(self):
+        options = ['--quiet', '--branch', self.checkout.branch]
+        if self.checkout.single_branch:
+            options.append('--single-branch')
+        elif self.checkout.single_branch is not None:
+            options.append('--no-single-branch')
+        if self.checkout.sparse:
+            options.append('--sparse')
+        mirror = self.get_mirror()
+        if mirror is not None:
+            self._run_git(
+                ['clone'] + options +
+                ['--reference', mirror, mirror, self.checkout.directory],
+                error=u"Error while cloning")
+            self._run_git(
+                ['remote', 'set-url', 'origin', self.checkout.uri],
+                path=self.checkout.directory)
+        else:
+            if self.checkout.depth:
+                options.append('--depth=%d' % self.checkout.depth)
+            if self.checkout.filter:
+                options.append('--filter=%s' % self.checkout.filter)
+            self._run_git(
+                ['clone'] + options +
+                [self.checkout.uri, self.checkout.directory],
+                error=u"Error while cloning")
+        if self.checkout.sparse:
+            self._run_git(
+                ['sparse-checkout', 'set'] + self.checkout.sparse,
+                path=self.checkout.directory,
+                error=u"Error while setting sparse checkout")
+
+    def update(self):
+        mirror = self.get_mirror()
+        if mirror is not None:
+            self._run_git(
+                ['fetch', '--quiet', mirror,
+                 '+refs/heads/*:refs/%s/*' % self.prefix],
+                path=self.checkout.directory,
+                error=u"Error while pulling")
+            self._run_git(
+                ['merge', '--quiet', '@{upstream}'],
+                path=self.checkout.directory,
+                error=u"Error while pulling")
+        else:
+            # A shallow clone only fetches the new history.
+            self._run_git(
+                ['pull', '--quiet'],
+                path=self.checkout.directory,
+                error=u"Error while pulling")
 
-    def verify(self):
-        current_uris = self._run_git(
+    def _read_uris(self):
+        uris = []
+        for line in self._run_git(
             ['remote', '-v'],
-            path=self.checkout.directory)
-        for current_uri in current_uris.splitlines():
-            if self.checkout.uri in current_uri:
+            path=self.checkout.directory).splitlines():
+            parts = line.split()
+            if len(parts) > 1 and parts[1] not in uris:
+                uris.append(parts[1])
+        return uris
+
+    def read_state(self):
+        state = VCSState(uris=self._read_uris(), dirty=False, changes=[])
+        output = self._run_git(
+            ['status', '--porcelain=v2', '--branch', '-z',
+             '--untracked-files=all'],
+            path=self.checkout.directory,
+            error=u"Error while checking for changes")
+        entries = iter(output.split('\0'))
+        for entry in entries:
+            if entry.startswith('# branch.oid '):
+                revision = entry[13:].strip()
+                if revision != '(initial)':
+                    state.revision = revision
+            elif entry.startswith('# branch.head '):
+                branch = entry[14:].strip()
+                if branch != '(detached)':
+                    state.branch = branch
+            elif entry and entry[0] in '12u?!':
+                # Path comes after a fixed number of fields.
+                fields = {'1': 8, '2': 9, 'u': 10}.get(entry[0], 1)
+                state.changes.append(entry.split(' ', fields)[fields])
+                if entry[0] == '2':
+                    # Skip the original path of a rename.
+                    next(entries, None)
+                state.dirty = True
+        return state
+
+    def match(self, state):
+        for uri in state.uris:
+            if self.checkout.uri in uri:
                 break
         else:
             raise GitError(u"Cannot switch to a different repository")
-        current_branchs = self._run_git(
-            ['branch'],
-            path=self.checkout.directory)
-        for current_branch in current_branchs.splitlines():
-            if current_branch.startswith('*'):
-                branch_parts = current_branch.split()
-                if len(branch_parts) < 2:
-                    break
-                if branch_parts[-1] != self.checkout.branch:
-                    return False
-                return True
-        raise GitError(u"Cannot determine current branch")
-
-    def status(self):
-        changes = self._run_git(
-            ['status', '--porcelain'],
+        return state.branch == self.checkout.branch
+
+    def switch(self):
+        if self.checkout.single_branch or self.checkout.depth:
+            # Only one branch have been cloned, fetch the new one.
+            self._run_git(
+                ['remote', 'set-branches', '--add', 'origin',
+                 self.checkout.branch],
+                path=self.checkout.directory)
+            options = ['fetch', '--quiet']
+            if self.checkout.depth:
+                options.append('--depth=%d' % self.checkout.depth)
+            source = self.get_mirror() or 'origin'
+            self._run_git(
+                options + [source, '+refs/heads/%s:refs/%s/%s' % (
+                        self.checkout.branch, self.prefix,
+                        self.checkout.branch)],
+                path=self.checkout.directory,
+                error=u"Error while fetching branch")
+        # This creates the local branch from origin if needed.
+        self._run_git(
+            ['checkout', '--quiet', self.checkout.branch],
+            path=self.checkout.directory,
+            error=u"Error while switching branch")
+
+
+class GitPre211(Git):
+    """Git without the version 2 of the porcelain status.
+    """
+
+    def read_state(self):
+        state = VCSState(uris=self._read_uris())
+        output = self._run_git(
+            ['rev-parse', 'HEAD', '--abbrev-ref', 'HEAD'],
+            path=self.checkout.directory,
+            error=u"Error while reading the current revision")
+        revision, branch = (output.split() + [None, None])[:2]
+        state.revision = revision
+        if branch != 'HEAD':
+            state.branch = branch
+        return state
+
+    def read_dirty(self):
+        return bool(self.get_changes())
+
+    def read_changes(self):
+        output = self._run_git(
+            ['status', '--porcelain', '-z', '--untracked-files=all'],
             path=self.checkout.directory,
             error=u"Error while checking for changes")
-        return not len(changes)
+        changes = []
+        entries = iter(output.split('\0'))
+        for entry in entries:
+            if len(entry) > 3:
+                changes.append(entry[3:])
+                if 'R' in entry[:2] or 'C' in entry[:2]:
+                    # Skip the original path of a rename.
+                    next(entries, None)
+        return changes
+
+
+class GitPre17(GitPre211):
+    prefix = "origin"
+    re_prefix = re.escape(prefix)
+
+    def get_mirror(self):
+        # Cloning from a mirror relies on newer git commands.
+        return None
+
+    def fetch(self):
+        self._run_git(
+            ['clone', '--quiet', self.checkout.uri, self.checkout.directory],
+            error=u"Error while cloning")
+        if self.checkout.branch != 'master':
+            self.switch()
+
+    def read_dirty(self):
+        return False
+
+    def read_changes(self):
+        return None
 
     def switch(self):
         branches = self._run_git(
@@ -90,15 +259,6 @@ class Git(VCS):
                 path=self.checkout.directory)
 
 
-class GitPre17(Git):
-    prefix = "origin"
-    re_prefix = re.escape(prefix)
-
-
-    def status(self):
-        return True
-
-
 class GitFactory(VCSFactory):
     software_name = 'git-core'
 
@@ -108,9 +268,12 @@ class GitFactory(VCSFactory):
             logger.info('Found Git version %s' % self.version)
 
     def __call__(self, checkout):
-        if self.version < '1.7':
+        version = get_version_info(self.version)
+        if version < (1, 7):
             logger.error(
                 u"Using an *old* git version, "
                 u"we recommand you to upgrade your Git setup.")
             return GitPre17(checkout)
+        if version < (2, 11):
+            return GitPre211(checkout)
         return Git(checkout)
@@ -1,10 +1,12 @@
 
 
 import logging
+import os
 
 from monteur.utils import have_cmd, get_cmd_output, compare_uri
 from monteur.vcs.error import MercurialError
-from monteur.vcs.vcs import VCS, VCSFactory
+from monteur.vcs.vcs import VCS, VCSFactory, VCSState
+from monteur.vcs.mirror import mirrors
 
 logger = logging.getLogger('monteur')
 
@@ -39,43 +41,92 @@ class Mercurial(VCS):
                     error,  self.checkout.uri, command=command, detail=stderr)
         return stdout.strip()
 
-    def fetch(self):
+    def _create_mirror(self, path):
+        self._run_mercurial(
+            ['clone', '--noupdate', self.checkout.uri, path],
+            error=u"Error while mirroring")
+
+    def _update_mirror(self, path):
         self._run_mercurial(
-            ['clone', self.checkout.uri, self.checkout.directory],
-            error=u"Error while cloning")
-        if self.checkout.branch != 'default':
-            self.switch()
+            ['pull'],
+            path=path,
+            error=u"Error while updating mirror")
+
+    def get_mirror(self):
+        """Return the path to an up to date mirror of the repository,
+        or None if mirrors are not used.
+        """
+        return mirrors.get(
+            'hg', self.checkout.uri, self._create_mirror, self._update_mirror)
+
+    def fetch(self):
+        mirror = self.get_mirror()
+        if mirror is not None:
+            # A local clone hardlinks the mirror store.
+            self._run_mercurial(
+                ['clone', '--updaterev', self.checkout.branch,
+                 mirror, self.checkout.directory],
+                error=u"Error while cloning")
+            hgrc = open(
+                os.path.join(self.checkout.directory, '.hg', 'hgrc'), 'w')
+            try:
+                hgrc.write('[paths]\ndefault = %s\n' % self.checkout.uri)
+            finally:
+                hgrc.close()
+        else:
+            self._run_mercurial(
+                ['clone', '--updaterev', self.checkout.branch,
+                 self.checkout.uri, self.checkout.directory],
+                error=u"Error while cloning")
 
     def update(self):
+        arguments = ['pull', '-u']
+        mirror = self.get_mirror()
+        if mirror is not None:
+            arguments.append(mirror)
         self._run_mercurial(
-            ['pull', '-u'],
+            arguments,
             path=self.checkout.directory,
             error=u"Error while pulling")
 
-    def verify(self):
+    def read_state(self):
         current_uri = self._run_mercurial(
             ['showconfig', 'paths.default'],
             path=self.checkout.directory,
             error=u"Error while reading the current repository path")
         if '#' in current_uri:
             current_uri = current_uri.split('#', 1)[0]
-        if not compare_uri(current_uri, self.checkout.uri):
-            raise MercurialError(
-                u"Cannot switch to a different repository.")
-        current_branch = self._run_mercurial(
-            ['branch'],
+        # Identify reports the revision, with a + if it is modified.
+        output = self._run_mercurial(
+            ['identify', '--id', '--branch'],
             path=self.checkout.directory,
             error=u"Error while reading the current branch")
-        if self.checkout.branch != current_branch:
-            return False
-        return True
-
-    def status(self):
+        revision, branch = (output.split(None, 1) + [None, None])[:2]
+        state = VCSState(uris=[current_uri], branch=branch)
+        if revision is not None:
+            state.revision = revision.rstrip('+')
+            state.dirty = revision.endswith('+') or None
+        return state
+
+    def read_dirty(self):
+        # Identify does not report unknown files.
+        return bool(self.get_changes())
+
+    def read_changes(self):
         changes = self._run_mercurial(
             ['status'],
             path=self.checkout.directory,
             error=u"Error while checking for changes")
-        return not len(changes)
+        return [line[2:] for line in changes.splitlines() if len(line) > 2]
+
+    def match(self, state):
+        for current_uri in state.uris:
+            if compare_uri(current_uri, self.checkout.uri):
+                break
+        else:
+            raise MercurialError(
+                u"Cannot switch to a different repository.")
+        return self.checkout.branch == state.branch
 
     def switch(self):
         self._run_mercurial(
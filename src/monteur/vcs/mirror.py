@@ -0,0 +1,102 @@
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from monteur.utils import create_directory, stat_cache
+
+logger = logging.getLogger('monteur')
+
+MIRROR_DIRECTORY = 'mirrors'
+
+
+class MirrorCache(object):
+    """Keep a local mirror of the VCS repositories, shared between
+    environments. Checkouts are created from the mirror, and only
+    the mirror fetches from the remote repository, once per run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directory = None
+        self._locks = {}
+        self._refreshed = set()
+
+    def open(self, directory):
+        """Store mirrors in the given directory. None disables them.
+        """
+        self._lock.acquire()
+        try:
+            if directory is not None:
+                directory = create_directory(directory)
+            self._directory = directory
+            self._refreshed = set()
+        finally:
+            self._lock.release()
+
+    def get_path(self, vcs, uri):
+        """Return the path of the mirror of uri for the given VCS, or
+        None if mirrors are disabled.
+        """
+        if self._directory is None:
+            return None
+        return os.path.join(
+            self._directory, vcs, hashlib.md5(uri).hexdigest())
+
+    def _get_lock(self, path):
+        self._lock.acquire()
+        try:
+            if path not in self._locks:
+                self._locks[path] = threading.Lock()
+            return self._locks[path]
+        finally:
+            self._lock.release()
+
+    def get(self, vcs, uri, create, update):
+        """Return the path of the mirror of uri for the given VCS,
+        calling create or update on it the first time it is asked
+        during this run. Return None if mirrors are disabled.
+        """
+        path = self.get_path(vcs, uri)
+        if path is None:
+            return None
+        lock = self._get_lock(path)
+        lock.acquire()
+        try:
+            if path in self._refreshed:
+                return path
+            create_directory(os.path.dirname(path))
+            # Other environments might use the same mirror.
+            lock_file = open(path + '.lock', 'w')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                if os.path.isdir(path):
+                    logger.info(u"Updating mirror of %s.", uri)
+                    update(path)
+                else:
+                    logger.info(u"Creating mirror of %s.", uri)
+                    try:
+                        create(path)
+                    except:
+                        if os.path.isdir(path):
+                            shutil.rmtree(path)
+                        raise
+                    finally:
+                        stat_cache.invalidate(path)
+            finally:
+                lock_file.close()
+            self._refreshed.add(path)
+            return path
+        finally:
+            lock.release()
+
+
+mirrors = MirrorCache()
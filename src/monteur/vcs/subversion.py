@@ -5,7 +5,7 @@ try:
 except ImportError:
     import elementtree.ElementTree as etree
 
-from monteur.vcs.vcs import VCS, VCSFactory
+from monteur.vcs.vcs import VCS, VCSFactory, VCSState
 from monteur.utils import have_cmd, get_cmd_output, compare_uri
 from monteur.vcs.error import SubversionError
 
@@ -16,38 +16,40 @@ AUTHORIZATION_FAILED = 'authorization failed'
 
 
 def read_info(xml):
-    # Read the output of svn info in XML.
+    # Read the output of svn info in XML. Return the URL, repository
+    # root and revision of the checkout.
     try:
         dom = etree.fromstring(xml)
     except:
-        return None, None
+        return None, None, None
     entry = dom.find('entry')
     if entry is None:
-        return None, None
+        return None, None, None
     url = entry.find('url')
     if url is None:
-        return None, None
+        return None, None, None
     repository = entry.find('repository')
     if repository is None:
-        return None, None
+        return None, None, None
     root = repository.find('root')
     if root is None:
-        return None, None
-    return url.text.strip(), root.text.strip()
+        return None, None, None
+    return url.text.strip(), root.text.strip(), entry.get('revision')
 
 def read_status(xml):
-    # Read the output of svn status in XML. Return False if the output
-    # is dirty.
+    # Read the output of svn status in XML. Return the modified
+    # paths, or None if the output cannot be read.
     try:
         dom = etree.fromstring(xml)
     except:
-        return False
+        return None
+    changes = []
     for target in dom.findall('target'):
         for entry in target.findall('entry'):
             status = entry.find('wc-status')
             if status is not None and status.get('item') != 'external':
-                return False
-    return True
+                changes.append(entry.get('path'))
+    return changes
 
 
 class Subversion(VCS):
@@ -86,31 +88,40 @@ class Subversion(VCS):
             path=self.checkout.directory,
             error=u"Error while updating")
 
-    def verify(self):
+    def read_state(self):
         xml = self._run_svn(
             ['info', '--xml'],
             path=self.checkout.directory,
             error="Checkout directory is not a valid checkout")
-        current_uri, current_root = read_info(xml)
+        current_uri, current_root, revision = read_info(xml)
         if current_uri is None:
             raise SubversionError(
                 u"Could not read the output",
                 self.checkout.directory)
-        if not compare_uri(current_uri, self.checkout.uri):
-            if not self.checkout.uri.startswith(current_root):
-                raise SubversionError(
-                    u"Cannot switch to a different repository",
-                    current_root, self.checkout.uri)
-            return False
-        return True
+        return VCSState(
+            uris=[current_uri], root=current_root, revision=revision)
+
+    def read_dirty(self):
+        # Unreadable status is considered as modified.
+        return self.get_changes() != []
 
-    def status(self):
+    def read_changes(self):
         xml = self._run_svn(
             ['status', '--xml'],
             path=self.checkout.directory,
             error="Checkout directory is not a valid checkout")
         return read_status(xml)
 
+    def match(self, state):
+        current_uri = state.uris[0]
+        if not compare_uri(current_uri, self.checkout.uri):
+            if not self.checkout.uri.startswith(state.root):
+                raise SubversionError(
+                    u"Cannot switch to a different repository",
+                    state.root, self.checkout.uri)
+            return False
+        return True
+
     def switch(self):
         self._run_svn(
             ['switch', self.checkout.uri],
@@ -22,6 +22,11 @@ class VCSCheckout(object):
         self.uri = options[1]
         self.branch = None
         self.directory = None
+        # Shallow and partial checkouts.
+        self.depth = None
+        self.single_branch = None
+        self.sparse = None
+        self.filter = None
         if base:
             assert directory is None, u"Cannot specify base and directory"
             self.directory = os.path.join(base, name)
@@ -34,15 +39,54 @@ class VCSCheckout(object):
                     defined_at,
                     u"Malformed source option for checkout",
                     name)
-            name, value = extra.split('=', 1)
-            if name in self.__dict__:
-                self.__dict__[name] = value
+            key, value = extra.split('=', 1)
+            if key in self.__dict__:
+                self.__dict__[key] = value
+
+        if self.depth is not None:
+            try:
+                self.depth = int(self.depth)
+            except ValueError:
+                self.depth = 0
+            if self.depth < 1:
+                raise ConfigurationError(
+                    defined_at,
+                    u"Invalid depth for checkout",
+                    name)
+        if self.single_branch is not None:
+            self.single_branch = self.single_branch.lower() in (
+                'on', 'true', '1')
+        if self.sparse is not None:
+            self.sparse = filter(
+                None, map(lambda s: s.strip(), self.sparse.split(',')))
 
         # Those are not overridable options
         self.defined_at = defined_at
         self.defined_directory = origin.get_cfg_directory()
 
 
+class VCSState(object):
+    """Represent the state of a checkout on the filesystem, as
+    reported by the VCS.
+    """
+
+    def __init__(self, uris=(), branch=None, revision=None, dirty=None,
+                 root=None, changes=None):
+        self.uris = list(uris)
+        self.branch = branch
+        self.revision = revision
+        # Repository root, for VCS where the branch is part of the URI.
+        self.root = root
+        # None if it is not known yet if the checkout is modified.
+        self.dirty = dirty
+        # Locally modified paths, None if they are not known yet.
+        self.changes = changes
+
+    def __repr__(self):
+        return '<%s %s@%s>' % (
+            self.__class__.__name__, self.branch, self.revision)
+
+
 class VCS(object):
     """Base API to access a project in a VCS.
     """
@@ -53,6 +97,7 @@ class VCS(object):
         self.checkout = checkout
         self.options = options
         self.install = None     # Method called to do the work
+        self.state = None
 
     @property
     def name(self):
@@ -74,7 +119,7 @@ class VCS(object):
                 if checkout:
                     self.install = self.fetch
             else:
-                if self.verify():
+                if self.match(self.get_state()):
                     if update:
                         self.install = self.update
                 else:
@@ -89,17 +134,61 @@ class VCS(object):
     def __call__(self, checkout=True, update=True):
         if self.inspect(checkout=checkout, update=update):
             self.install()
+            self.state = None
         return self
 
+    def get_state(self, refresh=False):
+        """Return the state of the checkout on the filesystem.
+        """
+        if self.state is None or refresh:
+            self.state = self.read_state()
+        return self.state
+
     def status(self):
         """Return True if the checkout is clean and have been modified.
         """
-        return True
+        state = self.get_state()
+        if state.dirty is None:
+            state.dirty = self.read_dirty()
+        return not state.dirty
 
     def verify(self):
         """Return True if the checkout match the given checkout uri,
         False if it needs to be switched.
         """
+        return self.match(self.get_state())
+
+    def get_changes(self):
+        """Return the paths, relative to the checkout, that are
+        locally modified, or None if the VCS cannot tell them.
+        """
+        state = self.get_state()
+        if state.changes is None:
+            state.changes = self.read_changes()
+        return state.changes
+
+    def read_state(self):
+        """Read the state of the checkout from the VCS, in as few
+        commands as possible.
+        """
+        return VCSState(uris=[self.checkout.uri], dirty=False)
+
+    def read_dirty(self):
+        """Return True if the checkout is locally modified, if
+        read_state could not tell it.
+        """
+        return False
+
+    def read_changes(self):
+        """Return the locally modified paths, if read_state could not
+        tell them.
+        """
+        return None
+
+    def match(self, state):
+        """Return True if the state match the checkout, False if it
+        needs to be switched.
+        """
         return True
 
     def fetch(self):